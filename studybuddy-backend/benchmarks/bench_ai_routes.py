@@ -0,0 +1,109 @@
+"""Benchmark AI tutor route throughput against the fake LLM backend.
+
+Runs fully offline. Usage:
+    python benchmarks/bench_ai_routes.py [--threads 8] [--requests 200] [--latency 0.05]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('LLM_BACKEND', 'fake')
+# Measure raw route throughput, not the per-user quotas
+os.environ.setdefault('AI_QUOTA_BURST', '1000000')
+os.environ.setdefault('AI_MAX_CONCURRENT', '1000')
+
+from common import make_app
+from src.routes.auth import auth_bp
+from src.routes import ai_tutor
+from src.services.llm import FakeLLMBackend
+
+
+def register(client, name):
+    response = client.post('/api/auth/register', json={
+        'username': name, 'email': f'{name}@example.com', 'password': 'Benchmark1!',
+        'first_name': 'Bench', 'last_name': 'User'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+def run_clients(app, threads, requests_per_thread, make_request):
+    """Fire requests from several threads; return per-request latencies and failures"""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    # Register up front so signup writes do not skew the measurement
+    setup_client = app.test_client()
+    thread_headers = [register(setup_client, f'bench{i}_{time.monotonic_ns()}') for i in range(threads)]
+
+    def worker(index):
+        client = app.test_client()
+        headers = thread_headers[index]
+        for _ in range(requests_per_thread):
+            start = time.perf_counter()
+            status = make_request(client, headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    failures.append(status)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, failures, time.perf_counter() - start
+
+
+def report(label, latencies, failures, wall):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<28} {len(latencies) / wall:8.1f} req/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms   "
+          f"errors {len(failures)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='total requests per scenario')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated LLM latency (s)')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    backend = FakeLLMBackend(latency=args.latency, failure_rate=args.failure_rate, seed=1)
+    ai_tutor.llm_backend = backend
+    per_thread = max(1, args.requests // args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       blueprints=[(auth_bp, '/api/auth'), (ai_tutor.ai_bp, '/api/ai')])
+
+        def send_message(client, headers):
+            if not hasattr(threading.current_thread(), 'conversation_id'):
+                created = client.post('/api/ai/conversations', json={'type': 'qa'}, headers=headers)
+                threading.current_thread().conversation_id = created.get_json()['conversation']['id']
+            conversation_id = threading.current_thread().conversation_id
+            return client.post(f'/api/ai/conversations/{conversation_id}/messages',
+                               json={'content': 'Explain photosynthesis'}, headers=headers).status_code
+
+        def generate_summary(client, headers):
+            return client.post('/api/ai/generate-summary',
+                               json={'text': 'Shared lecture notes ' * 50}, headers=headers).status_code
+
+        print(f"fake LLM latency {args.latency * 1000:.0f} ms, {args.threads} threads")
+        for label, scenario in [('send_message', send_message),
+                                ('generate_summary (shared)', generate_summary)]:
+            calls_before = backend.calls
+            latencies, failures, wall = run_clients(app, args.threads, per_thread, scenario)
+            report(label, latencies, failures, wall)
+            print(f"{'  upstream LLM calls':<28} {backend.calls - calls_before}")
+
+
+if __name__ == '__main__':
+    main()
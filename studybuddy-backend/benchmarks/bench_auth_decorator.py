@@ -0,0 +1,95 @@
+"""Benchmark the per-request overhead of token_required.
+
+Compares the cached path (token claims and user served from memory) with the
+previous one (jwt.decode and a primary-key query on every request), and counts
+the SQL statements each issues.
+
+Usage: python benchmarks/bench_auth_decorator.py [--requests N] [--users N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import jwt
+from flask import jsonify
+from sqlalchemy import event, insert
+
+from common import make_app
+from src.extensions import db
+from src.models.user import User
+from src.routes.auth import token_required
+from src.services.user_cache import user_cache, token_cache
+
+
+def uncached_lookup(app, token):
+    """Baseline: what token_required did before the caches"""
+    data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    return db.session.get(User, data['user_id'])
+
+
+def run(app, label, tokens, handler, requests):
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            start = time.perf_counter()
+            for index in range(requests):
+                token = tokens[index % len(tokens)]
+                with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+                    handler(token)
+                    db.session.remove()
+            elapsed = time.perf_counter() - start
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    print(f"{label:<40} {elapsed / requests * 1e6:8.1f} us/request  {len(statements) / requests:5.2f} SQL/request")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        with app.app_context():
+            db.session.execute(insert(User), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+                 'first_name': 'Bench', 'last_name': 'User'}
+                for i in range(args.users)
+            ])
+            db.session.commit()
+            tokens = [user.generate_token() for user in User.query.all()]
+
+        @token_required
+        def endpoint(current_user):
+            return jsonify({'id': current_user.id})
+
+        run(app, 'request context only (floor)', tokens, lambda token: None, args.requests)
+        run(app, 'jwt.decode + query (previous)', tokens, lambda token: uncached_lookup(app, token), args.requests)
+
+        user_cache.clear()
+        token_cache.clear()
+        run(app, 'token_required, cold caches', tokens, lambda token: endpoint(), len(tokens))
+        run(app, 'token_required, warm caches', tokens, lambda token: endpoint(), args.requests)
+
+        # A write through the request session invalidates the cached copy
+        with app.app_context():
+            with app.test_request_context(headers={'Authorization': f'Bearer {tokens[0]}'}):
+                user = token_required(lambda current_user: current_user)()
+                user.streak_count = 7
+                db.session.commit()
+                db.session.remove()
+            with app.test_request_context(headers={'Authorization': f'Bearer {tokens[0]}'}):
+                assert token_required(lambda current_user: current_user.streak_count)() == 7
+                db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark batch flashcard rescheduling.
+
+Usage: python benchmarks/bench_flashcard_reschedule.py [--cards N] [--skip-db]
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from common import make_app, timed
+from sqlalchemy import insert, select
+from src.extensions import db
+from src.models.user import User
+from src.models.ai_tutor import Flashcard
+from src.services.flashcard_scheduler import (
+    compute_next_reviews, next_review_date, reschedule_flashcards, review_interval_days
+)
+
+
+def per_card_loop(correct_counts, last_correct, last_reviewed):
+    """Baseline: schedule each card in pure Python"""
+    return [
+        next_review_date(count, correct, reviewed)
+        for count, correct, reviewed in zip(correct_counts, last_correct, last_reviewed)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=1_000_000)
+    parser.add_argument('--skip-db', action='store_true')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    now = np.datetime64(datetime.utcnow(), 'us')
+    correct_counts = rng.integers(0, 25, size=args.cards)
+    last_correct = rng.random(args.cards) < 0.8
+    last_reviewed = now - rng.integers(0, 90 * 86400, size=args.cards).astype('timedelta64[s]')
+
+    print(f"Scheduling {args.cards:,} cards")
+    timed('vectorized compute_next_reviews', compute_next_reviews, correct_counts, last_correct, last_reviewed)
+
+    sample = min(args.cards, 100_000)
+    _, loop_elapsed = timed(
+        f'per-card python loop ({sample:,} cards)',
+        per_card_loop, correct_counts[:sample].tolist(), last_correct[:sample].tolist(),
+        last_reviewed[:sample].tolist()
+    )
+    print(f"{'  extrapolated to all cards':<48} {loop_elapsed * args.cards / sample * 1000:10.1f} ms")
+
+    if args.skip_db:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        with app.app_context():
+            user = User(username='bench', email='bench@example.com', password_hash='x',
+                        first_name='Bench', last_name='User')
+            db.session.add(user)
+            db.session.commit()
+
+            reviewed_at = last_reviewed.tolist()
+            counts = correct_counts.tolist()
+            outcomes = last_correct.tolist()
+            for start in range(0, args.cards, 50_000):
+                db.session.execute(insert(Flashcard), [
+                    {'user_id': user.id, 'question': 'q', 'answer': 'a',
+                     'times_reviewed': counts[i] + 1, 'correct_count': counts[i],
+                     'last_correct': outcomes[i], 'last_reviewed': reviewed_at[i]}
+                    for i in range(start, min(start + 50_000, args.cards))
+                ])
+            db.session.commit()
+
+            rescheduled, _ = timed('reschedule_flashcards (SQLite, end to end)',
+                                   reschedule_flashcards, user_id=user.id)
+            assert rescheduled == args.cards
+
+            for card in db.session.execute(select(Flashcard).limit(100)).scalars():
+                expected = card.last_reviewed + timedelta(
+                    days=review_interval_days(card.correct_count, card.last_correct))
+                assert card.next_review == expected
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark login throughput under concurrency, and what a login burst does to other requests.
+
+Runs the same burst of logins with hashing inline on the request threads and
+on the bounded hashing pool, while another thread keeps calling a cheap
+authenticated endpoint and records its latency.
+
+Usage: python benchmarks/bench_login.py [--threads N] [--logins N] [--workers N] [--queue N]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from flask import Blueprint, jsonify
+from sqlalchemy import insert
+
+from common import make_app
+from src.extensions import db
+from src.models import user as user_module
+from src.models.user import User
+from src.routes.auth import auth_bp, token_required
+from src.services.password_hashing import PasswordHasher, PASSWORD_HASH_METHOD
+
+PASSWORD = 'Bench-Passw0rd!'
+
+ping_bp = Blueprint('ping', __name__)
+
+
+@ping_bp.route('/ping')
+@token_required
+def ping(current_user):
+    return jsonify({'id': current_user.id})
+
+
+def burst(app, users, threads, logins, ping_token):
+    statuses = []
+    latencies = []
+    done = threading.Event()
+
+    def log_in(offset):
+        client = app.test_client()
+        for index in range(logins):
+            email = f'user{(offset * logins + index) % users}@example.com'
+            response = client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+            statuses.append(response.status_code)
+
+    def keep_pinging():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {ping_token}'}
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/ping', headers=headers)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    pinger = threading.Thread(target=keep_pinging)
+    pinger.start()
+    workers = [threading.Thread(target=log_in, args=(offset,)) for offset in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    pinger.join()
+    return statuses, elapsed, latencies
+
+
+def report(label, statuses, elapsed, latencies):
+    ok = statuses.count(200)
+    busy = statuses.count(503)
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    print(f"{label:<28} {ok / elapsed:7.1f} logins/s  {busy:4d} x 503  "
+          f"ping p50 {statistics.median(latencies) * 1000 if latencies else 0:7.1f} ms  p95 {p95 * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=4, help='logins per thread')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--queue', type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       blueprints=((auth_bp, '/api/auth'), (ping_bp, '')))
+        with app.app_context():
+            # One hash shared by every account keeps the setup fast
+            password_hash = PasswordHasher(workers=0).hash(PASSWORD)
+            db.session.execute(insert(User), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+                 'first_name': 'Bench', 'last_name': 'User'}
+                for i in range(args.users)
+            ])
+            db.session.commit()
+            ping_token = db.session.get(User, 1).generate_token()
+
+        print(f"{args.threads} threads x {args.logins} logins, method {PASSWORD_HASH_METHOD}, "
+              f"{os.cpu_count()} CPUs")
+        configurations = [
+            ('inline (previous)', PasswordHasher(workers=0)),
+            (f'pool {args.workers} workers, queue {args.queue}',
+             PasswordHasher(workers=args.workers, max_queue=args.queue)),
+            (f'pool {args.workers} workers, queue 2', PasswordHasher(workers=args.workers, max_queue=2)),
+        ]
+        for label, hasher in configurations:
+            user_module.password_hasher = hasher
+            report(label, *burst(app, args.users, args.threads, args.logins, ping_token))
+
+
+if __name__ == '__main__':
+    main()
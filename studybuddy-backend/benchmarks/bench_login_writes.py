@@ -0,0 +1,89 @@
+"""Count the write statements and commits a login costs.
+
+Compares the previous bookkeeping (reset_failed_login() and update_streak(),
+each committing) with User.record_login(), for a first login of the day
+after a failed attempt and for a repeat login the same day.
+
+Usage: python benchmarks/bench_login_writes.py [--logins N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+
+from common import make_app
+from src.extensions import db
+from src.models.user import User
+
+
+def previous_bookkeeping(user):
+    user.reset_failed_login()
+    user.update_streak()
+
+
+def record_login(user):
+    user.record_login()
+    db.session.commit()
+
+
+def measure(app, label, bookkeeping, logins, first_of_day):
+    counts = {'writes': 0, 'commits': 0}
+    counting = [False]
+
+    def on_execute(conn, cursor, statement, *args):
+        if counting[0] and statement.lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            counts['writes'] += 1
+
+    def on_commit(conn):
+        if counting[0]:
+            counts['commits'] += 1
+
+    elapsed = 0
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        event.listen(db.engine, 'commit', on_commit)
+        try:
+            for _ in range(logins):
+                if first_of_day:
+                    # Not measured: yesterday's activity and a failed attempt
+                    with db.engine.begin() as connection:
+                        connection.execute(update(User).where(User.id == 1).values(
+                            last_activity=datetime.utcnow() - timedelta(days=1), failed_login_attempts=1))
+                user = db.session.get(User, 1)
+                counting[0] = True
+                start = time.perf_counter()
+                bookkeeping(user)
+                elapsed += time.perf_counter() - start
+                counting[0] = False
+                db.session.remove()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+            event.remove(db.engine, 'commit', on_commit)
+
+    print(f"{label:<44} {counts['writes'] / logins:5.2f} writes/login  {counts['commits'] / logins:5.2f} "
+          f"commits/login  {elapsed / logins * 1000:7.2f} ms/login")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        with app.app_context():
+            db.session.add(User(username='bench', email='bench@example.com', password_hash='x',
+                                first_name='Bench', last_name='User', streak_count=3))
+            db.session.commit()
+
+        for first_of_day in (True, False):
+            scenario = 'first login of the day' if first_of_day else 'repeat login'
+            measure(app, f'previous, {scenario}', previous_bookkeeping, args.logins, first_of_day)
+            measure(app, f'record_login, {scenario}', record_login, args.logins, first_of_day)
+
+
+if __name__ == '__main__':
+    main()
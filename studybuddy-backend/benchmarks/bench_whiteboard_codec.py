@@ -0,0 +1,95 @@
+"""Benchmark whiteboard payload size and encode/decode time, JSON vs MessagePack.
+
+Boards are generated like freehand drawings: strokes of a few dozen to a few
+hundred points that wander from a random start, plus shapes and text.
+Expect MessagePack to be about 10x smaller for integer coordinates and 3x
+for floats, and faster to decode. Encoding integer coordinates costs about
+the same as json.dumps and can be slower on boards of a few thousand
+strokes, since packing walks the document in Python.
+
+Usage: python benchmarks/bench_whiteboard_codec.py [--strokes N ...] [--float-points]
+"""
+import argparse
+import json
+import random
+import time
+
+from common import timed  # noqa: F401 - puts src on the path
+from src.services import whiteboard_codec
+from src.services.whiteboard import WhiteboardState
+
+
+def make_board(strokes, float_points=False, seed=42):
+    rng = random.Random(seed)
+    elements = []
+    for index in range(strokes):
+        x, y = rng.randint(0, 4000), rng.randint(0, 3000)
+        points = []
+        for _ in range(rng.randint(30, 300)):
+            x += rng.randint(-6, 6)
+            y += rng.randint(-6, 6)
+            points.append([round(x + rng.random(), 2), round(y + rng.random(), 2)] if float_points else [x, y])
+        elements.append({
+            'id': f'stroke-{index}', 'type': 'freedraw', 'x': points[0][0], 'y': points[0][1],
+            'strokeColor': rng.choice(['#1e1e1e', '#e03131', '#2f9e44', '#1971c2']),
+            'strokeWidth': rng.choice([1, 2, 4]), 'opacity': 100, 'points': points
+        })
+        if index % 10 == 0:
+            elements.append({
+                'id': f'shape-{index}', 'type': rng.choice(['rectangle', 'ellipse', 'arrow']),
+                'x': rng.randint(0, 4000), 'y': rng.randint(0, 3000),
+                'width': rng.randint(20, 600), 'height': rng.randint(20, 400), 'strokeColor': '#1e1e1e'
+            })
+        if index % 25 == 0:
+            elements.append({
+                'id': f'text-{index}', 'type': 'text', 'x': rng.randint(0, 4000), 'y': rng.randint(0, 3000),
+                'text': 'Derivative of x^2 is 2x', 'fontSize': 20
+            })
+    return {'background': '#ffffff', 'elements': elements}
+
+
+def best_of(repeat, fn, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def report(label, value, repeat):
+    encoded_json, json_encode = best_of(repeat, json.dumps, value)
+    decoded_json, json_decode = best_of(repeat, json.loads, encoded_json)
+    encoded, binary_encode = best_of(repeat, whiteboard_codec.encode, value)
+    decoded, binary_decode = best_of(repeat, whiteboard_codec.decode, encoded)
+    assert decoded == decoded_json
+
+    json_size = len(encoded_json.encode('utf-8'))
+    print(f"{label}")
+    print(f"  {'json':<10} {json_size / 1024:10.1f} KiB  encode {json_encode * 1000:8.1f} ms"
+          f"  decode {json_decode * 1000:8.1f} ms")
+    print(f"  {'msgpack':<10} {len(encoded) / 1024:10.1f} KiB  encode {binary_encode * 1000:8.1f} ms"
+          f"  decode {binary_decode * 1000:8.1f} ms  ({json_size / len(encoded):.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--strokes', type=int, nargs='+', default=[200, 2000, 10000])
+    parser.add_argument('--float-points', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if not whiteboard_codec.available():
+        raise SystemExit('msgpack is not installed')
+    compression = 'zstd' if whiteboard_codec.zstandard is not None else 'zlib'
+    print(f"Compression: {compression}; {'float' if args.float_points else 'integer'} coordinates")
+
+    for strokes in args.strokes:
+        board = make_board(strokes, args.float_points)
+        report(f"{strokes:,} strokes, document (REST/WebSocket payload)", board, args.repeat)
+        state = WhiteboardState(board)
+        report(f"{strokes:,} strokes, stored snapshot", state.to_dict(), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
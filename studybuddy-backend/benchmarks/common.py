@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+# Make `src` importable when running `python benchmarks/<script>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy.pool import StaticPool
+from src.extensions import db
+
+
+def make_app(database_uri='sqlite://', blueprints=()):
+    """Build a throwaway app bound to its own database for benchmarking"""
+    app = Flask(__name__)
+    # User.generate_token signs with the SECRET_KEY environment variable
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-0123456789abcdef')
+    app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_uri == 'sqlite://':
+        # Share the single in-memory database across threads
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False}
+        }
+    db.init_app(app)
+
+    # Every benchmark request comes from the same address
+    from src.services.rate_limit import rate_limiter
+    rate_limiter.enabled = False
+
+    import src.models  # noqa: F401 - register models
+
+    for blueprint, url_prefix in blueprints:
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
+
+    with app.app_context():
+        db.create_all()
+
+    return app
+
+
+def timed(label, fn, *args, **kwargs):
+    """Run fn once and print its wall time"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<48} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
@@ -0,0 +1,211 @@
+import logging
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, func, update, delete, case, inspect
+from sqlalchemy.schema import CreateColumn
+from src.extensions import db
+from src.models.ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest
+from src.models.study_room import StudyRoom, RoomMembership, StudySession, WhiteboardSnapshot
+from src.services.study_rollups import rebuild_rollups
+from src.services.session_reaper import reap_stale_sessions
+
+logger = logging.getLogger(__name__)
+
+# Schema changes that db.create_all() does not make to existing tables, oldest first
+MIGRATIONS = []
+
+def migration(step):
+    """Register step(connection): it changes only what the live schema lacks and returns a list of changes"""
+    MIGRATIONS.append(step)
+    return step
+
+def _columns(connection, model):
+    return {column['name'] for column in inspect(connection).get_columns(model.__table__.name)}
+
+def _add_column(connection, model, name):
+    """ALTER TABLE ... ADD COLUMN for a model column the table lacks; True if it was added"""
+    if name in _columns(connection, model):
+        return False
+    table = model.__table__
+    connection.exec_driver_sql(
+        f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} '
+        f'ADD COLUMN {CreateColumn(table.c[name]).compile(dialect=connection.dialect)}'
+    )
+    return True
+
+def _create_index(connection, model, name):
+    """Create a model index the table lacks; True if it was created"""
+    if name in {index['name'] for index in inspect(connection).get_indexes(model.__table__.name)}:
+        return False
+    next(index for index in model.__table__.indexes if index.name == name).create(connection)
+    return True
+
+def conversation_counts_update():
+    """UPDATE recomputing AIConversation.message_count and last_message_at"""
+    message_count = select(func.count(AIMessage.id)).where(
+        AIMessage.conversation_id == AIConversation.id
+    ).scalar_subquery()
+    last_message_at = select(func.max(AIMessage.timestamp)).where(
+        AIMessage.conversation_id == AIConversation.id
+    ).scalar_subquery()
+    return update(AIConversation).values(message_count=message_count, last_message_at=last_message_at)
+
+def room_member_counts_update():
+    """UPDATE recomputing StudyRoom.active_member_count from active memberships"""
+    active_member_count = select(func.count(RoomMembership.id)).where(
+        RoomMembership.room_id == StudyRoom.id,
+        RoomMembership.is_active == True
+    ).scalar_subquery()
+    return update(StudyRoom).values(active_member_count=active_member_count)
+
+@migration
+def add_flashcard_last_correct(connection):
+    """Flashcard.last_correct; NULL for earlier reviews, which scheduling treats as correct"""
+    return ['added flashcard.last_correct'] if _add_column(connection, Flashcard, 'last_correct') else []
+
+@migration
+def add_practice_test_attempt_count(connection):
+    """PracticeTest.attempt_count, counting one attempt for each test completed before attempts were recorded"""
+    if not _add_column(connection, PracticeTest, 'attempt_count'):
+        return []
+    result = connection.execute(
+        update(PracticeTest).values(attempt_count=case((PracticeTest.completed_at.is_not(None), 1), else_=0))
+    )
+    return [f'added practice_test.attempt_count, backfilled {result.rowcount} tests']
+
+@migration
+def add_conversation_counts(connection):
+    """AIConversation.message_count and last_message_at, computed from existing messages, and the message index"""
+    changes = []
+    added = [name for name in ('message_count', 'last_message_at') if _add_column(connection, AIConversation, name)]
+    if added:
+        result = connection.execute(conversation_counts_update())
+        changes.append(f"added ai_conversation.{' and '.join(added)}, backfilled {result.rowcount} conversations")
+    if _create_index(connection, AIMessage, 'ix_ai_message_conversation_id'):
+        changes.append('added index ix_ai_message_conversation_id')
+    return changes
+
+@migration
+def add_room_member_counts(connection):
+    """StudyRoom.active_member_count, and one membership per user and room so concurrent joins cannot double up"""
+    changes = []
+    if _add_column(connection, StudyRoom, 'active_member_count'):
+        changes.append('added study_room.active_member_count')
+
+    name = 'uq_room_membership_user_room'
+    inspector = inspect(connection)
+    if name not in ({constraint['name'] for constraint in inspector.get_unique_constraints('room_membership')}
+                    | {index['name'] for index in inspector.get_indexes('room_membership')}):
+        # Keep the owner's row, else an active one, else the oldest
+        rows = connection.execute(
+            select(RoomMembership.id, RoomMembership.user_id, RoomMembership.room_id)
+            .order_by(RoomMembership.user_id, RoomMembership.room_id,
+                      (RoomMembership.role == 'owner').desc(), RoomMembership.is_active.desc(), RoomMembership.id)
+        ).all()
+        seen = set()
+        duplicates = []
+        for row in rows:
+            if (row.user_id, row.room_id) in seen:
+                duplicates.append(row.id)
+            seen.add((row.user_id, row.room_id))
+        if duplicates:
+            connection.execute(delete(RoomMembership).where(RoomMembership.id.in_(duplicates)))
+            changes.append(f'removed {len(duplicates)} duplicate room memberships')
+        # SQLite cannot add a constraint to a table; a unique index enforces the same
+        connection.exec_driver_sql(f'CREATE UNIQUE INDEX {name} ON room_membership (user_id, room_id)')
+        changes.append(f'added unique index {name}')
+
+    if changes:
+        result = connection.execute(room_member_counts_update())
+        changes.append(f'recounted members of {result.rowcount} rooms')
+    return changes
+
+@migration
+def add_study_session_end_time_index(connection):
+    """Index the reaper's scan for sessions that are still open"""
+    if _create_index(connection, StudySession, 'ix_study_session_end_time_start_time'):
+        return ['added index ix_study_session_end_time_start_time']
+    return []
+
+@migration
+def add_whiteboard_snapshot_state_data(connection):
+    """WhiteboardSnapshot.state_data, and a nullable state for snapshots stored only there"""
+    changes = []
+    if _add_column(connection, WhiteboardSnapshot, 'state_data'):
+        changes.append('added whiteboard_snapshot.state_data')
+    state = next(column for column in inspect(connection).get_columns('whiteboard_snapshot') if column['name'] == 'state')
+    if state['nullable']:
+        return changes
+
+    if connection.dialect.name == 'sqlite':
+        # SQLite cannot drop NOT NULL in place: move the rows to a freshly created table
+        connection.exec_driver_sql('DROP INDEX IF EXISTS ix_whiteboard_snapshot_room_id_id')
+        connection.exec_driver_sql('ALTER TABLE whiteboard_snapshot RENAME TO whiteboard_snapshot_old')
+        WhiteboardSnapshot.__table__.create(connection)
+        columns = 'id, room_id, last_operation_id, state, state_data, created_at'
+        connection.exec_driver_sql(f'INSERT INTO whiteboard_snapshot ({columns}) SELECT {columns} FROM whiteboard_snapshot_old')
+        connection.exec_driver_sql('DROP TABLE whiteboard_snapshot_old')
+    else:
+        connection.exec_driver_sql('ALTER TABLE whiteboard_snapshot ALTER COLUMN state DROP NOT NULL')
+    changes.append('made whiteboard_snapshot.state nullable')
+    return changes
+
+def upgrade_schema():
+    """Run every migration in one transaction; returns the changes made"""
+    changes = []
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            # pysqlite runs DDL outside a transaction unless one is open
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        for step in MIGRATIONS:
+            changes.extend(step(connection))
+    for change in changes:
+        logger.info('Schema upgrade: %s', change)
+    return changes
+
+@click.command('upgrade-schema')
+@with_appcontext
+def upgrade_schema_command():
+    """Bring a database created by an older release up to the models"""
+    changes = upgrade_schema()
+    for change in changes:
+        click.echo(change)
+    click.echo(f'{len(changes)} changes')
+
+@click.command('backfill-conversation-counts')
+@with_appcontext
+def backfill_conversation_counts():
+    """Recompute AIConversation.message_count and last_message_at"""
+    result = db.session.execute(conversation_counts_update())
+    db.session.commit()
+    click.echo(f'Updated {result.rowcount} conversations')
+
+@click.command('recount-room-members')
+@with_appcontext
+def recount_room_members():
+    """Recompute StudyRoom.active_member_count from active memberships"""
+    result = db.session.execute(room_member_counts_update())
+    db.session.commit()
+    click.echo(f'Updated {result.rowcount} rooms')
+
+@click.command('backfill-study-rollups')
+@with_appcontext
+def backfill_study_rollups():
+    """Rebuild StudyDailyRollup from all ended study sessions"""
+    rows = rebuild_rollups()
+    click.echo(f'Wrote {rows} daily rollups')
+
+@click.command('reap-stale-sessions')
+@with_appcontext
+def reap_stale_sessions_command():
+    """Close study sessions left open by abandoned clients"""
+    sessions, minutes = reap_stale_sessions()
+    click.echo(f'Closed {sessions} sessions, crediting {minutes} minutes')
+
+def register_commands(app):
+    """Attach maintenance commands to `flask`"""
+    app.cli.add_command(upgrade_schema_command)
+    app.cli.add_command(backfill_conversation_counts)
+    app.cli.add_command(recount_room_members)
+    app.cli.add_command(backfill_study_rollups)
+    app.cli.add_command(reap_stale_sessions_command)
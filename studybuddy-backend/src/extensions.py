@@ -1,7 +1,11 @@
 # src/models/__init__.py
 from flask_sqlalchemy import SQLAlchemy
+from flask_sock import Sock
 
 # Create a single shared db instance
 db = SQLAlchemy()
 
+# WebSocket routes (real-time whiteboard)
+sock = Sock()
+
 
@@ -0,0 +1,14 @@
+import os
+from src.services.presence import presence
+from src.services.session_reaper import reap_stale_sessions
+from src.services.revocation import token_revocations, TOKEN_REVOCATION_SYNC_INTERVAL
+
+# Seconds between sweeps for abandoned study sessions
+SESSION_REAP_INTERVAL = int(os.environ.get('STUDY_SESSION_REAP_INTERVAL', 600))
+
+def register_jobs(runner):
+    """Schedule periodic maintenance on the runner"""
+    runner.add_job('presence-flush', presence.flush_interval, presence.flush)
+    runner.add_job('presence-publish', presence.publish_interval, presence.publish)
+    runner.add_job('reap-stale-sessions', SESSION_REAP_INTERVAL, reap_stale_sessions)
+    runner.add_job('sync-token-revocations', TOKEN_REVOCATION_SYNC_INTERVAL, token_revocations.sync)
@@ -5,10 +5,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-from src.extensions import db
-from src.models import User, StudyRoom, Document  # etc.
-from src.models.study_room import StudyRoom, RoomMembership, StudySession
-from src.models.ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest
+from src.extensions import db, sock
+from src.models import User, RevokedToken, StudyRoom, Document  # etc.
+from src.models.study_room import StudyRoom, RoomMembership, StudySession, WhiteboardOperation, WhiteboardSnapshot, StudyDailyRollup
+from src.models.ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest, PracticeQuestion, PracticeAnswer
 from src.models.document import Document, DocumentShare
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
@@ -17,6 +17,11 @@ from src.routes.ai_tutor import ai_bp
 from src.routes.document import document_bp
 from src.routes.payment import payment_bp
 from src.routes.external_services import external_bp
+from src.routes.analytics import analytics_bp
+from src.routes.leaderboard import leaderboard_bp
+from src.commands import register_commands
+from src.jobs import register_jobs
+from src.services.maintenance import maintenance
 
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -34,11 +39,14 @@ app.register_blueprint(ai_bp, url_prefix='/api/ai')
 app.register_blueprint(document_bp, url_prefix='/api/documents')
 app.register_blueprint(payment_bp, url_prefix='/api/payment')
 app.register_blueprint(external_bp, url_prefix='/api/external')
+app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+app.register_blueprint(leaderboard_bp, url_prefix='/api/leaderboards')
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
+sock.init_app(app)
 
 # Create upload directory
 upload_dir = os.path.join(os.path.dirname(__file__), 'uploads')
@@ -48,6 +56,10 @@ app.config['UPLOAD_FOLDER'] = upload_dir
 with app.app_context():
     db.create_all()
 
+register_commands(app)
+register_jobs(maintenance)
+maintenance.start(app)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -2,9 +2,9 @@ from src.extensions import db
 
 # Import models so they get registered with SQLAlchemy
 # These imports must come *after* db is defined
-from .user import User
-from .study_room import StudyRoom, RoomMembership, StudySession
-from .ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest
+from .user import User, RevokedToken
+from .study_room import StudyRoom, RoomMembership, StudySession, WhiteboardOperation, WhiteboardSnapshot, StudyDailyRollup
+from .ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest, PracticeQuestion, PracticeAnswer
 from .document import Document, DocumentShare
 
 # Now, any file that needs the database can do:
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
 from src.extensions import db
 # db = SQLAlchemy()
 
@@ -9,6 +10,8 @@ class AIConversation(db.Model):
     room_id = db.Column(db.Integer, db.ForeignKey('study_room.id'))  # Optional, if in a room
     conversation_type = db.Column(db.String(20), nullable=False)  # qa, summary, flashcard, practice_test
     title = db.Column(db.String(100))
+    message_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # maintained by send_message
+    last_message_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -23,12 +26,13 @@ class AIConversation(db.Model):
             'conversation_type': self.conversation_type,
             'title': self.title,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'message_count': len(self.messages)
+            'message_count': self.message_count or 0,
+            'last_message_at': self.last_message_at.isoformat() if self.last_message_at else None
         }
 
 class AIMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey('ai_conversation.id'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('ai_conversation.id'), nullable=False, index=True)
     role = db.Column(db.String(10), nullable=False)  # user, assistant
     content = db.Column(db.Text, nullable=False)
     message_metadata = db.Column(db.Text)  # JSON string for additional data
@@ -54,6 +58,7 @@ class Flashcard(db.Model):
     category = db.Column(db.String(50))
     times_reviewed = db.Column(db.Integer, default=0)
     correct_count = db.Column(db.Integer, default=0)
+    last_correct = db.Column(db.Boolean)  # outcome of the latest review; NULL for cards reviewed before it was stored
     last_reviewed = db.Column(db.DateTime)
     next_review = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -84,9 +89,14 @@ class PracticeTest(db.Model):
     score = db.Column(db.Float)
     total_questions = db.Column(db.Integer)
     time_taken = db.Column(db.Integer)  # in seconds
+    attempt_count = db.Column(db.Integer, default=0, server_default='0')
     completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Relationships
+    test_questions = db.relationship('PracticeQuestion', backref='test', lazy=True,
+                                     order_by='PracticeQuestion.position', cascade='all, delete-orphan')
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -96,7 +106,66 @@ class PracticeTest(db.Model):
             'score': self.score,
             'total_questions': self.total_questions,
             'time_taken': self.time_taken,
+            'attempt_count': self.attempt_count or 0,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class PracticeQuestion(db.Model):
+    __tablename__ = "practice_question"
+    
+    
+    id = db.Column(db.Integer, primary_key=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('practice_test.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    question_type = db.Column(db.String(20), nullable=False)  # multiple_choice, true_false, short_answer
+    prompt = db.Column(db.Text, nullable=False)
+    options = db.Column(db.Text)  # JSON list of choices for multiple_choice
+    correct_answer = db.Column(db.Text, nullable=False)  # option index, 'true'/'false' or expected text
+    explanation = db.Column(db.Text)
+    times_answered = db.Column(db.Integer, default=0)
+    times_correct = db.Column(db.Integer, default=0)
+
+    def get_options(self):
+        return json.loads(self.options) if self.options else []
+
+    def to_dict(self, include_answer=False):
+        data = {
+            'id': self.id,
+            'test_id': self.test_id,
+            'position': self.position,
+            'question_type': self.question_type,
+            'prompt': self.prompt,
+            'options': self.get_options(),
+            'times_answered': self.times_answered or 0,
+            'accuracy': (self.times_correct / self.times_answered * 100) if self.times_answered else None
+        }
+        if include_answer:
+            data['correct_answer'] = self.correct_answer
+            data['explanation'] = self.explanation
+        return data
+
+class PracticeAnswer(db.Model):
+    __tablename__ = "practice_answer"
+    
+    
+    id = db.Column(db.Integer, primary_key=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('practice_test.id'), nullable=False, index=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('practice_question.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    attempt = db.Column(db.Integer, nullable=False)
+    answer = db.Column(db.Text)
+    is_correct = db.Column(db.Boolean, nullable=False)
+    answered_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'test_id': self.test_id,
+            'question_id': self.question_id,
+            'attempt': self.attempt,
+            'answer': self.answer,
+            'is_correct': self.is_correct,
+            'answered_at': self.answered_at.isoformat() if self.answered_at else None
+        }
+
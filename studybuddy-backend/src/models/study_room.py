@@ -17,6 +17,7 @@ class StudyRoom(db.Model):
     max_participants = db.Column(db.Integer, default=10)
     is_private = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
+    active_member_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # maintained by claim_seat/release_seat
     meeting_url = db.Column(db.String(255))  # Google Meet/Zoom URL
     whiteboard_data = db.Column(db.Text)  # JSON string for whiteboard state
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -39,11 +40,32 @@ class StudyRoom(db.Model):
         return [membership.user for membership in self.memberships if membership.is_active]
 
     def get_member_count(self):
-        return len([m for m in self.memberships if m.is_active])
+        return self.active_member_count or 0
 
     def can_join(self):
         return self.is_active and self.get_member_count() < self.max_participants
 
+    @classmethod
+    def claim_seat(cls, room_id):
+        """Atomically take a seat in an active room that is not full; returns success"""
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.id == room_id, cls.is_active == True,
+                   cls.active_member_count < cls.max_participants)
+            .values(active_member_count=cls.active_member_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    @classmethod
+    def release_seat(cls, room_id):
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == room_id, cls.active_member_count > 0)
+            .values(active_member_count=cls.active_member_count - 1)
+            .execution_options(synchronize_session=False)
+        )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -62,6 +84,7 @@ class StudyRoom(db.Model):
 
 class RoomMembership(db.Model):
     __tablename__ = "room_membership"
+    __table_args__ = (db.UniqueConstraint('user_id', 'room_id', name='uq_room_membership_user_room'),)
     
     
     id = db.Column(db.Integer, primary_key=True)
@@ -85,6 +108,7 @@ class RoomMembership(db.Model):
 
 class StudySession(db.Model):
     __tablename__ = "study_session"
+    __table_args__ = (db.Index('ix_study_session_end_time_start_time', 'end_time', 'start_time'),)
     
     
     id = db.Column(db.Integer, primary_key=True)
@@ -108,3 +132,40 @@ class StudySession(db.Model):
             'notes': self.notes
         }
 
+
+class WhiteboardOperation(db.Model):
+    __tablename__ = "whiteboard_operation"
+    __table_args__ = (db.Index('ix_whiteboard_operation_room_id_id', 'room_id', 'id'),)
+    
+    
+    id = db.Column(db.Integer, primary_key=True)  # also the replay order
+    room_id = db.Column(db.Integer, db.ForeignKey('study_room.id'), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON of the stamped operation
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WhiteboardSnapshot(db.Model):
+    __tablename__ = "whiteboard_snapshot"
+    __table_args__ = (db.Index('ix_whiteboard_snapshot_room_id_id', 'room_id', 'id'),)
+    
+    
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('study_room.id'), nullable=False)
+    last_operation_id = db.Column(db.Integer, nullable=False, default=0)  # operations up to here are included
+    state = db.Column(db.Text)  # WhiteboardState.to_json(), unless stored as state_data
+    state_data = db.Column(db.LargeBinary)  # whiteboard_codec.encode(WhiteboardState.to_dict())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StudyDailyRollup(db.Model):
+    __tablename__ = "study_daily_rollup"
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'room_id', 'day', name='uq_study_daily_rollup_user_room_day'),
+        db.Index('ix_study_daily_rollup_user_id_day', 'user_id', 'day'),
+    )
+    
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    room_id = db.Column(db.Integer, db.ForeignKey('study_room.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)  # UTC
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)  # sessions that started this day
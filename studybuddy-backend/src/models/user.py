@@ -1,9 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import jwt
 import os
+import uuid
+from sqlalchemy import update, case, or_, func
+from sqlalchemy.orm.attributes import set_committed_value
 from src.extensions import db
+from src.services.password_hashing import password_hasher
 # db = SQLAlchemy()
 
 class User(db.Model):
@@ -13,7 +16,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     avatar_url = db.Column(db.String(255))
@@ -27,7 +30,6 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     failed_login_attempts = db.Column(db.Integer, default=0)
     locked_until = db.Column(db.DateTime)
-    
     # Relationships
     owned_rooms = db.relationship('StudyRoom', backref='owner', lazy=True, foreign_keys='StudyRoom.owner_id')
     room_memberships = db.relationship('RoomMembership', backref='user', lazy=True)
@@ -35,14 +37,18 @@ class User(db.Model):
     uploaded_documents = db.relationship('Document', backref='uploader', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def generate_token(self):
         payload = {
             'user_id': self.id,
+            'jti': uuid.uuid4().hex,  # token id, for revocation on logout
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         return jwt.encode(payload, os.environ.get('SECRET_KEY', 'default-secret'), algorithm='HS256')
@@ -53,16 +59,67 @@ class User(db.Model):
         return False
 
     def increment_failed_login(self):
-        self.failed_login_attempts += 1
-        if self.failed_login_attempts >= 5:
-            self.locked_until = datetime.utcnow() + timedelta(minutes=30)
-        db.session.commit()
+        """Count a failed attempt in one UPDATE, locking the account from the fifth; the caller commits"""
+        attempts = func.coalesce(User.failed_login_attempts, 0) + 1
+        db.session.execute(
+            update(User)
+            .where(User.id == self.id)
+            .values(failed_login_attempts=attempts,
+                    locked_until=case((attempts >= 5, datetime.utcnow() + timedelta(minutes=30)),
+                                      else_=User.locked_until))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, ['failed_login_attempts', 'locked_until'])
 
     def reset_failed_login(self):
         self.failed_login_attempts = 0
         self.locked_until = None
         db.session.commit()
 
+    def has_active_premium(self):
+        return bool(self.is_premium) and (self.premium_expires is None or self.premium_expires > datetime.utcnow())
+
+    def record_login(self):
+        """Clear failed attempts and advance the streak in one conditional UPDATE.
+        
+        Nothing is written when neither would change. Returns True if the row
+        was updated; the caller commits.
+        """
+        now = datetime.utcnow()
+        today = datetime.combine(now.date(), datetime.min.time())
+        yesterday = today - timedelta(days=1)
+        if not (self.failed_login_attempts or self.locked_until is not None
+                or self.last_activity is None or self.last_activity < today):
+            return False
+        
+        db.session.flush()  # e.g. a password rehash
+        row = db.session.execute(
+            update(User)
+            .where(User.id == self.id,
+                   or_(User.failed_login_attempts != 0, User.locked_until.isnot(None),
+                       User.last_activity.is_(None), User.last_activity < today))
+            .values(
+                failed_login_attempts=0,
+                locked_until=None,
+                streak_count=case(
+                    (User.last_activity >= today, User.streak_count),
+                    (User.last_activity >= yesterday, func.coalesce(User.streak_count, 0) + 1),
+                    else_=1
+                ),
+                last_activity=case((User.last_activity >= today, User.last_activity), else_=now)
+            )
+            .returning(User.failed_login_attempts, User.locked_until, User.streak_count, User.last_activity)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if row is None:
+            # Another request got there first
+            db.session.expire(self)
+            return False
+        for key, value in row._mapping.items():
+            set_committed_value(self, key, value)
+        return True
+
     def update_streak(self):
         today = datetime.utcnow().date()
         last_activity_date = self.last_activity.date() if self.last_activity else None
@@ -95,4 +152,11 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-
+class RevokedToken(db.Model):
+    """A JWT that stops being accepted before it expires; see services/revocation.py"""
+    __tablename__ = "revoked_token"
+    
+    jti = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,20 +1,53 @@
-from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, timedelta
-import openai
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from sqlalchemy import select
+from datetime import datetime, timedelta, timezone
 import json
 import os
 from src.models.user import User, db
-from src.models.ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest
+from src.models.ai_tutor import AIConversation, AIMessage, Flashcard, PracticeTest, PracticeQuestion
 from src.models.document import Document
-from src.routes.auth import token_required, sanitize_input
+from src.models.study_room import RoomMembership
+from src.routes.auth import token_required, admin_required, sanitize_input
+from src.services.admission import AdmissionController
+from src.services.coalescing import SingleFlight, make_key
+from src.services.llm import get_llm_backend
+from src.services.flashcard_scheduler import next_review_date, reschedule_flashcards
+from src.services.semantic_cache import SemanticCache
+from src.services.practice_tests import (
+    QUESTION_FORMAT_INSTRUCTIONS, PracticeTestFormatError, parse_practice_questions, submit_attempt
+)
 
 ai_bp = Blueprint('ai', __name__)
 
-# Initialize OpenAI client
-openai.api_key = os.environ.get('OPENAI_API_KEY')
+# Chat completion provider, selected with LLM_BACKEND / LLM_MODEL / LLM_BASE_URL
+llm_backend = get_llm_backend()
+
+# Per-user quotas and concurrency limits for LLM-backed endpoints (AI_* env vars)
+ai_admission = AdmissionController.from_env('AI')
+
+# Opt-in answer reuse for near-identical tutor questions within a document or room
+semantic_cache = SemanticCache(
+    threshold=float(os.environ.get('AI_SEMANTIC_CACHE_THRESHOLD', 0.92)),
+    max_entries=int(os.environ.get('AI_SEMANTIC_CACHE_ENTRIES', 256))
+) if os.environ.get('AI_SEMANTIC_CACHE', '').lower() in ('1', 'true', 'yes') else None
+
+# Rows fetched per round trip by the NDJSON export
+EXPORT_BATCH_SIZE = 500
+
+# Only conversation titles are sanitized; message and study text reach the model as typed
+CONVERSATION_HTML_FIELDS = frozenset({'title'})
+
+AI_FALLBACK_RESPONSE = "I'm sorry, I'm having trouble processing your request right now. Please try again later."
+
+# Identical in-flight generations share one upstream call. Set
+# AI_COALESCE_LOCK_DIR to a local directory to coalesce across workers too.
+generation_flight = SingleFlight(
+    lock_dir=os.environ.get('AI_COALESCE_LOCK_DIR'),
+    result_ttl=int(os.environ.get('AI_COALESCE_RESULT_TTL', 10))
+)
 
 def get_ai_response(messages, conversation_type='qa'):
-    """Get response from OpenAI API"""
+    """Get response from the configured LLM backend"""
     try:
         system_prompts = {
             'qa': "You are StudyBuddy AI, a helpful and knowledgeable tutor. Provide clear, accurate, and educational responses to student questions. Always encourage learning and critical thinking.",
@@ -25,9 +58,8 @@ def get_ai_response(messages, conversation_type='qa'):
         
         system_message = system_prompts.get(conversation_type, system_prompts['qa'])
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        return llm_backend.complete(
+            [
                 {"role": "system", "content": system_message},
                 *messages
             ],
@@ -35,10 +67,45 @@ def get_ai_response(messages, conversation_type='qa'):
             temperature=0.7
         )
         
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"I'm sorry, I'm having trouble processing your request right now. Please try again later."
+        return AI_FALLBACK_RESPONSE
+
+def get_coalesced_ai_response(messages, conversation_type):
+    """Get an AI response, sharing the upstream call with identical concurrent requests"""
+    key = make_key(conversation_type, messages)
+    return generation_flight.do(
+        key,
+        lambda: get_ai_response(messages, conversation_type),
+        should_share=lambda response: response != AI_FALLBACK_RESPONSE
+    )
+
+def _is_room_member(user_id, room_id):
+    return RoomMembership.query.filter_by(
+        user_id=user_id,
+        room_id=room_id,
+        is_active=True
+    ).first() is not None
+
+def get_semantic_cache_scope(current_user, conversation, document_id=None, has_history=False):
+    """Pick the shared cache scope for a Q&A message, or None if it should not be cached.
+    
+    Answers are shared with everyone in the scope, so only questions asked
+    without earlier messages are cached: the answer then depends on nothing
+    private to the asker.
+    """
+    if semantic_cache is None or conversation.conversation_type != 'qa' or has_history:
+        return None
+    
+    if document_id:
+        document = db.session.get(Document, document_id)
+        if document and (document.uploader_id == current_user.id or
+                         (document.room_id and _is_room_member(current_user.id, document.room_id))):
+            return f'document:{document.id}'
+        return None
+    
+    if conversation.room_id and _is_room_member(current_user.id, conversation.room_id):
+        return f'room:{conversation.room_id}'
+    return None
 
 @ai_bp.route('/conversations', methods=['GET'])
 @token_required
@@ -65,7 +132,7 @@ def create_conversation(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
+        data = sanitize_input(data, CONVERSATION_HTML_FIELDS)
         
         conversation_type = data.get('type', 'qa')
         if conversation_type not in ['qa', 'summary', 'flashcard', 'practice_test']:
@@ -105,7 +172,7 @@ def get_messages(current_user, conversation_id):
         
         messages = AIMessage.query.filter_by(
             conversation_id=conversation_id
-        ).order_by(AIMessage.timestamp.asc()).all()
+        ).order_by(AIMessage.timestamp.asc(), AIMessage.id.asc()).all()
         
         return jsonify({
             'messages': [msg.to_dict() for msg in messages]
@@ -114,8 +181,103 @@ def get_messages(current_user, conversation_id):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch messages'}), 500
 
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _parse_since(value):
+    """Parse an ISO-8601 `since` parameter into a naive UTC datetime"""
+    since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if since.tzinfo:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+@ai_bp.route('/export', methods=['GET'])
+@token_required
+def export_conversations(current_user):
+    """Stream the user's conversations and messages as NDJSON.
+    
+    Incremental syncs pass back the `next_since` and `next_after_id` of the
+    previous export. Messages are selected by id, which follows commit
+    order, so a message committed while an export runs is not skipped.
+    """
+    try:
+        since = _parse_since(request.args['since']) if request.args.get('since') else None
+        after_id = int(request.args['after_id']) if request.args.get('after_id') else None
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO-8601 timestamp and after_id an integer'}), 400
+    
+    user_id = current_user.id
+    
+    conversations = select(
+        AIConversation.id, AIConversation.room_id, AIConversation.conversation_type,
+        AIConversation.title, AIConversation.message_count, AIConversation.created_at,
+        AIConversation.updated_at
+    ).where(AIConversation.user_id == user_id).order_by(AIConversation.id)
+    
+    messages = select(
+        AIMessage.id, AIMessage.conversation_id, AIMessage.role, AIMessage.content,
+        AIMessage.message_metadata, AIMessage.timestamp
+    ).join(AIConversation, AIMessage.conversation_id == AIConversation.id).where(
+        AIConversation.user_id == user_id
+    ).order_by(AIMessage.id)
+    
+    if since:
+        # Inclusive: the cursor is the newest exported updated_at, and others may share it
+        conversations = conversations.where(AIConversation.updated_at >= since)
+    if after_id is not None:
+        messages = messages.where(AIMessage.id > after_id)
+    elif since:
+        # Clients that only pass `since`
+        messages = messages.where(AIMessage.timestamp > since)
+    
+    def generate():
+        next_since = since
+        # A full export covers every message so far, even when there are none
+        next_after_id = 0 if after_id is None and since is None else after_id
+        
+        # Rows are fetched from a streaming cursor and written one batch at a time
+        result = db.session.execute(conversations.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            for row in batch:
+                if row.updated_at and (next_since is None or row.updated_at > next_since):
+                    next_since = row.updated_at
+            yield ''.join(json.dumps({
+                'type': 'conversation',
+                'id': row.id,
+                'room_id': row.room_id,
+                'conversation_type': row.conversation_type,
+                'title': row.title,
+                'message_count': row.message_count,
+                'created_at': _isoformat(row.created_at),
+                'updated_at': _isoformat(row.updated_at)
+            }) + '\n' for row in batch)
+        
+        result = db.session.execute(messages.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            next_after_id = batch[-1].id
+            yield ''.join(json.dumps({
+                'type': 'message',
+                'id': row.id,
+                'conversation_id': row.conversation_id,
+                'role': row.role,
+                'content': row.content,
+                'message_metadata': row.message_metadata,
+                'timestamp': _isoformat(row.timestamp)
+            }) + '\n' for row in batch)
+        
+        # Clients pass these back as `since` and `after_id` for the next incremental sync,
+        # taken from the exported rows rather than the clock
+        yield json.dumps({
+            'type': 'sync',
+            'next_since': _isoformat(next_since),
+            'next_after_id': next_after_id
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @ai_bp.route('/conversations/<int:conversation_id>/messages', methods=['POST'])
 @token_required
+@ai_admission.guard()
 def send_message(current_user, conversation_id):
     """Send a message to AI tutor"""
     try:
@@ -123,8 +285,6 @@ def send_message(current_user, conversation_id):
         if not data or not data.get('content'):
             return jsonify({'error': 'Message content is required'}), 400
         
-        data = sanitize_input(data)
-        
         conversation = AIConversation.query.filter_by(
             id=conversation_id,
             user_id=current_user.id
@@ -133,22 +293,14 @@ def send_message(current_user, conversation_id):
         if not conversation:
             return jsonify({'error': 'Conversation not found'}), 404
         
-        # Save user message
-        user_message = AIMessage(
-            conversation_id=conversation_id,
-            role='user',
-            content=data['content']
-        )
-        db.session.add(user_message)
-        
-        # Get conversation history for context
+        # Get the most recent conversation history for context
         previous_messages = AIMessage.query.filter_by(
             conversation_id=conversation_id
-        ).order_by(AIMessage.timestamp.asc()).limit(10).all()
+        ).order_by(AIMessage.timestamp.desc(), AIMessage.id.desc()).limit(10).all()
         
         # Prepare messages for AI
         ai_messages = []
-        for msg in previous_messages:
+        for msg in reversed(previous_messages):
             ai_messages.append({
                 "role": msg.role,
                 "content": msg.content
@@ -158,19 +310,48 @@ def send_message(current_user, conversation_id):
             "content": data['content']
         })
         
-        # Get AI response
-        ai_response = get_ai_response(ai_messages, conversation.conversation_type)
+        conversation_type = conversation.conversation_type
+        cache_scope = get_semantic_cache_scope(current_user, conversation, data.get('document_id'),
+                                               has_history=bool(previous_messages))
+        
+        # End the read transaction so no database lock is held during the LLM call
+        db.session.commit()
+        
+        # Get AI response, reusing a cached answer to a near-identical question if allowed
+        cache_metadata = None
+        cached = semantic_cache.lookup(cache_scope, data['content']) if cache_scope else None
+        if cached:
+            entry_id, ai_response, similarity = cached
+            cache_metadata = {'entry_id': entry_id, 'similarity': round(similarity, 4), 'hit': True}
+        else:
+            ai_response = get_ai_response(ai_messages, conversation_type)
+            if cache_scope and ai_response != AI_FALLBACK_RESPONSE:
+                entry_id = semantic_cache.store(cache_scope, data['content'], ai_response)
+                cache_metadata = {'entry_id': entry_id, 'hit': False}
+        
+        # Save user message and AI response together, stamped when they are committed
+        saved_at = datetime.utcnow()
+        user_message = AIMessage(
+            conversation_id=conversation_id,
+            role='user',
+            content=data['content'],
+            timestamp=saved_at
+        )
+        db.session.add(user_message)
         
-        # Save AI response
         ai_message = AIMessage(
             conversation_id=conversation_id,
             role='assistant',
-            content=ai_response
+            content=ai_response,
+            timestamp=saved_at,
+            message_metadata=json.dumps({'semantic_cache': cache_metadata}) if cache_metadata else None
         )
         db.session.add(ai_message)
         
-        # Update conversation
-        conversation.updated_at = datetime.utcnow()
+        # Update conversation (counter incremented in SQL so concurrent sends add up)
+        conversation.updated_at = saved_at
+        conversation.message_count = AIConversation.message_count + 2
+        conversation.last_message_at = conversation.updated_at
         
         db.session.commit()
         
@@ -183,8 +364,44 @@ def send_message(current_user, conversation_id):
         db.session.rollback()
         return jsonify({'error': 'Failed to send message'}), 500
 
+@ai_bp.route('/messages/<int:message_id>/cache-feedback', methods=['POST'])
+@token_required
+def semantic_cache_feedback(current_user, message_id):
+    """Report that a cached tutor answer did not match the question"""
+    try:
+        message = db.session.query(AIMessage).join(AIConversation).filter(
+            AIMessage.id == message_id,
+            AIConversation.user_id == current_user.id
+        ).first()
+        
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        
+        metadata = json.loads(message.message_metadata) if message.message_metadata else {}
+        cache_info = metadata.get('semantic_cache') or {}
+        if semantic_cache is None or not cache_info.get('hit'):
+            return jsonify({'error': 'Message was not served from the cache'}), 400
+        
+        semantic_cache.report_false_hit(cache_info['entry_id'])
+        
+        return jsonify({'message': 'Feedback recorded'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to record feedback'}), 500
+
+@ai_bp.route('/semantic-cache/stats', methods=['GET'])
+@token_required
+@admin_required
+def semantic_cache_stats(current_user):
+    """Get semantic cache hit and false-hit metrics"""
+    if semantic_cache is None:
+        return jsonify({'enabled': False}), 200
+    
+    return jsonify({'enabled': True, **semantic_cache.stats()}), 200
+
 @ai_bp.route('/generate-summary', methods=['POST'])
 @token_required
+@ai_admission.guard(cost=2)
 def generate_summary(current_user):
     """Generate summary from text or document"""
     try:
@@ -192,8 +409,6 @@ def generate_summary(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
-        
         text_content = data.get('text')
         document_id = data.get('document_id')
         
@@ -220,7 +435,7 @@ def generate_summary(current_user):
             {"role": "user", "content": f"Please provide a comprehensive summary of the following text:\n\n{text_content}"}
         ]
         
-        summary = get_ai_response(messages, 'summary')
+        summary = get_coalesced_ai_response(messages, 'summary')
         
         return jsonify({
             'summary': summary
@@ -231,6 +446,7 @@ def generate_summary(current_user):
 
 @ai_bp.route('/generate-flashcards', methods=['POST'])
 @token_required
+@ai_admission.guard(cost=2)
 def generate_flashcards(current_user):
     """Generate flashcards from text or document"""
     try:
@@ -238,8 +454,6 @@ def generate_flashcards(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
-        
         text_content = data.get('text')
         document_id = data.get('document_id')
         count = min(data.get('count', 10), 20)  # Limit to 20 flashcards
@@ -267,7 +481,7 @@ def generate_flashcards(current_user):
             {"role": "user", "content": f"Create {count} educational flashcards from the following text. Format as JSON with 'question' and 'answer' fields:\n\n{text_content}"}
         ]
         
-        ai_response = get_ai_response(messages, 'flashcard')
+        ai_response = get_coalesced_ai_response(messages, 'flashcard')
         
         # Try to parse JSON response
         try:
@@ -347,15 +561,13 @@ def review_flashcard(current_user, flashcard_id):
         if is_correct:
             flashcard.correct_count += 1
         
+        flashcard.last_correct = bool(is_correct)
         flashcard.last_reviewed = datetime.utcnow()
         
         # Calculate next review date based on spaced repetition
-        if is_correct:
-            days_to_add = min(flashcard.correct_count * 2, 30)
-        else:
-            days_to_add = 1
-        
-        flashcard.next_review = datetime.utcnow() + timedelta(days=days_to_add)
+        flashcard.next_review = next_review_date(
+            flashcard.correct_count, is_correct, flashcard.last_reviewed
+        )
         
         db.session.commit()
         
@@ -368,8 +580,30 @@ def review_flashcard(current_user, flashcard_id):
         db.session.rollback()
         return jsonify({'error': 'Failed to review flashcard'}), 500
 
+@ai_bp.route('/flashcards/reschedule', methods=['POST'])
+@token_required
+def reschedule_user_flashcards(current_user):
+    """Recompute next review dates for all of the user's flashcards"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        rescheduled = reschedule_flashcards(
+            user_id=current_user.id,
+            document_id=data.get('document_id')
+        )
+        
+        return jsonify({
+            'message': 'Flashcards rescheduled',
+            'rescheduled_count': rescheduled
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to reschedule flashcards'}), 500
+
 @ai_bp.route('/generate-practice-test', methods=['POST'])
 @token_required
+@ai_admission.guard(cost=2)
 def generate_practice_test(current_user):
     """Generate a practice test from text or document"""
     try:
@@ -377,8 +611,6 @@ def generate_practice_test(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
-        
         text_content = data.get('text')
         document_id = data.get('document_id')
         question_count = min(data.get('question_count', 10), 20)
@@ -403,10 +635,16 @@ def generate_practice_test(current_user):
         
         # Generate practice test using AI
         messages = [
-            {"role": "user", "content": f"Create a practice test with {question_count} questions from the following text. Include multiple choice, true/false, and short answer questions. Format as JSON:\n\n{text_content}"}
+            {"role": "user", "content": f"Create a practice test with {question_count} questions from the following text. Include multiple choice, true/false, and short answer questions. {QUESTION_FORMAT_INSTRUCTIONS}\n\n{text_content}"}
         ]
         
-        ai_response = get_ai_response(messages, 'practice_test')
+        ai_response = get_coalesced_ai_response(messages, 'practice_test')
+        
+        # Parse and validate questions before storing anything
+        try:
+            parsed_questions = parse_practice_questions(ai_response, limit=question_count)
+        except PracticeTestFormatError:
+            return jsonify({'error': 'AI response could not be turned into a practice test'}), 502
         
         # Create practice test
         practice_test = PracticeTest(
@@ -414,14 +652,20 @@ def generate_practice_test(current_user):
             document_id=document_id,
             title=data.get('title', 'Generated Practice Test'),
             questions=ai_response,
-            total_questions=question_count
+            total_questions=len(parsed_questions)
         )
         
+        for position, question_data in enumerate(parsed_questions):
+            practice_test.test_questions.append(PracticeQuestion(position=position, **question_data))
+        
         db.session.add(practice_test)
         db.session.commit()
         
+        test_data = practice_test.to_dict()
+        test_data['questions'] = [q.to_dict() for q in practice_test.test_questions]
+        
         return jsonify({
-            'practice_test': practice_test.to_dict()
+            'practice_test': test_data
         }), 201
         
     except Exception as e:
@@ -444,3 +688,75 @@ def get_practice_tests(current_user):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch practice tests'}), 500
 
+
+@ai_bp.route('/practice-tests/<int:test_id>', methods=['GET'])
+@token_required
+def get_practice_test(current_user, test_id):
+    """Get a practice test with its questions"""
+    try:
+        practice_test = PracticeTest.query.filter_by(
+            id=test_id,
+            user_id=current_user.id
+        ).first()
+        
+        if not practice_test:
+            return jsonify({'error': 'Practice test not found'}), 404
+        
+        # Answer keys are only revealed after an attempt
+        show_answers = bool(practice_test.completed_at)
+        test_data = practice_test.to_dict()
+        test_data['questions'] = [
+            q.to_dict(include_answer=show_answers) for q in practice_test.test_questions
+        ]
+        
+        return jsonify({'practice_test': test_data}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch practice test'}), 500
+
+@ai_bp.route('/practice-tests/<int:test_id>/submit', methods=['POST'])
+@token_required
+def submit_practice_test(current_user, test_id):
+    """Grade a practice test attempt"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('answers'), (dict, list)):
+            return jsonify({'error': 'Answers are required'}), 400
+        
+        practice_test = PracticeTest.query.filter_by(
+            id=test_id,
+            user_id=current_user.id
+        ).first()
+        
+        if not practice_test:
+            return jsonify({'error': 'Practice test not found'}), 404
+        
+        if not practice_test.test_questions:
+            return jsonify({'error': 'Practice test has no gradable questions'}), 400
+        
+        time_taken = data.get('time_taken')
+        if time_taken is not None and (not isinstance(time_taken, int) or time_taken < 0):
+            return jsonify({'error': 'time_taken must be a non-negative number of seconds'}), 400
+        
+        try:
+            results = submit_attempt(practice_test, current_user.id, data['answers'], time_taken)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid answers format'}), 400
+        
+        db.session.commit()
+        
+        questions = {q.id: q for q in practice_test.test_questions}
+        for result in results:
+            question = questions[result['question_id']]
+            result['correct_answer'] = question.correct_answer
+            result['explanation'] = question.explanation
+        
+        return jsonify({
+            'message': 'Practice test graded',
+            'practice_test': practice_test.to_dict(),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to submit practice test'}), 500
@@ -0,0 +1,113 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta
+from functools import wraps
+from src.models.user import db
+from src.models.study_room import StudyRoom
+from src.routes.auth import token_required
+from src.services.study_rollups import daily_minutes, room_minutes, study_streak
+
+analytics_bp = Blueprint('analytics', __name__)
+
+# Free accounts see the last week; longer ranges are part of premium
+FREE_ANALYTICS_DAYS = 7
+MAX_ANALYTICS_DAYS = 365
+MAX_ANALYTICS_WEEKS = 52
+
+def premium_required(f):
+    """Reject users without an active premium subscription (use below token_required)"""
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if not current_user.has_active_premium():
+            return jsonify({'error': 'Premium subscription required'}), 403
+        return f(current_user, *args, **kwargs)
+    return decorated
+
+def _day_range(days):
+    today = datetime.utcnow().date()
+    return today - timedelta(days=days - 1), today
+
+@analytics_bp.route('/summary', methods=['GET'])
+@token_required
+def get_summary(current_user):
+    """Get daily study time and streak for the last few days"""
+    try:
+        days = request.args.get('days', FREE_ANALYTICS_DAYS, type=int)
+        if days < 1 or days > MAX_ANALYTICS_DAYS:
+            return jsonify({'error': f'days must be between 1 and {MAX_ANALYTICS_DAYS}'}), 400
+        if days > FREE_ANALYTICS_DAYS and not current_user.has_active_premium():
+            return jsonify({'error': 'Premium subscription required'}), 403
+        
+        start_day, today = _day_range(days)
+        totals = daily_minutes(current_user.id, start_day, today)
+        daily = []
+        for offset in range(days):
+            day = start_day + timedelta(days=offset)
+            minutes, sessions = totals.get(day, (0, 0))
+            daily.append({'date': day.isoformat(), 'minutes': minutes, 'sessions': sessions})
+        
+        return jsonify({
+            'daily': daily,
+            'total_minutes': sum(entry['minutes'] for entry in daily),
+            'total_sessions': sum(entry['sessions'] for entry in daily),
+            'study_streak': study_streak(current_user.id, today),
+            'total_study_time': current_user.total_study_time
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch analytics'}), 500
+
+@analytics_bp.route('/weekly', methods=['GET'])
+@token_required
+@premium_required
+def get_weekly(current_user):
+    """Get study time per week"""
+    try:
+        weeks = request.args.get('weeks', 12, type=int)
+        if weeks < 1 or weeks > MAX_ANALYTICS_WEEKS:
+            return jsonify({'error': f'weeks must be between 1 and {MAX_ANALYTICS_WEEKS}'}), 400
+        
+        today = datetime.utcnow().date()
+        first_week_start = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+        totals = daily_minutes(current_user.id, first_week_start, today)
+        
+        weekly = []
+        for index in range(weeks):
+            week_start = first_week_start + timedelta(weeks=index)
+            week = [totals.get(week_start + timedelta(days=offset), (0, 0)) for offset in range(7)]
+            weekly.append({
+                'week_start': week_start.isoformat(),
+                'minutes': sum(minutes for minutes, _ in week),
+                'sessions': sum(sessions for _, sessions in week),
+                'active_days': sum(1 for minutes, _ in week if minutes > 0)
+            })
+        
+        return jsonify({'weekly': weekly}), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch analytics'}), 500
+
+@analytics_bp.route('/rooms', methods=['GET'])
+@token_required
+@premium_required
+def get_room_breakdown(current_user):
+    """Get study time per room"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        if days < 1 or days > MAX_ANALYTICS_DAYS:
+            return jsonify({'error': f'days must be between 1 and {MAX_ANALYTICS_DAYS}'}), 400
+        
+        start_day, today = _day_range(days)
+        rows = room_minutes(current_user.id, start_day, today)
+        names = dict(db.session.query(StudyRoom.id, StudyRoom.name).filter(
+            StudyRoom.id.in_([room_id for room_id, _, _ in rows])
+        ).all()) if rows else {}
+        
+        return jsonify({
+            'rooms': [
+                {'room_id': room_id, 'name': names.get(room_id), 'minutes': minutes, 'sessions': sessions}
+                for room_id, minutes, sessions in rows
+            ]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch analytics'}), 500
@@ -2,14 +2,36 @@ from flask import Blueprint, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import jwt
+import os
 import re
 from datetime import datetime, timedelta
 from src.models.user import User, db
+from src.services.leaderboard import leaderboards
+from src.services.user_cache import decode_token, load_user, invalidate_users
+from src.services.password_hashing import HashingBusy
+from src.services.revocation import token_revocations
+from src.services.rate_limit import rate_limiter, RateLimit, client_ip, json_field
 import html
 import bleach
 
 auth_bp = Blueprint('auth', __name__)
 
+# Accounts allowed to use operator endpoints, as a comma-separated list of emails
+ADMIN_EMAILS = frozenset(
+    email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()
+)
+
+# Request rates allowed, as '<count>/<second|minute|hour|day>'
+LOGIN_RATE_PER_IP = os.environ.get('LOGIN_RATE_PER_IP', '30/minute')
+LOGIN_RATE_PER_ACCOUNT = os.environ.get('LOGIN_RATE_PER_ACCOUNT', '10/minute')
+REGISTER_RATE_PER_IP = os.environ.get('REGISTER_RATE_PER_IP', '20/hour')
+
+rate_limiter.limit(auth_bp, {
+    'login': [RateLimit.parse(LOGIN_RATE_PER_IP, client_ip, 'ip'),
+              RateLimit.parse(LOGIN_RATE_PER_ACCOUNT, json_field('email'), 'account')],
+    'register': [RateLimit.parse(REGISTER_RATE_PER_IP, client_ip, 'ip')],
+})
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -29,17 +51,86 @@ def validate_password(password):
         return False, "Password must contain at least one special character"
     return True, "Password is valid"
 
-def sanitize_input(data):
-    """Sanitize user input to prevent XSS"""
+# Characters bleach.clean or html.escape would change; other strings come back unchanged
+_UNSAFE_CHARS = re.compile(r'[\x00-\x08\x0b-\x1f"&\'<>]')
+
+# Fields shown to other users, per endpoint; everything else is stored as sent
+REGISTER_HTML_FIELDS = frozenset({'username', 'first_name', 'last_name'})
+
+def sanitize_text(value):
+    """Remove HTML tags and escape special characters in one string"""
+    if not _UNSAFE_CHARS.search(value):
+        return value
+    return html.escape(bleach.clean(value, strip=True))
+
+def sanitize_input(data, fields=None):
+    """Sanitize user input to prevent XSS.
+    
+    With fields, only those keys of a dict are sanitized. Values that need no
+    change are returned as the same objects, without copying.
+    """
     if isinstance(data, str):
-        # Remove HTML tags and escape special characters
-        return html.escape(bleach.clean(data, strip=True))
+        return sanitize_text(data)
     elif isinstance(data, dict):
-        return {key: sanitize_input(value) for key, value in data.items()}
+        cleaned = None
+        for key, value in data.items():
+            if fields is not None and key not in fields:
+                continue
+            sanitized = sanitize_input(value)
+            if sanitized is not value:
+                if cleaned is None:
+                    cleaned = dict(data)
+                cleaned[key] = sanitized
+        return data if cleaned is None else cleaned
     elif isinstance(data, list):
-        return [sanitize_input(item) for item in data]
+        cleaned = None
+        for index, item in enumerate(data):
+            sanitized = sanitize_input(item)
+            if sanitized is not item:
+                if cleaned is None:
+                    cleaned = list(data)
+                cleaned[index] = sanitized
+        return data if cleaned is None else cleaned
     return data
 
+def check_password(user, password):
+    """Check a password, accepting hashes made from the sanitized form older versions stored.
+    
+    A legacy match, or a hash made with other parameters than PASSWORD_HASH_METHOD,
+    is rehashed from the password as typed; the caller commits.
+    """
+    if user.check_password(password):
+        if user.password_needs_rehash():
+            _rehash(user, password)
+        return True
+    legacy = sanitize_text(password) if isinstance(password, str) else password
+    if legacy is not password and user.check_password(legacy):
+        _rehash(user, password)
+        return True
+    return False
+
+def _rehash(user, password):
+    try:
+        user.set_password(password)
+    except HashingBusy:
+        pass  # the old hash still works; upgrade on a later login
+
+def hashing_busy_response():
+    """503 for requests turned away by the password hashing pool"""
+    response = jsonify({'error': 'Server is busy, please try again', 'retry_after': 1})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def get_user_from_token(token):
+    """Return the user a JWT belongs to, or None if it is invalid, expired or revoked"""
+    try:
+        data = decode_token(token)
+    except jwt.InvalidTokenError:
+        return None
+    if token_revocations.is_revoked(data.get('jti')):
+        return None
+    return load_user(data['user_id'])
+
 def token_required(f):
     """Decorator to require valid JWT token"""
     @wraps(f)
@@ -57,8 +148,10 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            data = decode_token(token)
+            if token_revocations.is_revoked(data.get('jti')):
+                return jsonify({'error': 'Token has been revoked'}), 401
+            current_user = load_user(data['user_id'])
             if not current_user:
                 return jsonify({'error': 'Invalid token'}), 401
         except jwt.ExpiredSignatureError:
@@ -70,6 +163,16 @@ def token_required(f):
     
     return decorated
 
+def admin_required(f):
+    """Decorator for token_required views limited to ADMIN_EMAILS"""
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if current_user.email.lower() not in ADMIN_EMAILS:
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(current_user, *args, **kwargs)
+    
+    return decorated
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -78,8 +181,8 @@ def register():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        # Sanitize input data
-        data = sanitize_input(data)
+        # Sanitize displayed fields; the password is hashed as typed
+        data = sanitize_input(data, REGISTER_HTML_FIELDS)
 
         # Validate required fields
         required_fields = ['username', 'email', 'password', 'first_name', 'last_name']
@@ -114,6 +217,7 @@ def register():
 
         db.session.add(user)
         db.session.commit()
+        leaderboards.record_user(user)
 
         # Generate token safely
         try:
@@ -141,6 +245,9 @@ def register():
             'user': user_dict
         }), 201
 
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Registration failed: {str(e)}")
@@ -155,9 +262,6 @@ def login():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        # Sanitize input
-        data = sanitize_input(data)
-
         email = data.get('email', '').strip().lower()
         password = data.get('password', '')
 
@@ -175,18 +279,21 @@ def login():
             return jsonify({'error': 'Account temporarily locked'}), 423
 
         # Check password
-        if not user.check_password(password):
+        if not check_password(user, password):
             if hasattr(user, "increment_failed_login"):
                 user.increment_failed_login()
+                invalidate_users([user.id])
+                db.session.commit()
             return jsonify({'error': 'Invalid email or password'}), 401
 
-        # Reset failed login attempts
-        if hasattr(user, "reset_failed_login"):
-            user.reset_failed_login()
-
-        # Update streak/last activity
-        if hasattr(user, "update_streak"):
-            user.update_streak()
+        # Reset failed attempts and update streak/last activity in one write;
+        # the commit writes nothing unless that or a password rehash changed the row
+        updated = user.record_login()
+        if updated:
+            invalidate_users([user.id])
+        db.session.commit()
+        if updated:
+            leaderboards.record_streak(user)
 
         # Generate token safely
         try:
@@ -210,7 +317,11 @@ def login():
 
         return jsonify({'message': 'Login successful', 'token': token, 'user': user_dict}), 200
 
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Login error: {str(e)}")
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
 
@@ -244,9 +355,6 @@ def change_password(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Sanitize input
-        data = sanitize_input(data)
-        
         current_password = data.get('current_password')
         new_password = data.get('new_password')
         
@@ -254,7 +362,7 @@ def change_password(current_user):
             return jsonify({'error': 'Current and new passwords are required'}), 400
         
         # Verify current password
-        if not current_user.check_password(current_password):
+        if not check_password(current_user, current_password):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
         # Validate new password
@@ -268,6 +376,9 @@ def change_password(current_user):
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Password change failed'}), 500
@@ -275,6 +386,15 @@ def change_password(current_user):
 @auth_bp.route('/logout', methods=['POST'])
 @token_required
 def logout(current_user):
-    """Logout user (client should discard token)"""
-    return jsonify({'message': 'Logged out successfully'}), 200
+    """Logout user by revoking the token sent with the request"""
+    try:
+        data = decode_token(request.headers['Authorization'].split(" ")[1])
+        if data.get('jti'):
+            token_revocations.revoke(data['jti'], current_user.id, data['exp'])
+        
+        return jsonify({'message': 'Logged out successfully'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Logout failed'}), 500
 
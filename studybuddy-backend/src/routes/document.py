@@ -8,11 +8,24 @@ import io
 from src.models.user import User, db
 from src.models.document import Document, DocumentShare
 from src.routes.auth import token_required, sanitize_input
+from src.services.rate_limit import rate_limiter, RateLimit, client_ip, token_user
 
 document_bp = Blueprint('document', __name__)
 
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'png', 'jpg', 'jpeg'}
 
+# Upload rates allowed, as '<count>/<second|minute|hour|day>'
+UPLOAD_RATE_PER_USER = os.environ.get('UPLOAD_RATE_PER_USER', '60/hour')
+UPLOAD_RATE_PER_IP = os.environ.get('UPLOAD_RATE_PER_IP', '120/hour')
+
+rate_limiter.limit(document_bp, {
+    'upload_document': [RateLimit.parse(UPLOAD_RATE_PER_USER, token_user, 'user'),
+                        RateLimit.parse(UPLOAD_RATE_PER_IP, client_ip, 'ip')],
+})
+
+# Share fields shown to other users; ids are used as sent
+SHARE_HTML_FIELDS = frozenset({'permissions'})
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
@@ -289,7 +302,7 @@ def share_document(current_user, document_id):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
+        data = sanitize_input(data, SHARE_HTML_FIELDS)
         
         document = Document.query.filter_by(
             id=document_id,
@@ -6,7 +6,12 @@ import os
 import uuid
 from src.models.user import User, db
 from src.models.study_room import StudyRoom
-from src.routes.auth import token_required, sanitize_input
+from src.routes.auth import token_required
+from src.services.whiteboard import whiteboard_hub, validate_document
+from src.services import whiteboard_codec
+from src.services.whiteboard_log import load_state, replace_document
+from src.services.events import event_bus, MEETING_CREATED, WHITEBOARD_REPLACED
+from src.services.room_events import announce
 
 external_bp = Blueprint('external', __name__)
 
@@ -27,8 +32,6 @@ def create_meeting(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
-        
         room_id = data.get('room_id')
         platform = data.get('platform', 'google_meet')  # google_meet or zoom
         
@@ -66,6 +69,9 @@ def create_meeting(current_user):
         room.meeting_url = meeting_data['join_url']
         db.session.commit()
         
+        announce(MEETING_CREATED, room.id, platform=platform, join_url=meeting_data['join_url'],
+                 created_by=current_user.id)
+        
         return jsonify({
             'meeting_id': meeting_data['id'],
             'join_url': meeting_data['join_url'],
@@ -240,8 +246,11 @@ def oauth_callback(platform):
 def save_whiteboard(current_user):
     """Save whiteboard data for a room"""
     try:
-        data = request.get_json()
-        if not data:
+        try:
+            data = whiteboard_codec.get_payload()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not isinstance(data, dict) or not data:
             return jsonify({'error': 'No data provided'}), 400
         
         room_id = data.get('room_id')
@@ -250,6 +259,11 @@ def save_whiteboard(current_user):
         if not room_id or not whiteboard_data:
             return jsonify({'error': 'Room ID and whiteboard data required'}), 400
         
+        try:
+            validate_document(whiteboard_data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         room = StudyRoom.query.get(room_id)
         if not room:
             return jsonify({'error': 'Room not found'}), 404
@@ -265,9 +279,10 @@ def save_whiteboard(current_user):
         if not membership:
             return jsonify({'error': 'Access denied'}), 403
         
-        # Save whiteboard data
-        room.whiteboard_data = json.dumps(whiteboard_data)
-        db.session.commit()
+        # Save whiteboard data as a snapshot that later operations build on
+        state = replace_document(room.id, whiteboard_data)
+        whiteboard_hub.replace(room.id, state)
+        event_bus.publish(WHITEBOARD_REPLACED, room.id, document=state.document(), clock=state.clock)
         
         return jsonify({'message': 'Whiteboard saved successfully'}), 200
         
@@ -295,9 +310,11 @@ def get_whiteboard(current_user, room_id):
         if not membership:
             return jsonify({'error': 'Access denied'}), 403
         
-        whiteboard_data = json.loads(room.whiteboard_data) if room.whiteboard_data else {}
+        whiteboard_data = whiteboard_hub.document(room_id)
+        if whiteboard_data is None:
+            whiteboard_data = load_state(room_id).document()
         
-        return jsonify({'whiteboard_data': whiteboard_data}), 200
+        return whiteboard_codec.make_response({'whiteboard_data': whiteboard_data})
         
     except Exception as e:
         return jsonify({'error': 'Failed to get whiteboard data'}), 500
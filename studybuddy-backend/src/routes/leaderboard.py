@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify
+from src.models.user import User
+from src.routes.auth import token_required
+from src.services.leaderboard import leaderboards, METRICS
+from src.models.study_room import RoomMembership
+
+leaderboard_bp = Blueprint('leaderboard', __name__)
+
+MAX_LEADERBOARD_SIZE = 100
+
+def _leaderboard_response(board, metric, current_user):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_LEADERBOARD_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    entries = leaderboards.store.top(board, limit, start=offset)
+    users = {
+        user.id: user for user in
+        User.query.filter(User.id.in_([user_id for user_id, _ in entries])).all()
+    } if entries else {}
+    
+    mine = leaderboards.store.rank(board, current_user.id)
+    
+    return jsonify({
+        'metric': metric,
+        'total': leaderboards.store.size(board),
+        'entries': [
+            {
+                'rank': offset + index + 1,
+                'user_id': user_id,
+                'username': users[user_id].username if user_id in users else None,
+                'avatar_url': users[user_id].avatar_url if user_id in users else None,
+                'score': score
+            }
+            for index, (user_id, score) in enumerate(entries)
+        ],
+        'me': {'rank': mine[0] + 1, 'score': mine[1]} if mine else None
+    }), 200
+
+@leaderboard_bp.route('/global/<metric>', methods=['GET'])
+@token_required
+def get_global_leaderboard(current_user, metric):
+    """Get the global leaderboard for a metric"""
+    try:
+        if metric not in METRICS:
+            return jsonify({'error': f'Unknown metric; use one of {", ".join(METRICS)}'}), 404
+        
+        return _leaderboard_response(leaderboards.global_ranking(metric), metric, current_user)
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
+
+@leaderboard_bp.route('/rooms/<int:room_id>/<metric>', methods=['GET'])
+@token_required
+def get_room_leaderboard(current_user, room_id, metric):
+    """Get a room's leaderboard for a metric"""
+    try:
+        if metric not in METRICS:
+            return jsonify({'error': f'Unknown metric; use one of {", ".join(METRICS)}'}), 404
+        
+        membership = RoomMembership.query.filter_by(
+            user_id=current_user.id,
+            room_id=room_id,
+            is_active=True
+        ).first()
+        
+        if not membership:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        return _leaderboard_response(leaderboards.room_ranking(room_id, metric), metric, current_user)
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
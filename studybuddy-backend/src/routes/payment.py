@@ -4,7 +4,7 @@ import requests
 import json
 import os
 from src.models.user import User, db
-from src.routes.auth import token_required, sanitize_input
+from src.routes.auth import token_required
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -73,8 +73,6 @@ def create_payment(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        data = sanitize_input(data)
-        
         plan_id = data.get('plan_id')
         if plan_id != 'premium_yearly':
             return jsonify({'error': 'Invalid plan selected'}), 400
@@ -1,36 +1,108 @@
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+from src.extensions import sock
 from src.models.user import User, db
 from src.models.study_room import StudyRoom, RoomMembership, StudySession
-from src.routes.auth import token_required, sanitize_input
+from src.routes.auth import token_required, sanitize_input, get_user_from_token
+from src.services.cache import TTLCache
+from src.services.events import (
+    event_bus, ROOM_CREATED, MEMBER_JOINED, MEMBER_LEFT, WHITEBOARD_OPS, WHITEBOARD_REPLACED
+)
+from src.services.leaderboard import leaderboards
+from src.services.presence import presence
+from src.services.room_codes import normalize_room_code, resolve_room_code
+from src.services.room_events import announce
+from src.services.study_rollups import record_session as record_study_session
+from src.services.user_cache import invalidate_users
+from src.services.whiteboard import WhiteboardState, whiteboard_hub, validate_document, MAX_OPS_PER_MESSAGE
+from src.services import whiteboard_codec
+from src.services.whiteboard_log import (
+    load_state as load_whiteboard_state,
+    append_operations as append_whiteboard_operations,
+    replace_document as replace_whiteboard_document
+)
 import json
+import os
 
 room_bp = Blueprint('room', __name__)
 
+ROOMS_PER_PAGE = 20
+MAX_ROOMS_PER_PAGE = 100
+
+# Room fields shown to other users; sanitized on create
+ROOM_HTML_FIELDS = frozenset({'name', 'description', 'subject'})
+
+# Public directory pages, shared by all users and cleared whenever membership changes
+public_rooms_cache = TTLCache(ttl=int(os.environ.get('PUBLIC_ROOMS_CACHE_TTL', 15)))
+
+# Seconds a whiteboard socket has to send its auth message
+WHITEBOARD_AUTH_TIMEOUT = int(os.environ.get('WHITEBOARD_AUTH_TIMEOUT', 10))
+
+def _pagination_args():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', ROOMS_PER_PAGE, type=int), 1), MAX_ROOMS_PER_PAGE)
+    return page, per_page
+
+def _room_page(query, page, per_page):
+    """Run a room query for one page; fetches one extra row to know if there is a next page"""
+    rooms = query.order_by(StudyRoom.created_at.desc(), StudyRoom.id.desc()).offset(
+        (page - 1) * per_page
+    ).limit(per_page + 1).all()
+    
+    return {
+        'rooms': [room.to_dict() for room in rooms[:per_page]],
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'has_next': len(rooms) > per_page
+        }
+    }
+
+def _filter_subject(query, subject):
+    if subject:
+        query = query.filter(func.lower(StudyRoom.subject) == subject.strip().lower())
+    return query
+
 @room_bp.route('/rooms', methods=['GET'])
 @token_required
 def get_rooms(current_user):
     """Get all public rooms and user's private rooms"""
     try:
-        # Get public rooms
-        public_rooms = StudyRoom.query.filter_by(is_private=False, is_active=True).all()
+        page, per_page = _pagination_args()
         
-        # Get user's owned rooms
-        owned_rooms = StudyRoom.query.filter_by(owner_id=current_user.id, is_active=True).all()
-        
-        # Get rooms user is a member of
-        member_rooms = db.session.query(StudyRoom).join(RoomMembership).filter(
+        is_member = db.session.query(RoomMembership.id).filter(
+            RoomMembership.room_id == StudyRoom.id,
             RoomMembership.user_id == current_user.id,
-            RoomMembership.is_active == True,
-            StudyRoom.is_active == True
-        ).all()
+            RoomMembership.is_active == True
+        ).exists()
         
-        # Combine and deduplicate rooms
-        all_rooms = list({room.id: room for room in (public_rooms + owned_rooms + member_rooms)}.values())
+        # Public, owned and joined rooms in one query
+        query = StudyRoom.query.filter(
+            StudyRoom.is_active == True,
+            or_(StudyRoom.is_private == False, StudyRoom.owner_id == current_user.id, is_member)
+        )
+        query = _filter_subject(query, request.args.get('subject'))
         
-        return jsonify({
-            'rooms': [room.to_dict() for room in all_rooms]
-        }), 200
+        return jsonify(_room_page(query, page, per_page)), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch rooms'}), 500
+
+@room_bp.route('/rooms/public', methods=['GET'])
+@token_required
+def get_public_rooms(current_user):
+    """Get the public room directory"""
+    try:
+        page, per_page = _pagination_args()
+        subject = (request.args.get('subject') or '').strip().lower()
+        
+        def load_page():
+            query = StudyRoom.query.filter(StudyRoom.is_active == True, StudyRoom.is_private == False)
+            return _room_page(_filter_subject(query, subject), page, per_page)
+        
+        return jsonify(public_rooms_cache.get_or_set((subject, page, per_page), load_page)), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch rooms'}), 500
@@ -45,7 +117,7 @@ def create_room(current_user):
             return jsonify({'error': 'No data provided'}), 400
         
         # Sanitize input
-        data = sanitize_input(data)
+        data = sanitize_input(data, ROOM_HTML_FIELDS)
         
         # Validate required fields
         if not data.get('name'):
@@ -58,7 +130,8 @@ def create_room(current_user):
             subject=data.get('subject', ''),
             owner_id=current_user.id,
             max_participants=data.get('max_participants', 10),
-            is_private=data.get('is_private', False)
+            is_private=data.get('is_private', False),
+            active_member_count=1  # the owner
         )
         
         db.session.add(room)
@@ -73,6 +146,8 @@ def create_room(current_user):
         
         db.session.add(membership)
         db.session.commit()
+        public_rooms_cache.clear()
+        event_bus.publish(ROOM_CREATED, room.id, is_private=room.is_private)
         
         return jsonify({
             'message': 'Room created successfully',
@@ -120,6 +195,34 @@ def get_room(current_user, room_id):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch room'}), 500
 
+def _is_active_member(user_id, room_id):
+    return db.session.query(RoomMembership.id).filter_by(
+        user_id=user_id,
+        room_id=room_id,
+        is_active=True
+    ).first() is not None
+
+def _add_member(user_id, room_id):
+    """Take a seat and activate the user's membership in the current transaction.
+
+    The seat is claimed with a conditional UPDATE, so max_participants holds
+    under concurrent joins. Returns False if the room is full or inactive;
+    the caller commits or rolls back.
+    """
+    if not StudyRoom.claim_seat(room_id):
+        return False
+    
+    reactivated = db.session.execute(
+        update(RoomMembership)
+        .where(RoomMembership.user_id == user_id, RoomMembership.room_id == room_id,
+               RoomMembership.is_active == False)
+        .values(is_active=True, joined_at=datetime.utcnow())
+    ).rowcount
+    if not reactivated:
+        db.session.add(RoomMembership(user_id=user_id, room_id=room_id, role='member'))
+        db.session.flush()
+    return True
+
 @room_bp.route('/rooms/<int:room_id>/join', methods=['POST'])
 @token_required
 def join_room(current_user, room_id):
@@ -127,38 +230,28 @@ def join_room(current_user, room_id):
     try:
         room = StudyRoom.query.get_or_404(room_id)
         
-        if not room.can_join():
-            return jsonify({'error': 'Room is full or inactive'}), 400
-        
         # Check if already a member
-        existing_membership = RoomMembership.query.filter_by(
-            user_id=current_user.id,
-            room_id=room_id
-        ).first()
+        if _is_active_member(current_user.id, room_id):
+            return jsonify({'error': 'Already a member of this room'}), 400
         
-        if existing_membership:
-            if existing_membership.is_active:
-                return jsonify({'error': 'Already a member of this room'}), 400
-            else:
-                # Reactivate membership
-                existing_membership.is_active = True
-                existing_membership.joined_at = datetime.utcnow()
-        else:
-            # Create new membership
-            membership = RoomMembership(
-                user_id=current_user.id,
-                room_id=room_id,
-                role='member'
-            )
-            db.session.add(membership)
+        if not _add_member(current_user.id, room_id):
+            db.session.rollback()
+            return jsonify({'error': 'Room is full or inactive'}), 400
         
         db.session.commit()
+        public_rooms_cache.clear()
+        leaderboards.record_join(room.id, current_user)
+        announce(MEMBER_JOINED, room.id, user_id=current_user.id, username=current_user.username)
         
         return jsonify({
             'message': 'Successfully joined room',
             'room': room.to_dict()
         }), 200
         
+    except IntegrityError:
+        # A concurrent request from the same user created the membership first
+        db.session.rollback()
+        return jsonify({'error': 'Already a member of this room'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to join room'}), 500
@@ -180,8 +273,21 @@ def leave_room(current_user, room_id):
         if membership.role == 'owner':
             return jsonify({'error': 'Room owner cannot leave. Transfer ownership first.'}), 400
         
-        membership.is_active = False
+        left = db.session.execute(
+            update(RoomMembership)
+            .where(RoomMembership.id == membership.id, RoomMembership.is_active == True)
+            .values(is_active=False)
+        ).rowcount
+        if left:
+            StudyRoom.release_seat(room_id)
         db.session.commit()
+        public_rooms_cache.clear()
+        
+        # Membership is only checked when a socket connects, so drop open ones now
+        whiteboard_hub.disconnect_user(room_id, current_user.id)
+        presence.remove(room_id, current_user.id)
+        leaderboards.record_leave(room_id, current_user.id)
+        announce(MEMBER_LEFT, room_id, user_id=current_user.id, username=current_user.username)
         
         return jsonify({'message': 'Successfully left room'}), 200
         
@@ -198,46 +304,67 @@ def join_room_by_code(current_user):
         if not data or not data.get('room_code'):
             return jsonify({'error': 'Room code is required'}), 400
         
-        room_code = sanitize_input(data['room_code'])
-        room = StudyRoom.query.filter_by(room_code=room_code, is_active=True).first()
+        # Codes are matched exactly, so they are validated rather than HTML-sanitized
+        room_code = normalize_room_code(data['room_code'])
+        room_id = resolve_room_code(room_code) if room_code else None
+        room = db.session.get(StudyRoom, room_id) if room_id else None
         
         if not room:
             return jsonify({'error': 'Invalid room code'}), 404
         
-        if not room.can_join():
-            return jsonify({'error': 'Room is full or inactive'}), 400
-        
         # Check if already a member
-        existing_membership = RoomMembership.query.filter_by(
-            user_id=current_user.id,
-            room_id=room.id
-        ).first()
-        
-        if existing_membership and existing_membership.is_active:
+        if _is_active_member(current_user.id, room.id):
             return jsonify({'error': 'Already a member of this room'}), 400
         
-        if existing_membership:
-            existing_membership.is_active = True
-            existing_membership.joined_at = datetime.utcnow()
-        else:
-            membership = RoomMembership(
-                user_id=current_user.id,
-                room_id=room.id,
-                role='member'
-            )
-            db.session.add(membership)
+        if not _add_member(current_user.id, room.id):
+            db.session.rollback()
+            return jsonify({'error': 'Room is full or inactive'}), 400
         
         db.session.commit()
+        public_rooms_cache.clear()
+        leaderboards.record_join(room.id, current_user)
+        announce(MEMBER_JOINED, room.id, user_id=current_user.id, username=current_user.username)
         
         return jsonify({
             'message': 'Successfully joined room',
             'room': room.to_dict()
         }), 200
         
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Already a member of this room'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to join room'}), 500
 
+@room_bp.route('/rooms/<int:room_id>/presence', methods=['POST'])
+@token_required
+def heartbeat(current_user, room_id):
+    """Mark the user as online in a room and return who else is"""
+    try:
+        if not _is_active_member(current_user.id, room_id):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        presence.touch(room_id, current_user.id)
+        
+        return jsonify({'online': presence.online(room_id), 'ttl': presence.ttl}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to record presence'}), 500
+
+@room_bp.route('/rooms/<int:room_id>/presence', methods=['GET'])
+@token_required
+def get_presence(current_user, room_id):
+    """Get users currently online in a room"""
+    try:
+        if not _is_active_member(current_user.id, room_id):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        return jsonify({'online': presence.online(room_id), 'ttl': presence.ttl}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch presence'}), 500
+
 @room_bp.route('/rooms/<int:room_id>/whiteboard', methods=['GET'])
 @token_required
 def get_whiteboard(current_user, room_id):
@@ -255,9 +382,11 @@ def get_whiteboard(current_user, room_id):
         if not membership:
             return jsonify({'error': 'Access denied'}), 403
         
-        whiteboard_data = json.loads(room.whiteboard_data) if room.whiteboard_data else {}
+        whiteboard_data = whiteboard_hub.document(room_id)
+        if whiteboard_data is None:
+            whiteboard_data = load_whiteboard_state(room_id).document()
         
-        return jsonify({'whiteboard_data': whiteboard_data}), 200
+        return whiteboard_codec.make_response({'whiteboard_data': whiteboard_data})
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch whiteboard'}), 500
@@ -267,10 +396,19 @@ def get_whiteboard(current_user, room_id):
 def update_whiteboard(current_user, room_id):
     """Update whiteboard data"""
     try:
-        data = request.get_json()
-        if not data:
+        try:
+            data = whiteboard_codec.get_payload()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not isinstance(data, dict) or not data:
             return jsonify({'error': 'No data provided'}), 400
         
+        whiteboard_data = data.get('whiteboard_data', {})
+        try:
+            validate_document(whiteboard_data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         room = StudyRoom.query.get_or_404(room_id)
         
         # Check membership
@@ -283,9 +421,10 @@ def update_whiteboard(current_user, room_id):
         if not membership:
             return jsonify({'error': 'Access denied'}), 403
         
-        # Update whiteboard data
-        room.whiteboard_data = json.dumps(data.get('whiteboard_data', {}))
-        db.session.commit()
+        # Store the new board as a snapshot that later operations build on
+        state = replace_whiteboard_document(room_id, whiteboard_data)
+        whiteboard_hub.replace(room_id, state)
+        event_bus.publish(WHITEBOARD_REPLACED, room_id, document=state.document(), clock=state.clock)
         
         return jsonify({'message': 'Whiteboard updated successfully'}), 200
         
@@ -293,6 +432,121 @@ def update_whiteboard(current_user, room_id):
         db.session.rollback()
         return jsonify({'error': 'Failed to update whiteboard'}), 500
 
+def _read_socket_message(message):
+    """A whiteboard socket frame as a dict; raises TypeError or ValueError otherwise"""
+    if isinstance(message, (bytes, bytearray)):
+        message = whiteboard_codec.loads(message)
+    else:
+        message = json.loads(message)
+    if not isinstance(message, dict):
+        raise ValueError
+    return message
+
+def _receive_socket_token(ws):
+    """Token from the first frame, {"type": "auth", "token": ...}; None if it is missing or late"""
+    try:
+        message = _read_socket_message(ws.receive(timeout=WHITEBOARD_AUTH_TIMEOUT))
+    except (TypeError, ValueError):
+        return None
+    token = message.get('token') if message.get('type') == 'auth' else None
+    return token if isinstance(token, str) else None
+
+@sock.route('/rooms/<int:room_id>/whiteboard/ws', bp=room_bp)
+def whiteboard_socket(ws, room_id):
+    """Real-time whiteboard channel for a room.
+
+    Clients authenticate with an Authorization header or, since browsers
+    cannot set one, with a first message {"type": "auth", "token": ...};
+    tokens are not accepted in the URL, which ends up in access logs. Then
+    they send {"type": "ops", "ops": [...]} with add/update/delete/clear
+    operations and receive the operations of everyone else in the room.
+    Access is checked once, when the socket connects. With ?format=msgpack
+    messages travel as binary frames in the whiteboard_codec format.
+    """
+    binary = request.args.get('format') == 'msgpack' and whiteboard_codec.available()
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ')[1] if ' ' in auth_header else _receive_socket_token(ws)
+    current_user = get_user_from_token(token) if token else None
+    if not current_user:
+        ws.send(whiteboard_codec.dumps({'type': 'error', 'error': 'Invalid token'}, binary))
+        return
+    
+    room = db.session.get(StudyRoom, room_id)
+    membership = RoomMembership.query.filter_by(
+        user_id=current_user.id,
+        room_id=room_id,
+        is_active=True
+    ).first()
+    
+    if not room or not room.is_active or not membership:
+        ws.send(whiteboard_codec.dumps({'type': 'error', 'error': 'Access denied'}, binary))
+        return
+    
+    user_id = current_user.id
+    connection = whiteboard_hub.connect(room_id, ws, user_id, lambda: load_whiteboard_state(room_id), binary)
+    presence.touch(room_id, user_id)
+    
+    # Do not hold a database connection for the lifetime of the socket
+    db.session.close()
+    
+    try:
+        while True:
+            try:
+                message = _read_socket_message(ws.receive())
+            except (TypeError, ValueError):
+                connection.send({'type': 'error', 'error': 'Invalid message'})
+                continue
+            
+            if message.get('type') == 'ping':
+                presence.touch(room_id, user_id)
+                connection.send({'type': 'pong', 'online': presence.online(room_id)})
+                continue
+            
+            ops = message.get('ops') if message.get('type') == 'ops' else None
+            try:
+                if not isinstance(ops, list) or len(ops) > MAX_OPS_PER_MESSAGE:
+                    raise ValueError(f'Expected a list of at most {MAX_OPS_PER_MESSAGE} operations')
+                for op in ops:
+                    WhiteboardState.validate(op)
+            except ValueError as e:
+                connection.send({'type': 'error', 'error': str(e)})
+                continue
+            
+            try:
+                applied = whiteboard_hub.apply(room_id, connection, ops)
+            except ValueError as e:
+                connection.send({'type': 'error', 'error': str(e)})
+                continue
+            if applied:
+                append_whiteboard_operations(room_id, applied)
+                event_bus.publish(WHITEBOARD_OPS, room_id, ops=applied, user_id=user_id)
+    finally:
+        whiteboard_hub.disconnect(room_id, connection)
+
+def handle_room_event(event):
+    """Apply a room event published by another worker to this one"""
+    room_id = event['room_id']
+    event_type = event['type']
+    data = event['data']
+    if room_id is None:
+        return
+    
+    if event_type == WHITEBOARD_OPS:
+        whiteboard_hub.apply_remote(room_id, data['ops'], data.get('user_id'))
+        return
+    if event_type == WHITEBOARD_REPLACED:
+        whiteboard_hub.replace(room_id, WhiteboardState(data['document'], clock=data['clock']))
+        return
+    
+    if event_type in (ROOM_CREATED, MEMBER_JOINED, MEMBER_LEFT):
+        public_rooms_cache.clear()
+    if event_type == MEMBER_LEFT:
+        whiteboard_hub.disconnect_user(room_id, data['user_id'])
+        presence.remove(room_id, data['user_id'])
+    whiteboard_hub.notify(room_id, {'type': 'event', 'event': event_type, 'room_id': room_id, **data})
+
+event_bus.subscribe(handle_room_event)
+
 @room_bp.route('/rooms/<int:room_id>/sessions', methods=['POST'])
 @token_required
 def start_study_session(current_user, room_id):
@@ -359,10 +613,19 @@ def end_study_session(current_user, room_id, session_id):
         session.end_time = datetime.utcnow()
         session.duration_minutes = int((session.end_time - session.start_time).total_seconds() / 60)
         
-        # Update user's total study time
-        current_user.total_study_time += session.duration_minutes
+        # Update user's total study time; the cached user may be behind the row
+        db.session.execute(
+            update(User)
+            .where(User.id == current_user.id)
+            .values(total_study_time=func.coalesce(User.total_study_time, 0) + session.duration_minutes)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(current_user, ['total_study_time'])
+        invalidate_users([current_user.id])
+        record_study_session(session)
         
         db.session.commit()
+        leaderboards.record_study(current_user, room_id, session.duration_minutes)
         
         return jsonify({
             'message': 'Study session ended',
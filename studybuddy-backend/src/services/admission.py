@@ -0,0 +1,162 @@
+import math
+import os
+import threading
+import time
+from functools import wraps
+from flask import jsonify
+
+# Drop idle, fully refilled buckets after this many token takes
+PRUNE_EVERY = 1024
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over quota or concurrency limits"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class InMemoryAdmissionStore:
+    """Process-local admission state: token buckets and concurrency slots"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+        self._takes = 0
+
+    def take_tokens(self, key, cost, rate, burst, now):
+        """Take cost tokens from a bucket refilled at rate/s up to burst.
+
+        Returns 0 when granted, otherwise the seconds until enough tokens
+        will be available.
+        """
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))[:2]
+            tokens = min(burst, tokens + (now - updated) * rate)
+            granted = tokens >= cost
+            if granted:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, rate, burst)
+
+            self._takes += 1
+            if self._takes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+        return 0 if granted else (cost - tokens) / rate
+
+    def acquire_slot(self, key, limit):
+        with self._lock:
+            in_use = self._slots.get(key, 0)
+            if in_use >= limit:
+                return False
+            self._slots[key] = in_use + 1
+            return True
+
+    def release_slot(self, key):
+        with self._lock:
+            in_use = self._slots.get(key, 0) - 1
+            if in_use > 0:
+                self._slots[key] = in_use
+            else:
+                self._slots.pop(key, None)
+
+    def _prune(self, now):
+        idle = [key for key, (tokens, updated, rate, burst) in self._buckets.items()
+                if tokens + (now - updated) * rate >= burst]
+        for key in idle:
+            del self._buckets[key]
+
+class AdmissionController:
+    """Token-bucket quotas plus per-user and global concurrency limits.
+
+    Premium users get their own quota and concurrency settings. State lives
+    in a pluggable store so limits can be shared by several workers.
+    """
+
+    def __init__(self, store=None, max_concurrent=32, user_concurrent=2, premium_concurrent=4,
+                 per_minute=10, burst=20, premium_per_minute=30, premium_burst=60, busy_retry_after=1):
+        self.store = store or InMemoryAdmissionStore()
+        self.max_concurrent = max_concurrent
+        self.user_concurrent = user_concurrent
+        self.premium_concurrent = premium_concurrent
+        self.per_minute = per_minute
+        self.burst = burst
+        self.premium_per_minute = premium_per_minute
+        self.premium_burst = premium_burst
+        self.busy_retry_after = busy_retry_after
+        if min(burst, premium_burst) < 1 or min(per_minute, premium_per_minute) <= 0:
+            raise ValueError('Admission quotas need a burst of at least 1 and a positive rate')
+
+    def _check_cost(self, cost):
+        # A request costing more than a full bucket could never be admitted
+        if cost > min(self.burst, self.premium_burst):
+            raise ValueError(f'Request cost {cost} exceeds the quota burst '
+                             f'({self.burst}, premium {self.premium_burst})')
+
+    @classmethod
+    def from_env(cls, prefix='AI', store=None):
+        """Build a controller from <prefix>_* environment variables"""
+        def setting(name, default):
+            return int(os.environ.get(f'{prefix}_{name}', default))
+
+        return cls(
+            store=store,
+            max_concurrent=setting('MAX_CONCURRENT', 32),
+            user_concurrent=setting('MAX_CONCURRENT_PER_USER', 2),
+            premium_concurrent=setting('MAX_CONCURRENT_PER_PREMIUM_USER', 4),
+            per_minute=setting('QUOTA_PER_MINUTE', 10),
+            burst=setting('QUOTA_BURST', 20),
+            premium_per_minute=setting('PREMIUM_QUOTA_PER_MINUTE', 30),
+            premium_burst=setting('PREMIUM_QUOTA_BURST', 60)
+        )
+
+    def acquire(self, user, cost=1):
+        """Admit one request for user or raise AdmissionRejected"""
+        self._check_cost(cost)
+        premium = user.has_active_premium()
+        user_key = f'user:{user.id}'
+
+        if not self.store.acquire_slot('global', self.max_concurrent):
+            raise AdmissionRejected('Server is busy', self.busy_retry_after)
+
+        user_limit = self.premium_concurrent if premium else self.user_concurrent
+        if not self.store.acquire_slot(user_key, user_limit):
+            self.store.release_slot('global')
+            raise AdmissionRejected('Too many concurrent AI requests', self.busy_retry_after)
+
+        per_minute = self.premium_per_minute if premium else self.per_minute
+        burst = self.premium_burst if premium else self.burst
+        wait = self.store.take_tokens(user_key, cost, per_minute / 60.0, burst, time.time())
+        if wait:
+            self.release(user)
+            raise AdmissionRejected('AI request quota exceeded', math.ceil(wait))
+
+    def release(self, user):
+        self.store.release_slot(f'user:{user.id}')
+        self.store.release_slot('global')
+
+    def guard(self, cost=1):
+        """Decorator for token_required views: admit, run, then release.
+
+        Rejections become 429 responses with a Retry-After header. A cost
+        above the configured burst fails here, when the view is defined.
+        """
+        self._check_cost(cost)
+
+        def decorator(f):
+            @wraps(f)
+            def decorated(current_user, *args, **kwargs):
+                try:
+                    self.acquire(current_user, cost)
+                except AdmissionRejected as e:
+                    response = jsonify({'error': e.reason, 'retry_after': e.retry_after})
+                    response.headers['Retry-After'] = str(e.retry_after)
+                    return response, 429
+
+                try:
+                    return f(current_user, *args, **kwargs)
+                finally:
+                    self.release(current_user)
+            return decorated
+        return decorator
@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._generation = 0  # bumped by delete() and clear() so in-flight computations are not stored
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, generation=None, ttl=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            generation = self._generation
+            value = compute()
+            self.set(key, value, generation)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker coalescing is unavailable
+    fcntl = None
+
+# Sweep expired result files and idle lock files after this many leader runs
+SWEEP_EVERY = 100
+
+def make_key(*parts):
+    """Stable digest of JSON-serializable generation parameters"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    Within a process the first caller for a key runs the function while the
+    others wait on an event and receive the same result (or exception). When
+    lock_dir is set, the leader also takes an exclusive file lock so leaders
+    in other worker processes wait for it, and its result is written next to
+    the lock for result_ttl seconds so those workers can reuse it.
+    """
+
+    def __init__(self, lock_dir=None, result_ttl=10):
+        self.lock_dir = lock_dir if fcntl else None
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._runs = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, should_share=None):
+        """Run fn once for all concurrent callers of key and return its result.
+
+        should_share, if given, decides whether a result may be handed to
+        other workers (e.g. to avoid spreading a fallback error message).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.lock_dir:
+                call.result = self._run_locked(key, fn, should_share)
+            else:
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+    def in_flight(self):
+        """Number of keys currently being computed in this process"""
+        with self._lock:
+            return len(self._calls)
+
+    def _lock_file(self, path):
+        """Open and exclusively lock path, retrying if a sweep removed it while we waited"""
+        while True:
+            lock_file = open(path, 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _run_locked(self, key, fn, should_share):
+        base = os.path.join(self.lock_dir, key)
+        with self._lock_file(base + '.lock') as lock_file:
+            try:
+                cached = self._read_result(base + '.json')
+                if cached is not None:
+                    return cached['result']
+
+                result = fn()
+                if should_share is None or should_share(result):
+                    self._write_result(base + '.json', result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._maybe_sweep()
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'result': result}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            # Unshareable result: other workers simply compute their own
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _maybe_sweep(self):
+        with self._lock:
+            self._runs += 1
+            if self._runs % SWEEP_EVERY:
+                return
+
+        cutoff = time.time() - self.result_ttl
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if name.endswith('.json'):
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                elif name.endswith('.lock'):
+                    self._remove_idle_lock(path)
+            except OSError:
+                pass
+
+    def _remove_idle_lock(self, path):
+        # Only unlink a lock nobody holds, and while holding it; a waiter that
+        # opened it first notices in _lock_file and opens a fresh one
+        with open(path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                os.remove(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Room event types
+ROOM_CREATED = 'room.created'
+MEMBER_JOINED = 'member.joined'
+MEMBER_LEFT = 'member.left'
+WHITEBOARD_OPS = 'whiteboard.ops'
+WHITEBOARD_REPLACED = 'whiteboard.replaced'
+MEETING_CREATED = 'meeting.created'
+# Not tied to a room; published with room_id None
+USERS_CHANGED = 'users.changed'
+TOKEN_REVOKED = 'token.revoked'
+PRESENCE_SEEN = 'presence.seen'
+LEADERBOARD_UPDATED = 'leaderboard.updated'
+
+EVENT_TYPES = (ROOM_CREATED, MEMBER_JOINED, MEMBER_LEFT, WHITEBOARD_OPS, WHITEBOARD_REPLACED, MEETING_CREATED,
+               USERS_CHANGED, TOKEN_REVOKED, PRESENCE_SEEN,
+               LEADERBOARD_UPDATED)
+
+class InProcessTransport:
+    """Delivers messages synchronously to every bus attached to this object.
+
+    Several EventBus instances sharing one transport behave like workers
+    sharing a broker, which is handy for tests and single-process runs.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def start(self, callback):
+        with self._lock:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+
+    def publish(self, message):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(message)
+
+class SQLiteTransport:
+    """Messages appended to a shared SQLite file and polled by every worker.
+
+    Needs no extra service: all workers on one host open the same file. Each
+    worker starts reading at the newest message when it first subscribes,
+    and messages older than retention seconds are pruned.
+    """
+
+    def __init__(self, path, poll_interval=0.05, retention=300, batch_size=500):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._poller = None
+
+        connection = self._connect()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS bus_message ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        connection.close()
+
+        # Workers forked from a preloaded app need their own poller
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def publish(self, message):
+        self._connection().execute(
+            'INSERT INTO bus_message (payload, created_at) VALUES (?, ?)', (message, time.time())
+        )
+
+    def start(self, callback):
+        with self._lock:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll, name='event-bus-poll', daemon=True)
+                self._poller.start()
+
+    def _restart_in_child(self):
+        self._lock = threading.Lock()
+        self._poller = None
+        if self._callbacks:
+            self.start(self._callbacks[0])
+
+    def _poll(self):
+        connection = self._connect()
+        last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM bus_message').fetchone()[0]
+        polls = 0
+        while True:
+            try:
+                rows = connection.execute(
+                    'SELECT id, payload FROM bus_message WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, self.batch_size)
+                ).fetchall()
+                with self._lock:
+                    callbacks = list(self._callbacks)
+                for message_id, payload in rows:
+                    last_id = message_id
+                    for callback in callbacks:
+                        callback(payload)
+
+                polls += 1
+                if polls % 1000 == 0:
+                    connection.execute('DELETE FROM bus_message WHERE created_at < ?',
+                                       (time.time() - self.retention,))
+            except sqlite3.Error:
+                logger.exception('Event bus poll failed')
+                rows = None
+
+            if not rows or len(rows) < self.batch_size:
+                time.sleep(self.poll_interval)
+
+class EventBus:
+    """Room events published by any worker and delivered to every other one.
+
+    Handlers only see events from other processes: the worker that handled
+    a request has already applied its effects locally before publishing.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._instance = uuid.uuid4().hex[:12]
+        self._handlers = []
+
+    @property
+    def origin(self):
+        # Includes the pid so workers forked from one preloaded app stay distinct
+        return f'{self._instance}:{os.getpid()}'
+
+    def subscribe(self, handler):
+        """Call handler(event) for every event published by another worker"""
+        self._handlers.append(handler)
+        self.transport.start(self._dispatch)
+
+    def publish(self, event_type, room_id, **data):
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f'Unknown event type: {event_type}')
+        message = json.dumps({
+            'type': event_type,
+            'room_id': room_id,
+            'data': data,
+            'origin': self.origin,
+            'published_at': time.time()
+        })
+        try:
+            self.transport.publish(message)
+        except Exception:
+            # Other workers miss this event; the request itself has succeeded
+            logger.exception('Failed to publish %s for room %s', event_type, room_id)
+
+    def _dispatch(self, message):
+        event = json.loads(message)
+        if event.get('origin') == self.origin:
+            return
+        for handler in list(self._handlers):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception('Event handler failed for %s', event.get('type'))
+
+def get_event_bus():
+    """Build the bus selected by the EVENT_BUS_* environment variables.
+
+    The default 'memory' transport only reaches this process. Deployments
+    running more than one worker need EVENT_BUS_BACKEND=sqlite (all workers
+    on one host): without it the others miss room, leaderboard and cache
+    events, and see token revocations only through the refresh in
+    services/revocation.py.
+    """
+    backend = os.environ.get('EVENT_BUS_BACKEND', 'memory').lower()
+
+    if backend == 'memory':
+        return EventBus(InProcessTransport())
+    if backend == 'sqlite':
+        return EventBus(SQLiteTransport(
+            os.environ.get('EVENT_BUS_PATH', os.path.join(tempfile.gettempdir(), 'studybuddy-events.db')),
+            poll_interval=float(os.environ.get('EVENT_BUS_POLL_INTERVAL', 0.05)),
+            retention=int(os.environ.get('EVENT_BUS_RETENTION', 300))
+        ))
+    raise ValueError(f'Unknown EVENT_BUS_BACKEND: {backend}')
+
+event_bus = get_event_bus()
@@ -0,0 +1,95 @@
+import os
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, bindparam
+from src.extensions import db
+from src.models.ai_tutor import Flashcard
+
+# Spaced repetition parameters (days)
+BASE_INTERVAL_DAYS = int(os.environ.get('FLASHCARD_BASE_INTERVAL_DAYS', 2))
+MAX_INTERVAL_DAYS = int(os.environ.get('FLASHCARD_MAX_INTERVAL_DAYS', 30))
+MIN_INTERVAL_DAYS = 1
+
+# Rows loaded and written back per round trip
+RESCHEDULE_CHUNK_SIZE = int(os.environ.get('FLASHCARD_RESCHEDULE_CHUNK_SIZE', 5000))
+
+_UPDATE_NEXT_REVIEW = (
+    update(Flashcard.__table__)
+    .where(Flashcard.__table__.c.id == bindparam('card_id'))
+    .values(next_review=bindparam('next_review_at'))
+)
+
+def review_interval_days(correct_count, is_correct):
+    """Days until the next review of a single card"""
+    if not is_correct:
+        return MIN_INTERVAL_DAYS
+    return max(MIN_INTERVAL_DAYS, min(correct_count * BASE_INTERVAL_DAYS, MAX_INTERVAL_DAYS))
+
+def next_review_date(correct_count, is_correct, reviewed_at=None):
+    """Next review datetime of a single card"""
+    reviewed_at = reviewed_at or datetime.utcnow()
+    return reviewed_at + timedelta(days=review_interval_days(correct_count, is_correct))
+
+def compute_next_reviews(correct_counts, last_correct, last_reviewed,
+                         base_interval=BASE_INTERVAL_DAYS, max_interval=MAX_INTERVAL_DAYS):
+    """Vectorized form of review_interval_days for arrays of cards.
+
+    correct_counts is an integer array, last_correct a boolean array of
+    whether each card's latest review was correct, and last_reviewed a
+    datetime64 array, all of the same length. Returns the datetime64 array
+    of next review dates.
+    """
+    intervals = np.clip(correct_counts.astype(np.int64) * base_interval, MIN_INTERVAL_DAYS, max_interval)
+    intervals = np.where(last_correct, intervals, MIN_INTERVAL_DAYS)
+    return last_reviewed + intervals.astype('timedelta64[D]')
+
+def reschedule_flashcards(user_id=None, document_id=None, chunk_size=RESCHEDULE_CHUNK_SIZE,
+                          base_interval=BASE_INTERVAL_DAYS, max_interval=MAX_INTERVAL_DAYS):
+    """Recompute next_review for every reviewed card in chunks.
+
+    Cards are read with keyset pagination on the primary key, scheduled with
+    NumPy and written back with one executemany UPDATE per chunk, so memory
+    stays bounded by chunk_size. Returns the number of cards rescheduled.
+    """
+    query = select(
+        Flashcard.id,
+        func.coalesce(Flashcard.correct_count, 0),
+        # Cards reviewed before last_correct was stored keep the interval of a correct review
+        func.coalesce(Flashcard.last_correct, True),
+        Flashcard.last_reviewed
+    ).where(Flashcard.last_reviewed.isnot(None))
+
+    if user_id is not None:
+        query = query.where(Flashcard.user_id == user_id)
+    if document_id is not None:
+        query = query.where(Flashcard.document_id == document_id)
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            query.where(Flashcard.id > last_id).order_by(Flashcard.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        ids, correct_counts, last_correct, last_reviewed = zip(*rows)
+        next_reviews = compute_next_reviews(
+            np.array(correct_counts, dtype=np.int64),
+            np.array(last_correct, dtype=bool),
+            np.array(last_reviewed, dtype='datetime64[us]'),
+            base_interval=base_interval,
+            max_interval=max_interval
+        )
+
+        # Core executemany: one statement, no per-row ORM bookkeeping
+        db.session.execute(_UPDATE_NEXT_REVIEW, [
+            {'card_id': card_id, 'next_review_at': next_review}
+            for card_id, next_review in zip(ids, next_reviews.tolist())
+        ])
+        db.session.commit()
+
+        total += len(rows)
+        last_id = ids[-1]
+
+    return total
@@ -0,0 +1,407 @@
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import select, func
+from src.extensions import db
+from src.models.user import User
+from src.models.study_room import RoomMembership, StudyDailyRollup
+from src.services.events import event_bus, LEADERBOARD_UPDATED
+
+METRICS = ('streak', 'study_time')
+
+# Seconds a loaded board is trusted before it is reloaded, for writes no worker announced
+LEADERBOARD_TTL = int(os.environ.get('LEADERBOARD_TTL', 300))
+
+_MAX_LEVEL = 32
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # positions skipped by next[i]; to the end if next[i] is None
+
+class IndexableSkipList:
+    """Sorted keys with O(log n) insert, remove, rank and positional access"""
+
+    def __init__(self, seed=None):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._level = 1  # levels in use; the head's widths above it are stale
+        self._random = random.Random(seed)
+        self.size = 0
+
+    @classmethod
+    def from_sorted(cls, keys, seed=None):
+        """Build in O(n) from keys that are already in ascending order"""
+        skiplist = cls(seed)
+        last = [skiplist._head] * _MAX_LEVEL
+        last_positions = [0] * _MAX_LEVEL
+        position = 0
+        for key in keys:
+            position += 1
+            node = _Node(key, skiplist._random_level())
+            for i in range(len(node.next)):
+                last[i].next[i] = node
+                last[i].width[i] = position - last_positions[i]
+                last[i] = node
+                last_positions[i] = position
+            skiplist._level = max(skiplist._level, len(node.next))
+
+        for i in range(skiplist._level):
+            last[i].width[i] = position + 1 - last_positions[i]
+        skiplist.size = position
+        return skiplist
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < _MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _predecessors(self, key):
+        """Last node before key on every level, with its position (head is 0)"""
+        update = [self._head] * _MAX_LEVEL
+        positions = [0] * _MAX_LEVEL
+        node, position = self._head, 0
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i] = node
+            positions[i] = position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self._predecessors(key)
+        position = positions[0] + 1
+        node = _Node(key, self._random_level())
+        for i in range(self._level, len(node.next)):
+            self._head.width[i] = self.size + 1
+        self._level = max(self._level, len(node.next))
+
+        for i in range(len(node.next)):
+            previous = update[i]
+            node.next[i] = previous.next[i]
+            node.width[i] = previous.width[i] - (position - 1 - positions[i])
+            previous.next[i] = node
+            previous.width[i] = position - positions[i]
+        for i in range(len(node.next), self._level):
+            update[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update, _ = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(self._level):
+            previous = update[i]
+            if previous.next[i] is node:
+                previous.width[i] += node.width[i] - 1
+                previous.next[i] = node.next[i]
+            else:
+                previous.width[i] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """0-based position of key, or None if absent"""
+        update, positions = self._predecessors(key)
+        node = update[0].next[0]
+        return positions[0] if node is not None and node.key == key else None
+
+    def slice(self, start, count):
+        """Up to count keys from 0-based position start"""
+        target = start + 1
+        node, position = self._head, 0
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and position + node.width[i] <= target:
+                position += node.width[i]
+                node = node.next[i]
+        if position != target:
+            return []
+
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+class _SortedSet:
+    def __init__(self, scores=()):
+        self.scores = dict(scores)
+        self.ranking = IndexableSkipList.from_sorted(
+            sorted((-score, member) for member, score in self.scores.items())
+        )
+
+    def set(self, member, score):
+        current = self.scores.get(member)
+        if current == score:
+            return
+        if current is not None:
+            self.ranking.remove((-current, member))
+        self.scores[member] = score
+        self.ranking.insert((-score, member))
+
+    def remove(self, member):
+        current = self.scores.pop(member, None)
+        if current is not None:
+            self.ranking.remove((-current, member))
+
+class InMemorySortedSetStore:
+    """Process-local sorted sets: member -> score, ranked highest score first.
+
+    Ties are broken by member (lower id first). Another store with the same
+    methods (e.g. a Redis sorted-set adapter) can be swapped in.
+    """
+
+    def __init__(self):
+        self._sets = {}
+        self._lock = threading.Lock()
+
+    def exists(self, board):
+        return board in self._sets
+
+    def load(self, board, scores):
+        """Replace a whole board"""
+        sorted_set = _SortedSet(scores)
+        with self._lock:
+            self._sets[board] = sorted_set
+
+    def discard(self, board):
+        """Drop a whole board"""
+        with self._lock:
+            self._sets.pop(board, None)
+
+    def set_score(self, board, member, score):
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            if sorted_set is not None:
+                sorted_set.set(member, score)
+
+    def increment(self, board, member, amount):
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            if sorted_set is not None:
+                sorted_set.set(member, sorted_set.scores.get(member, 0) + amount)
+
+    def remove(self, board, member):
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            if sorted_set is not None:
+                sorted_set.remove(member)
+
+    def top(self, board, count, start=0):
+        """[(member, score)] from position start, highest score first"""
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            if sorted_set is None:
+                return []
+            return [(member, -negative_score) for negative_score, member in sorted_set.ranking.slice(start, count)]
+
+    def rank(self, board, member):
+        """(0-based rank, score) of a member, or None"""
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            if sorted_set is None or member not in sorted_set.scores:
+                return None
+            score = sorted_set.scores[member]
+            return sorted_set.ranking.rank((-score, member)), score
+
+    def size(self, board):
+        with self._lock:
+            sorted_set = self._sets.get(board)
+            return len(sorted_set.ranking) if sorted_set else 0
+
+class Leaderboards:
+    """Global and per-room rankings by streak and study time.
+
+    Boards are loaded from the database the first time they are read and
+    then kept current by the record_* hooks, each of which is an O(log n)
+    update of the boards already in memory. Every hook is also published
+    on the event bus and replayed by the other workers. A board is
+    reloaded once it is older than ttl seconds, which picks up writes no
+    worker announced (e.g. CLI backfills).
+    """
+
+    def __init__(self, store=None, ttl=LEADERBOARD_TTL):
+        self.store = store or InMemorySortedSetStore()
+        self.ttl = ttl
+        self._load_lock = threading.Lock()
+        # Request threads and event bus handlers update these together
+        self._members_lock = threading.Lock()
+        self._user_rooms = defaultdict(set)  # user id -> rooms with a loaded board
+        self._room_members = defaultdict(set)  # room id -> its users, the reverse of _user_rooms
+        self._loaded_at = {}  # board -> monotonic time it was loaded
+
+    def _fresh(self, board):
+        loaded_at = self._loaded_at.get(board)
+        return (loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+                and self.store.exists(board))
+
+    @staticmethod
+    def global_board(metric):
+        return f'global:{metric}'
+
+    @staticmethod
+    def room_board(room_id, metric):
+        return f'room:{room_id}:{metric}'
+
+    def global_ranking(self, metric):
+        board = self.global_board(metric)
+        if not self._fresh(board):
+            with self._load_lock:
+                if not self._fresh(board):
+                    column = User.streak_count if metric == 'streak' else User.total_study_time
+                    self.store.load(board, db.session.execute(
+                        select(User.id, func.coalesce(column, 0))
+                    ).all())
+                    self._loaded_at[board] = time.monotonic()
+        return board
+
+    def room_ranking(self, room_id, metric):
+        board = self.room_board(room_id, metric)
+        if not self._fresh(board):
+            with self._load_lock:
+                if not self._fresh(board):
+                    self._load_room(room_id)
+        return board
+
+    def _load_room(self, room_id):
+        members = db.session.execute(
+            select(User.id, func.coalesce(User.streak_count, 0))
+            .join(RoomMembership, RoomMembership.user_id == User.id)
+            .where(RoomMembership.room_id == room_id, RoomMembership.is_active == True)
+        ).all()
+        minutes = dict(db.session.execute(
+            select(StudyDailyRollup.user_id, func.sum(StudyDailyRollup.minutes))
+            .where(StudyDailyRollup.room_id == room_id)
+            .group_by(StudyDailyRollup.user_id)
+        ).all())
+
+        self.store.load(self.room_board(room_id, 'streak'), members)
+        self.store.load(self.room_board(room_id, 'study_time'),
+                        [(user_id, minutes.get(user_id, 0)) for user_id, _ in members])
+        with self._members_lock:
+            for user_id in self._room_members.pop(room_id, ()):
+                self._forget(user_id, room_id)
+            for user_id, _ in members:
+                self._user_rooms[user_id].add(room_id)
+                self._room_members[room_id].add(user_id)
+        loaded_at = time.monotonic()
+        for metric in METRICS:
+            self._loaded_at[self.room_board(room_id, metric)] = loaded_at
+
+    def _forget(self, user_id, room_id):
+        # Callers hold _members_lock
+        rooms = self._user_rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._user_rooms[user_id]
+
+    def _rooms_of(self, user_id):
+        with self._members_lock:
+            return set(self._user_rooms.get(user_id, ()))
+
+    def record_user(self, user):
+        """A new user enters the global boards"""
+        self._announce('user', user.id, user.streak_count or 0, user.total_study_time or 0)
+
+    def record_streak(self, user):
+        """user.streak_count changed"""
+        self._announce('streak', user.id, user.streak_count or 0)
+
+    def record_study(self, user, room_id, minutes):
+        """user studied minutes in a room; user.total_study_time is already updated"""
+        self._announce('study', user.id, user.total_study_time or 0, room_id, minutes)
+
+    def record_reaped(self, totals, studied):
+        """Sessions closed in bulk; totals is {user id: total_study_time}, studied [(user id, room id, minutes)]"""
+        self._announce('reaped', [[user_id, total or 0] for user_id, total in totals.items()],
+                       [list(entry) for entry in studied])
+
+    def record_join(self, room_id, user):
+        self._apply_join(room_id, user)
+        event_bus.publish(LEADERBOARD_UPDATED, None, hook='join', args=[room_id, user.id])
+
+    def record_leave(self, room_id, user_id):
+        self._announce('leave', room_id, user_id)
+
+    def _announce(self, hook, *args):
+        self._HOOKS[hook](self, *args)
+        event_bus.publish(LEADERBOARD_UPDATED, None, hook=hook, args=list(args))
+
+    def handle_event(self, event):
+        if event['type'] != LEADERBOARD_UPDATED:
+            return
+        hook, args = event['data']['hook'], event['data']['args']
+        if hook == 'join':
+            # The new member's room minutes need a query, which this thread cannot
+            # run; drop the room's boards so the next read reloads them
+            room_id = args[0]
+            for metric in METRICS:
+                self.store.discard(self.room_board(room_id, metric))
+                self._loaded_at.pop(self.room_board(room_id, metric), None)
+            return
+        self._HOOKS[hook](self, *args)
+
+    def _apply_user(self, user_id, streak, total):
+        self.store.set_score(self.global_board('streak'), user_id, streak)
+        self.store.set_score(self.global_board('study_time'), user_id, total)
+
+    def _apply_streak(self, user_id, streak):
+        self.store.set_score(self.global_board('streak'), user_id, streak)
+        for room_id in self._rooms_of(user_id):
+            self.store.set_score(self.room_board(room_id, 'streak'), user_id, streak)
+
+    def _apply_study(self, user_id, total, room_id, minutes):
+        self.store.set_score(self.global_board('study_time'), user_id, total)
+        if room_id in self._rooms_of(user_id):
+            self.store.increment(self.room_board(room_id, 'study_time'), user_id, minutes)
+
+    def _apply_reaped(self, totals, studied):
+        for user_id, total in totals:
+            self.store.set_score(self.global_board('study_time'), user_id, total)
+        for user_id, room_id, minutes in studied:
+            if room_id in self._rooms_of(user_id):
+                self.store.increment(self.room_board(room_id, 'study_time'), user_id, minutes)
+
+    def _apply_join(self, room_id, user):
+        if not self.store.exists(self.room_board(room_id, 'streak')):
+            return
+        minutes = db.session.execute(
+            select(func.coalesce(func.sum(StudyDailyRollup.minutes), 0))
+            .where(StudyDailyRollup.room_id == room_id, StudyDailyRollup.user_id == user.id)
+        ).scalar()
+        self.store.set_score(self.room_board(room_id, 'streak'), user.id, user.streak_count or 0)
+        self.store.set_score(self.room_board(room_id, 'study_time'), user.id, minutes)
+        with self._members_lock:
+            self._user_rooms[user.id].add(room_id)
+            self._room_members[room_id].add(user.id)
+
+    def _apply_leave(self, room_id, user_id):
+        for metric in METRICS:
+            self.store.remove(self.room_board(room_id, metric), user_id)
+        with self._members_lock:
+            self._forget(user_id, room_id)
+            members = self._room_members.get(room_id)
+            if members is not None:
+                members.discard(user_id)
+
+    _HOOKS = {
+        'user': _apply_user,
+        'streak': _apply_streak,
+        'study': _apply_study,
+        'reaped': _apply_reaped,
+        'leave': _apply_leave,
+    }
+
+leaderboards = Leaderboards()
+event_bus.subscribe(leaderboards.handle_event)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+DEFAULT_MODEL = 'gpt-3.5-turbo'
+
+class LLMError(Exception):
+    """Raised when a backend fails to produce a completion"""
+
+class LLMBackend(ABC):
+    """Interface for chat completion providers"""
+
+    model = DEFAULT_MODEL
+
+    @abstractmethod
+    def complete(self, messages, max_tokens=1000, temperature=0.7):
+        """Return the full completion text for a list of chat messages"""
+
+    def stream(self, messages, max_tokens=1000, temperature=0.7):
+        """Yield the completion as text chunks"""
+        yield self.complete(messages, max_tokens=max_tokens, temperature=temperature)
+
+class OpenAIBackend(LLMBackend):
+    """Any OpenAI-compatible chat completions API (OpenAI, vLLM, Ollama, ...)"""
+
+    def __init__(self, api_key=None, base_url=None, model=DEFAULT_MODEL, timeout=60):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import openai
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        timeout=self.timeout
+                    )
+        return self._client
+
+    def complete(self, messages, max_tokens=1000, temperature=0.7):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            raise LLMError(str(e)) from e
+
+    def stream(self, messages, max_tokens=1000, temperature=0.7):
+        try:
+            chunks = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise LLMError(str(e)) from e
+
+class FakeLLMBackend(LLMBackend):
+    """Deterministic in-process backend for offline development and load tests.
+
+    The response text depends only on the messages. Latency, per-token
+    streaming delay and failures are simulated; failures are drawn from a
+    seeded RNG so a run with the same seed fails on the same calls.
+    """
+
+    model = 'fake'
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, token_delay=0.0,
+                 failure_rate=0.0, response_words=60, seed=0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.response_words = response_words
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+
+    def complete(self, messages, max_tokens=1000, temperature=0.7):
+        self._simulate_call()
+        return self._render(messages)
+
+    def stream(self, messages, max_tokens=1000, temperature=0.7):
+        self._simulate_call()
+        for token in self._render(messages).split(' '):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield token + ' '
+
+    def _simulate_call(self):
+        with self._rng_lock:
+            self.calls += 1
+            jitter = self._rng.random() * self.latency_jitter
+            failed = self._rng.random() < self.failure_rate
+
+        if self.latency or jitter:
+            time.sleep(self.latency + jitter)
+        if failed:
+            raise LLMError('Simulated backend failure')
+
+    def _render(self, messages):
+        prompt = messages[-1]['content'] if messages else ''
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+
+        # Structured generations get structured answers so callers can parse them
+        if 'practice test' in prompt:
+            return json.dumps([
+                {'type': 'multiple_choice', 'question': f'Fake question {digest[:6]}?',
+                 'options': ['Alpha', 'Beta', 'Gamma', 'Delta'], 'answer': int(digest[0], 16) % 4,
+                 'explanation': 'Generated by the fake backend'},
+                {'type': 'true_false', 'question': 'The fake backend is deterministic.',
+                 'answer': True, 'explanation': 'Same input, same output'},
+                {'type': 'short_answer', 'question': 'Name the fake backend.',
+                 'answer': 'fake', 'explanation': 'It is called fake'}
+            ])
+        if 'flashcards' in prompt:
+            return json.dumps([
+                {'question': f'Fake flashcard {digest[i:i + 6]}?', 'answer': f'Answer {i}'}
+                for i in range(5)
+            ])
+
+        words = [digest[i % 56:i % 56 + 8] for i in range(self.response_words)]
+        return 'Fake response: ' + ' '.join(words)
+
+def get_llm_backend():
+    """Build the backend selected by the LLM_* environment variables"""
+    backend = os.environ.get('LLM_BACKEND', 'openai').lower()
+
+    if backend == 'fake':
+        return FakeLLMBackend(
+            latency=float(os.environ.get('FAKE_LLM_LATENCY', 0)),
+            latency_jitter=float(os.environ.get('FAKE_LLM_LATENCY_JITTER', 0)),
+            token_delay=float(os.environ.get('FAKE_LLM_TOKEN_DELAY', 0)),
+            failure_rate=float(os.environ.get('FAKE_LLM_FAILURE_RATE', 0)),
+            seed=int(os.environ.get('FAKE_LLM_SEED', 0))
+        )
+    if backend == 'openai':
+        return OpenAIBackend(
+            api_key=os.environ.get('LLM_API_KEY') or os.environ.get('OPENAI_API_KEY'),
+            base_url=os.environ.get('LLM_BASE_URL'),
+            model=os.environ.get('LLM_MODEL', DEFAULT_MODEL),
+            timeout=float(os.environ.get('LLM_TIMEOUT', 60))
+        )
+    raise ValueError(f'Unknown LLM_BACKEND: {backend}')
@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+import time
+from src.extensions import db
+
+logger = logging.getLogger(__name__)
+
+class _Job:
+    __slots__ = ('name', 'interval', 'fn', 'next_run')
+
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = time.monotonic() + interval
+
+class MaintenanceRunner:
+    """Runs periodic jobs on one background thread per process.
+
+    Each job runs inside an app context with its own database session; a
+    failing job is logged and retried at its next interval.
+    """
+
+    def __init__(self, tick=1.0):
+        self.tick = tick
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+
+        # Workers forked from a preloaded app need their own thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def add_job(self, name, interval, fn):
+        """Call fn() every interval seconds"""
+        with self._lock:
+            self._jobs.append(_Job(name, interval, fn))
+
+    def run_pending(self, app):
+        """Run the jobs that are due; returns their names"""
+        now = time.monotonic()
+        with self._lock:
+            due = [job for job in self._jobs if job.next_run <= now]
+        for job in due:
+            with app.app_context():
+                try:
+                    job.fn()
+                except Exception:
+                    logger.exception('Maintenance job %s failed', job.name)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            job.next_run = time.monotonic() + job.interval
+        return [job.name for job in due]
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, args=(app,), name='maintenance', daemon=True)
+            self._thread.start()
+
+    def _restart_in_child(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        if self._app is not None:
+            self.start(self._app)
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.tick)
+            self.run_pending(app)
+
+maintenance = MaintenanceRunner()
@@ -0,0 +1,65 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Werkzeug method string, e.g. 'scrypt', 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+# Hashes computed at once; 0 hashes inline on the request thread
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Requests allowed to wait for a worker before new ones are turned away
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+# Seconds a request waits for its hash before giving up
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+class HashingBusy(Exception):
+    """Too many password hashes are queued or the wait timed out; the client should retry later"""
+
+class PasswordHasher:
+    """Password hashing on a small dedicated pool.
+
+    Hashing is deliberately slow and CPU-bound. Running it on at most
+    `workers` threads keeps a burst of logins from taking every core away
+    from other requests, and at most `max_queue` requests wait for a worker.
+    Past that, hash() and verify() raise HashingBusy at once instead of
+    piling up.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_queue=PASSWORD_HASH_QUEUE, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='password-hash') if workers else None
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._prefix = None
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if a hash was made with other parameters than the configured method"""
+        if self._prefix is None:
+            # Werkzeug fills in default parameters, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+password_hasher = PasswordHasher()
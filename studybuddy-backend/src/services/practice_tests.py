@@ -0,0 +1,230 @@
+import json
+import re
+from datetime import datetime
+from sqlalchemy import update, bindparam, insert
+from src.extensions import db
+from src.models.ai_tutor import PracticeQuestion, PracticeAnswer
+
+TYPE_ALIASES = {
+    'multiple_choice': 'multiple_choice',
+    'multiple choice': 'multiple_choice',
+    'multiple-choice': 'multiple_choice',
+    'mcq': 'multiple_choice',
+    'mc': 'multiple_choice',
+    'true_false': 'true_false',
+    'true/false': 'true_false',
+    'true or false': 'true_false',
+    'true-false': 'true_false',
+    'tf': 'true_false',
+    'boolean': 'true_false',
+    'short_answer': 'short_answer',
+    'short answer': 'short_answer',
+    'short-answer': 'short_answer',
+    'short': 'short_answer',
+    'open': 'short_answer'
+}
+
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1'}
+FALSE_VALUES = {'false', 'f', 'no', 'n', '0'}
+
+# Format the model is asked to follow when generating a test
+QUESTION_FORMAT_INSTRUCTIONS = (
+    'Respond with only a JSON array. Each item must have "type" (one of "multiple_choice", '
+    '"true_false", "short_answer"), "question", "answer" and "explanation". Multiple choice '
+    'items also need an "options" array and their "answer" must be the zero-based index of '
+    'the correct option. True/false answers must be true or false. Short answers should be '
+    'a few words.'
+)
+
+_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+_LETTER_RE = re.compile(r'^\(?([A-Za-z])(?:[\).:]|$)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+class PracticeTestFormatError(ValueError):
+    """Raised when an AI response contains no usable questions"""
+
+def _extract_json(text):
+    """Find the first JSON array or object in an AI response"""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    decoder = json.JSONDecoder()
+    for index, char in enumerate(text):
+        if char in '[{':
+            try:
+                value, _ = decoder.raw_decode(text, index)
+                return value
+            except ValueError:
+                continue
+    raise PracticeTestFormatError('No JSON found in AI response')
+
+def _normalize_text(value):
+    return _WHITESPACE_RE.sub(' ', str(value)).strip().strip('.').casefold()
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    normalized = _normalize_text(value)
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    return None
+
+def _option_index(value, options):
+    """Resolve an index, letter or option text to an option index"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if 0 <= value < len(options) else None
+
+    # Option text wins over index-like strings such as "4"
+    text = str(value).strip()
+    normalized = _normalize_text(text)
+    for index, option in enumerate(options):
+        if _normalize_text(option) == normalized:
+            return index
+
+    if text.isdigit():
+        index = int(text)
+        return index if 0 <= index < len(options) else None
+
+    letter = _LETTER_RE.match(text)
+    if letter:
+        index = ord(letter.group(1).upper()) - ord('A')
+        return index if 0 <= index < len(options) else None
+    return None
+
+def _parse_question(item):
+    """Validate one raw question dict, returning normalized fields or None"""
+    if not isinstance(item, dict):
+        return None
+
+    prompt = item.get('question') or item.get('prompt') or item.get('text')
+    if not prompt or not isinstance(prompt, str):
+        return None
+
+    options = item.get('options') or item.get('choices')
+    if isinstance(options, dict):
+        options = [options[key] for key in sorted(options)]
+    answer = item.get('answer', item.get('correct_answer'))
+
+    question_type = TYPE_ALIASES.get(_normalize_text(item.get('type', '')))
+    if not question_type:
+        if options:
+            question_type = 'multiple_choice'
+        elif _to_bool(answer) is not None:
+            question_type = 'true_false'
+        else:
+            question_type = 'short_answer'
+
+    if question_type == 'multiple_choice':
+        if not isinstance(options, list) or len(options) < 2:
+            return None
+        options = [str(option) for option in options]
+        index = _option_index(answer, options)
+        if index is None:
+            return None
+        correct_answer = str(index)
+    elif question_type == 'true_false':
+        value = _to_bool(answer)
+        if value is None:
+            return None
+        options = None
+        correct_answer = 'true' if value else 'false'
+    else:
+        if answer is None or not str(answer).strip():
+            return None
+        options = None
+        correct_answer = str(answer).strip()
+
+    return {
+        'question_type': question_type,
+        'prompt': prompt.strip(),
+        'options': json.dumps(options) if options else None,
+        'correct_answer': correct_answer,
+        'explanation': item.get('explanation')
+    }
+
+def parse_practice_questions(ai_response, limit=None):
+    """Parse and validate AI output into question field dicts.
+
+    Invalid items are dropped. Raises PracticeTestFormatError when nothing
+    usable remains.
+    """
+    data = _extract_json(ai_response or '')
+    if isinstance(data, dict):
+        data = data.get('questions', [data])
+    if not isinstance(data, list):
+        raise PracticeTestFormatError('Expected a list of questions')
+
+    questions = [q for q in (_parse_question(item) for item in data) if q]
+    if limit is not None:
+        questions = questions[:limit]
+    if not questions:
+        raise PracticeTestFormatError('AI response contained no valid questions')
+    return questions
+
+def grade_answer(question, given):
+    """Check one submitted answer against a question's answer key"""
+    if given is None:
+        return False
+
+    if question.question_type == 'multiple_choice':
+        return _option_index(given, question.get_options()) == int(question.correct_answer)
+    if question.question_type == 'true_false':
+        value = _to_bool(given)
+        return value is not None and value == (question.correct_answer == 'true')
+    return _normalize_text(given) == _normalize_text(question.correct_answer)
+
+def submit_attempt(test, user_id, answers, time_taken=None):
+    """Grade a full attempt in one pass and record it.
+
+    answers maps question id (or position, when given as a list) to the
+    submitted answer. Inserts one PracticeAnswer per question, bumps each
+    question's running statistics and stores the score on the test. The
+    caller commits.
+    """
+    questions = test.test_questions
+    if isinstance(answers, list):
+        answers = {question.id: answers[i] for i, question in enumerate(questions) if i < len(answers)}
+    else:
+        answers = {int(key): value for key, value in answers.items()}
+
+    attempt = (test.attempt_count or 0) + 1
+    now = datetime.utcnow()
+    results = []
+    for question in questions:
+        given = answers.get(question.id)
+        results.append({
+            'question_id': question.id,
+            'answer': None if given is None else str(given),
+            'is_correct': grade_answer(question, given)
+        })
+
+    if results:
+        db.session.execute(insert(PracticeAnswer), [
+            {**result, 'test_id': test.id, 'user_id': user_id, 'attempt': attempt, 'answered_at': now}
+            for result in results
+        ])
+
+        # Running difficulty statistics, updated in place
+        db.session.execute(
+            update(PracticeQuestion.__table__)
+            .where(PracticeQuestion.__table__.c.id == bindparam('question_id'))
+            .values(
+                times_answered=PracticeQuestion.__table__.c.times_answered + 1,
+                times_correct=PracticeQuestion.__table__.c.times_correct + bindparam('correct_increment')
+            ),
+            [{'question_id': r['question_id'], 'correct_increment': int(r['is_correct'])} for r in results]
+        )
+
+    correct = sum(1 for result in results if result['is_correct'])
+    test.user_answers = json.dumps({str(r['question_id']): r['answer'] for r in results})
+    test.score = round(correct / len(results) * 100, 2) if results else 0.0
+    test.time_taken = time_taken
+    test.attempt_count = attempt
+    test.completed_at = now
+
+    return results
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import update, bindparam, or_
+from src.extensions import db
+from src.models.study_room import RoomMembership
+from src.services.events import event_bus, PRESENCE_SEEN
+
+# Seconds without a heartbeat before a user is no longer shown as online
+PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', 60))
+# Seconds between batched last_seen writes
+PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL', 30))
+# Seconds between sharing this worker's heartbeats with the others; keep well under the TTL
+PRESENCE_PUBLISH_INTERVAL = int(os.environ.get('PRESENCE_PUBLISH_INTERVAL', max(1, PRESENCE_TTL // 4)))
+
+_membership = RoomMembership.__table__
+_UPDATE_LAST_SEEN = (
+    update(_membership)
+    .where(
+        _membership.c.room_id == bindparam('member_room_id'),
+        _membership.c.user_id == bindparam('member_user_id'),
+        _membership.c.is_active == True,
+        or_(_membership.c.last_seen.is_(None), _membership.c.last_seen < bindparam('seen_at'))
+    )
+    .values(last_seen=bindparam('seen_at'))
+)
+
+class PresenceTracker:
+    """Who is online in each room, from heartbeats kept in memory.
+
+    Heartbeats only touch in-process dicts; last_seen is written to the
+    database in batches by flush(), which the maintenance runner calls every
+    flush_interval seconds. Other workers learn of a user's first heartbeat
+    in a room at once and of later ones in batches from publish(), both as
+    presence.seen events on the bus, so every worker lists users connected
+    to any of them. Leaving is shared through member.left.
+    """
+
+    def __init__(self, ttl=PRESENCE_TTL, flush_interval=PRESENCE_FLUSH_INTERVAL,
+                 publish_interval=PRESENCE_PUBLISH_INTERVAL):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.publish_interval = publish_interval
+        self._rooms = {}     # room id -> {user id: wall-clock time of last heartbeat}
+        self._dirty = {}     # (room id, user id) -> datetime to write to last_seen
+        self._outgoing = {}  # (room id, user id) -> heartbeat time not yet published
+        self._left = {}      # (room id, user id) -> time removed; older remote heartbeats are ignored
+        self._lock = threading.Lock()
+
+    def touch(self, room_id, user_id):
+        """Record a heartbeat"""
+        now = time.time()
+        with self._lock:
+            users = self._rooms.setdefault(room_id, {})
+            joined = users.get(user_id, 0) < now - self.ttl
+            users[user_id] = now
+            self._dirty[(room_id, user_id)] = datetime.utcnow()
+            self._left.pop((room_id, user_id), None)
+            if not joined:
+                self._outgoing[(room_id, user_id)] = now
+        if joined:
+            event_bus.publish(PRESENCE_SEEN, None, seen=[[room_id, user_id, now]])
+
+    def remove(self, room_id, user_id):
+        """Forget a user immediately (e.g. after leaving the room)"""
+        with self._lock:
+            self._rooms.get(room_id, {}).pop(user_id, None)
+            self._outgoing.pop((room_id, user_id), None)
+            self._left[(room_id, user_id)] = time.time()
+
+    def publish(self):
+        """Share heartbeats received since the last call with other workers; returns how many"""
+        with self._lock:
+            pending, self._outgoing = self._outgoing, {}
+        if pending:
+            event_bus.publish(PRESENCE_SEEN, None, seen=[
+                [room_id, user_id, seen] for (room_id, user_id), seen in pending.items()
+            ])
+        return len(pending)
+
+    def handle_event(self, event):
+        if event['type'] != PRESENCE_SEEN:
+            return
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for room_id, user_id, seen in event['data']['seen']:
+                if seen < cutoff or seen <= self._left.get((room_id, user_id), 0):
+                    continue
+                users = self._rooms.setdefault(room_id, {})
+                if seen > users.get(user_id, 0):
+                    users[user_id] = seen
+
+    def online(self, room_id):
+        """Users with a heartbeat in the last ttl seconds, most recent first"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            users = self._rooms.get(room_id)
+            if not users:
+                return []
+            expired = [user_id for user_id, seen in users.items() if seen < cutoff]
+            for user_id in expired:
+                del users[user_id]
+            if not users:
+                del self._rooms[room_id]
+                return []
+            now = time.time()
+            return [
+                {'user_id': user_id, 'seconds_ago': round(now - seen, 1)}
+                for user_id, seen in sorted(users.items(), key=lambda item: item[1], reverse=True)
+            ]
+
+    def flush(self):
+        """Write pending last_seen values in one batch; returns how many"""
+        with self._lock:
+            pending, self._dirty = self._dirty, {}
+            self._prune()
+        if not pending:
+            return 0
+
+        try:
+            db.session.execute(_UPDATE_LAST_SEEN, [
+                {'member_room_id': room_id, 'member_user_id': user_id, 'seen_at': seen_at}
+                for (room_id, user_id), seen_at in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Keep the values for the next flush unless newer ones arrived meanwhile
+            with self._lock:
+                for key, seen_at in pending.items():
+                    self._dirty.setdefault(key, seen_at)
+            raise
+        return len(pending)
+
+    def _prune(self):
+        # Rooms nobody asks about would otherwise keep their expired entries
+        cutoff = time.time() - self.ttl
+        for key in [key for key, left in self._left.items() if left < cutoff]:
+            del self._left[key]
+        for room_id in list(self._rooms):
+            users = self._rooms[room_id]
+            for user_id in [user_id for user_id, seen in users.items() if seen < cutoff]:
+                del users[user_id]
+            if not users:
+                del self._rooms[room_id]
+
+presence = PresenceTracker()
+event_bus.subscribe(presence.handle_event)
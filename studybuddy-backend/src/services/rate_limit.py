@@ -0,0 +1,243 @@
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from flask import request, jsonify
+from src.services.user_cache import decode_token
+
+logger = logging.getLogger(__name__)
+
+# Drop counters for windows that no longer count after this many hits
+PRUNE_EVERY = 1024
+
+_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def _sliding_wait(previous, current, limit, window, now):
+    """Seconds until one more request fits, or 0 if it fits now.
+
+    The count over the last window seconds is estimated from the current
+    fixed window plus the previous one, weighted by how much of it still
+    overlaps.
+    """
+    start = now // window * window
+    overlap = 1 - (now - start) / window
+    if previous * overlap + current + 1 <= limit:
+        return 0
+    if current + 1 <= limit:
+        # Fits once enough of the previous window has slid out
+        return start + window * (1 - (limit - 1 - current) / previous) - now
+    # Wait for the next window, then for this one to slide out far enough
+    return start + window * (2 - (limit - 1) / current) - now
+
+class InMemoryRateLimitStore:
+    """Process-local sliding-window counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [window index, count in it, count in the window before, window]
+        self._hits = 0
+
+    def hit(self, entries, now):
+        """Count a request against each (key, limit, window) if all admit it; returns 0 or seconds to wait"""
+        with self._lock:
+            waits = []
+            counters = []
+            for key, limit, window in entries:
+                index = now // window
+                counter = self._counters.get(key)
+                if counter is None or counter[0] < index - 1:
+                    counter = self._counters[key] = [index, 0, 0, window]
+                elif counter[0] < index:
+                    counter[:3] = [index, 0, counter[1]]
+                waits.append(_sliding_wait(counter[2], counter[1], limit, window, now))
+                counters.append(counter)
+
+            wait = max(waits, default=0)
+            if not wait:
+                for counter in counters:
+                    counter[1] += 1
+
+            self._hits += 1
+            if self._hits % PRUNE_EVERY == 0:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        idle = [key for key, (index, current, previous, window) in self._counters.items()
+                if index < now // window - 1]
+        for key in idle:
+            del self._counters[key]
+
+class SQLiteRateLimitStore:
+    """Sliding-window counters in a SQLite file shared by every worker on the host.
+
+    Like the SQLite event bus transport, this needs no extra service. Each
+    hit is one short write transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+
+        connection = self._connect()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_window ('
+            'key TEXT NOT NULL, window_index INTEGER NOT NULL, count INTEGER NOT NULL, expires_at REAL NOT NULL, '
+            'PRIMARY KEY (key, window_index)) WITHOUT ROWID'
+        )
+        connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def hit(self, entries, now):
+        """Count a request against each (key, limit, window) if all admit it; returns 0 or seconds to wait"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            waits = []
+            for key, limit, window in entries:
+                index = int(now // window)
+                counts = dict(connection.execute(
+                    'SELECT window_index, count FROM rate_limit_window WHERE key = ? AND window_index >= ?',
+                    (key, index - 1)
+                ).fetchall())
+                waits.append(_sliding_wait(counts.get(index - 1, 0), counts.get(index, 0), limit, window, now))
+
+            wait = max(waits, default=0)
+            if not wait:
+                connection.executemany(
+                    'INSERT INTO rate_limit_window (key, window_index, count, expires_at) VALUES (?, ?, 1, ?) '
+                    'ON CONFLICT (key, window_index) DO UPDATE SET count = count + 1',
+                    [(key, int(now // window), (int(now // window) + 2) * window) for key, limit, window in entries]
+                )
+            self._hits += 1
+            if self._hits % PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM rate_limit_window WHERE expires_at < ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+def get_rate_limit_store():
+    """Build the store selected by the RATE_LIMIT_* environment variables"""
+    backend = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+
+    if backend == 'memory':
+        return InMemoryRateLimitStore()
+    if backend == 'sqlite':
+        return SQLiteRateLimitStore(
+            os.environ.get('RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'studybuddy-rate-limits.db'))
+        )
+    raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+
+def client_ip():
+    """Address the request came from (use ProxyFix behind a reverse proxy)"""
+    return request.remote_addr
+
+def token_user():
+    """User id from the bearer token, without loading the user; None without a valid token"""
+    auth_header = request.headers.get('Authorization', '')
+    parts = auth_header.split(" ")
+    if len(parts) < 2:
+        return None
+    try:
+        return decode_token(parts[1]).get('user_id')
+    except Exception:
+        return None
+
+def json_field(name):
+    """Key function returning a string field of the JSON body, lower-cased"""
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        return value.strip().lower() if isinstance(value, str) and value.strip() else None
+    return key
+
+class RateLimit:
+    """At most limit requests per window seconds for each key; requests without a key are not counted"""
+
+    def __init__(self, limit, window, key_func, name):
+        if limit < 1 or window <= 0:
+            raise ValueError(f'Rate limit {name} must allow at least one request per window')
+        self.limit = limit
+        self.window = window
+        self.key_func = key_func
+        self.name = name
+
+    @classmethod
+    def parse(cls, rate, key_func, name):
+        """Build a limit from a string such as '5/minute' or '100/hour'"""
+        count, unit = rate.split('/')
+        unit = unit.strip().lower().rstrip('s')
+        if unit not in _UNITS:
+            raise ValueError(f'Unknown rate limit unit: {rate}')
+        return cls(int(count), _UNITS[unit], key_func, name)
+
+class RateLimiter:
+    """Per-endpoint sliding-window limits, checked before a blueprint's views run.
+
+    Over-limit requests get a 429 response with a Retry-After header. If the
+    store fails, requests are let through and the error is logged.
+    """
+
+    def __init__(self, store=None, enabled=True):
+        self.store = store or InMemoryRateLimitStore()
+        self.enabled = enabled
+        self._limits = {}  # endpoint -> [RateLimit]
+        self._blueprints = set()
+
+    def limit(self, blueprint, limits):
+        """Apply limits to a blueprint, given as {view function name: [RateLimit, ...]}"""
+        for endpoint, rules in limits.items():
+            self._limits[f'{blueprint.name}.{endpoint}'] = list(rules)
+        if blueprint.name not in self._blueprints:
+            self._blueprints.add(blueprint.name)
+            blueprint.before_request(self.check)
+
+    def check(self):
+        """before_request hook: None to continue, or a 429 response"""
+        endpoint = request.endpoint
+        rules = self._limits.get(endpoint)
+        if not rules or not self.enabled or request.method == 'OPTIONS':
+            return None
+
+        # Every limit must admit the request before any of them counts it
+        entries = []
+        for rule in rules:
+            key = rule.key_func()
+            if key is not None:
+                entries.append((f'{endpoint}:{rule.name}:{key}', rule.limit, rule.window))
+        if not entries:
+            return None
+        try:
+            wait = self.store.hit(entries, time.time())
+        except Exception:
+            logger.exception('Rate limit check failed for %s', endpoint)
+            return None
+        if wait:
+            retry_after = max(1, math.ceil(wait))
+            response = jsonify({'error': 'Too many requests, please try again later', 'retry_after': retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        return None
+
+rate_limiter = RateLimiter(
+    get_rate_limit_store(),
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+)
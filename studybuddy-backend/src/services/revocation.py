@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, exists
+from sqlalchemy.exc import IntegrityError
+from src.extensions import db
+from src.models.user import RevokedToken
+from src.services.events import event_bus, TOKEN_REVOKED
+
+logger = logging.getLogger(__name__)
+
+# Revoked, unexpired tokens the filter is sized for; it grows past this on the next sync
+TOKEN_REVOCATION_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_CAPACITY', 10000))
+# Share of unrevoked tokens that still need a database lookup
+TOKEN_REVOCATION_ERROR_RATE = float(os.environ.get('TOKEN_REVOCATION_ERROR_RATE', 0.001))
+# Seconds between rebuilding the filter from the database and purging expired entries
+TOKEN_REVOCATION_SYNC_INTERVAL = int(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 300))
+# Seconds a worker may go without reading revocations other workers committed
+TOKEN_REVOCATION_REFRESH_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_REFRESH_INTERVAL', 1))
+
+# Each refresh re-reads this much before the previous one, for rows committed
+# a little after the revoked_at their worker stamped on them
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+class BloomFilter:
+    """Set membership with no false negatives and about error_rate false positives"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class TokenRevocations:
+    """Revoked token ids, stored in the database and mirrored into a Bloom filter per worker.
+
+    is_revoked() answers from memory for any token the filter has never
+    seen, which is nearly every request; only filter hits are checked in
+    the database. Every worker must see every revocation, so the filter
+    does not rely on the event bus alone, whose default 'memory' transport
+    stays inside one process: at most every refresh_interval seconds
+    is_revoked() also reads the revocations committed since its last look.
+    sync() rebuilds the filter from the table, and expired entries drop
+    out of both.
+    """
+
+    def __init__(self, capacity=TOKEN_REVOCATION_CAPACITY, error_rate=TOKEN_REVOCATION_ERROR_RATE,
+                 refresh_interval=TOKEN_REVOCATION_REFRESH_INTERVAL):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self._filter = None  # loaded on first use
+        self._pending = None  # ids added while a rebuild is reading the table
+        self._refreshed_at = None  # monotonic time of the last read of the table
+        self._refreshed_since = None  # revoked_at the next refresh reads from
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._pending is not None:
+                self._pending.append(jti)
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            now = datetime.utcnow()
+            jtis = db.session.execute(select(RevokedToken.jti).where(RevokedToken.expires_at > now)).scalars().all()
+            bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            with self._lock:
+                for jti in self._pending:
+                    bloom.add(jti)
+                self._filter = bloom
+                self._refreshed_since = now - REFRESH_OVERLAP
+                self._refreshed_at = time.monotonic()
+            return len(jtis)
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _loaded_filter(self):
+        bloom = self._filter
+        if bloom is None:
+            with self._load_lock:
+                if self._filter is None:
+                    self._rebuild()
+                bloom = self._filter
+        return bloom
+
+    def _refresh(self):
+        """Add revocations other workers committed since the last read"""
+        refreshed_at = self._refreshed_at
+        if refreshed_at is not None and time.monotonic() - refreshed_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # another thread is reading them
+        try:
+            now = datetime.utcnow()
+            for jti in db.session.execute(
+                select(RevokedToken.jti).where(RevokedToken.revoked_at >= self._refreshed_since)
+            ).scalars():
+                self._add(jti)
+            with self._lock:
+                self._refreshed_since = now - REFRESH_OVERLAP
+                self._refreshed_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def is_revoked(self, jti):
+        """True if the token id was revoked; tokens without one cannot be"""
+        if not jti:
+            return False
+        self._loaded_filter()
+        self._refresh()
+        if jti not in self._filter:
+            return False
+        return db.session.execute(select(exists().where(
+            RevokedToken.jti == jti, RevokedToken.expires_at > datetime.utcnow()
+        ))).scalar()
+
+    def revoke(self, jti, user_id, expires_at):
+        """Stop accepting a token before expires_at (a datetime or a JWT exp timestamp); commits"""
+        if not isinstance(expires_at, datetime):
+            expires_at = datetime.utcfromtimestamp(expires_at)
+        if expires_at <= datetime.utcnow():
+            return
+        db.session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # already revoked
+        self._add(jti)
+        event_bus.publish(TOKEN_REVOKED, None, jti=jti)
+
+    def sync(self):
+        """Delete expired entries and rebuild the filter from the table"""
+        result = db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+        db.session.commit()
+        active = self._rebuild()
+        if result.rowcount:
+            logger.info('Purged %d expired token revocations, %d active', result.rowcount, active)
+        return active
+
+    def handle_event(self, event):
+        if event['type'] == TOKEN_REVOKED:
+            self._add(event['data']['jti'])
+
+token_revocations = TokenRevocations()
+event_bus.subscribe(token_revocations.handle_event)
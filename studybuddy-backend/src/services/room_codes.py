@@ -0,0 +1,50 @@
+import os
+import re
+from sqlalchemy import event, inspect
+from src.extensions import db
+from src.models.study_room import StudyRoom
+from src.services.cache import TTLCache
+
+# Room codes are generated as 8 upper-case hex characters; the column allows 10
+_ROOM_CODE_RE = re.compile(r'^[A-Z0-9-]{1,10}$')
+
+# Unknown codes are remembered briefly so retries of a typo do not hit the database
+INVALID_CODE_TTL = int(os.environ.get('ROOM_CODE_INVALID_TTL', 30))
+
+room_code_cache = TTLCache(
+    ttl=int(os.environ.get('ROOM_CODE_CACHE_TTL', 300)),
+    max_entries=int(os.environ.get('ROOM_CODE_CACHE_SIZE', 10000))
+)
+
+def normalize_room_code(value):
+    """Canonical form of a user-typed room code, or None if it cannot be one"""
+    if not isinstance(value, str):
+        return None
+    code = value.strip().upper()
+    return code if _ROOM_CODE_RE.match(code) else None
+
+def resolve_room_code(code):
+    """Id of the active room with this normalized code, or None"""
+    missing = object()
+    room_id = room_code_cache.get(code, missing)
+    if room_id is missing:
+        room_id = db.session.query(StudyRoom.id).filter_by(room_code=code, is_active=True).scalar()
+        room_code_cache.set(code, room_id, ttl=None if room_id else INVALID_CODE_TTL)
+    return room_id
+
+@event.listens_for(StudyRoom, 'after_insert')
+def _forget_new_code(mapper, connection, room):
+    # A new room may reuse a code that was cached as invalid
+    room_code_cache.delete(room.room_code)
+
+@event.listens_for(StudyRoom, 'after_update')
+def _forget_changed_code(mapper, connection, room):
+    history = inspect(room).attrs.room_code.history
+    for code in (history.deleted or ()):
+        room_code_cache.delete(code)
+    if not room.is_active:
+        room_code_cache.delete(room.room_code)
+
+@event.listens_for(StudyRoom, 'after_delete')
+def _forget_deleted_code(mapper, connection, room):
+    room_code_cache.delete(room.room_code)
@@ -0,0 +1,7 @@
+from src.services.events import event_bus
+from src.services.whiteboard import whiteboard_hub
+
+def announce(event_type, room_id, **data):
+    """Tell this worker's sockets in a room about an event and publish it to the others"""
+    whiteboard_hub.notify(room_id, {'type': 'event', 'event': event_type, 'room_id': room_id, **data})
+    event_bus.publish(event_type, room_id, **data)
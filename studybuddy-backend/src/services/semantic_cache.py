@@ -0,0 +1,144 @@
+import re
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+
+class HashingVectorizer:
+    """Local text embedding: signed feature hashing of words and word pairs.
+
+    Uses crc32 rather than hash() so vectors are identical across processes.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def embed(self, text):
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class _ScopeIndex:
+    """Fixed-capacity embedding matrix for one scope, with LRU slot reuse"""
+
+    def __init__(self, capacity, dim):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers = [None] * capacity
+        self.entry_ids = [None] * capacity
+        self.lru = OrderedDict()  # slot -> None, least recently used first
+
+    def search(self, vector):
+        if not self.lru:
+            return None, 0.0
+        similarities = self.vectors @ vector
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+
+    def free_slot(self):
+        """Return an unused slot, evicting the least recently used if full"""
+        if len(self.lru) < len(self.answers):
+            return next(i for i, entry_id in enumerate(self.entry_ids) if entry_id is None), None
+        slot, _ = self.lru.popitem(last=False)
+        return slot, self.entry_ids[slot]
+
+    def clear_slot(self, slot):
+        self.vectors[slot] = 0.0
+        self.answers[slot] = None
+        self.entry_ids[slot] = None
+        self.lru.pop(slot, None)
+
+class SemanticCache:
+    """Answer cache keyed by question similarity within a scope.
+
+    Each scope (a document or room) holds up to max_entries questions as
+    unit vectors; a lookup is one matrix-vector product. Entries and whole
+    scopes are evicted least recently used first. A hit that a user reports
+    as wrong counts as a false hit and is evicted.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=256, max_scopes=1024, dim=512):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.vectorizer = HashingVectorizer(dim)
+        self._scopes = OrderedDict()
+        self._entries = {}  # entry_id -> (scope, slot)
+        self._next_id = 0
+        self._id_prefix = uuid.uuid4().hex[:8]  # ids stay unique across workers
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+
+    def lookup(self, scope, question):
+        """Return (entry_id, answer, similarity) for a close enough question, else None"""
+        vector = self.vectorizer.embed(question)
+        with self._lock:
+            index = self._scopes.get(scope)
+            slot, similarity = index.search(vector) if index else (None, 0.0)
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._scopes.move_to_end(scope)
+            index.lru.move_to_end(slot)
+            return index.entry_ids[slot], index.answers[slot], similarity
+
+    def store(self, scope, question, answer):
+        """Cache an answer and return its entry id"""
+        vector = self.vectorizer.embed(question)
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                if len(self._scopes) >= self.max_scopes:
+                    _, evicted = self._scopes.popitem(last=False)
+                    for entry_id in evicted.entry_ids:
+                        self._entries.pop(entry_id, None)
+                index = self._scopes[scope] = _ScopeIndex(self.max_entries, self.vectorizer.dim)
+            self._scopes.move_to_end(scope)
+
+            slot, evicted_id = index.free_slot()
+            self._entries.pop(evicted_id, None)
+
+            self._next_id += 1
+            entry_id = f'{self._id_prefix}-{self._next_id}'
+            index.vectors[slot] = vector
+            index.answers[slot] = answer
+            index.entry_ids[slot] = entry_id
+            index.lru[slot] = None
+            self._entries[entry_id] = (scope, slot)
+            return entry_id
+
+    def report_false_hit(self, entry_id):
+        """Record that a cached answer did not fit the question and drop it"""
+        with self._lock:
+            location = self._entries.pop(entry_id, None)
+            if location:
+                self.false_hits += 1
+                scope, slot = location
+                self._scopes[scope].clear_slot(slot)
+            return location is not None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'false_hits': self.false_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'false_hit_rate': self.false_hits / self.hits if self.hits else 0.0,
+                'entries': len(self._entries),
+                'scopes': len(self._scopes)
+            }
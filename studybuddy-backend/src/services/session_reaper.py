@@ -0,0 +1,88 @@
+import os
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, bindparam, func
+from src.extensions import db
+from src.models.user import User
+from src.models.study_room import StudySession
+from src.services.study_rollups import record_sessions
+from src.services.leaderboard import leaderboards
+from src.services.user_cache import invalidate_users
+
+# Hours a session may stay open before it is treated as abandoned
+STALE_SESSION_HOURS = int(os.environ.get('STUDY_SESSION_STALE_HOURS', 12))
+# Minutes credited for an abandoned session, however long it was left open
+REAPED_SESSION_MINUTES = int(os.environ.get('STUDY_SESSION_REAPED_MINUTES', 60))
+# Sessions closed per transaction
+REAP_BATCH_SIZE = 500
+
+_session = StudySession.__table__
+_CLOSE_SESSION = (
+    update(_session)
+    .where(_session.c.id == bindparam('session_id'), _session.c.end_time.is_(None))
+    .values(end_time=bindparam('closed_at'), duration_minutes=bindparam('minutes'))
+)
+
+def _reap_batch(cutoff, minutes, batch_size):
+    rows = db.session.execute(
+        select(StudySession.id, StudySession.user_id, StudySession.room_id, StudySession.start_time)
+        .where(StudySession.end_time.is_(None), StudySession.start_time < cutoff)
+        .order_by(StudySession.start_time)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return []
+
+    session_ids = [row.id for row in rows]
+    # Credit users first, counting only sessions still open: this takes the
+    # write lock, so a session ended meanwhile is neither credited twice nor
+    # closed again below
+    still_open = select(func.count(StudySession.id)).where(
+        StudySession.user_id == User.id,
+        StudySession.id.in_(session_ids),
+        StudySession.end_time.is_(None)
+    ).scalar_subquery()
+    db.session.execute(
+        update(User)
+        .where(User.id.in_({row.user_id for row in rows}))
+        .values(total_study_time=func.coalesce(User.total_study_time, 0) + still_open * minutes)
+        .execution_options(synchronize_session=False)
+    )
+    invalidate_users({row.user_id for row in rows})
+
+    reaped = []
+    for row in rows:
+        closed_at = row.start_time + timedelta(minutes=minutes)
+        if db.session.execute(_CLOSE_SESSION, {
+            'session_id': row.id, 'closed_at': closed_at, 'minutes': minutes
+        }).rowcount:
+            reaped.append((row.user_id, row.room_id, row.start_time, closed_at))
+
+    record_sessions(reaped)
+    db.session.commit()
+    return reaped
+
+def reap_stale_sessions(stale_hours=STALE_SESSION_HOURS, minutes=REAPED_SESSION_MINUTES,
+                        batch_size=REAP_BATCH_SIZE):
+    """Close sessions left open longer than stale_hours, crediting each a capped duration.
+
+    Returns (sessions closed, minutes credited).
+    """
+    minutes = min(minutes, stale_hours * 60)
+    cutoff = datetime.utcnow() - timedelta(hours=stale_hours)
+    reaped = []
+    while True:
+        batch = _reap_batch(cutoff, minutes, batch_size)
+        reaped.extend(batch)
+        if len(batch) < batch_size:
+            break
+
+    if reaped:
+        totals = dict(db.session.execute(
+            select(User.id, User.total_study_time)
+            .where(User.id.in_({user_id for user_id, _, _, _ in reaped}))
+        ).all())
+        leaderboards.record_reaped(totals, [(user_id, room_id, minutes) for user_id, room_id, _, _ in reaped])
+        current_app.logger.info('Closed %d stale study sessions, crediting %d minutes to %d users',
+                                len(reaped), len(reaped) * minutes, len(totals))
+    return len(reaped), len(reaped) * minutes
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, delete, func
+from src.extensions import db
+from src.models.study_room import StudySession, StudyDailyRollup
+
+# Longest study streak reported; bounds the streak query
+MAX_STREAK_DAYS = 366
+
+# Sessions read per round trip by the backfill
+BACKFILL_BATCH_SIZE = 5000
+
+def split_minutes_by_day(start_time, end_time):
+    """Spread a session over the UTC days it covers.
+
+    Returns [(day, minutes), ...]. Minutes are cut at whole-minute
+    boundaries from the start, so they add up to the session's
+    duration_minutes even when it crosses midnight.
+    """
+    total_seconds = (end_time - start_time).total_seconds()
+    if total_seconds <= 0:
+        return [(start_time.date(), 0)]
+
+    days = []
+    counted = 0
+    day_start = start_time
+    while day_start < end_time:
+        next_midnight = datetime.combine(day_start.date() + timedelta(days=1), datetime.min.time())
+        day_end = min(next_midnight, end_time)
+        elapsed_minutes = int((day_end - start_time).total_seconds() / 60)
+        days.append((day_start.date(), elapsed_minutes - counted))
+        counted = elapsed_minutes
+        day_start = day_end
+    return days
+
+def _accumulate(totals, user_id, room_id, start_time, end_time):
+    for index, (day, minutes) in enumerate(split_minutes_by_day(start_time, end_time)):
+        entry = totals[(user_id, room_id, day)]
+        entry[0] += minutes
+        entry[1] += 1 if index == 0 else 0
+
+def record_sessions(sessions):
+    """Add ended sessions, as (user_id, room_id, start_time, end_time), to the rollups; the caller commits"""
+    totals = defaultdict(lambda: [0, 0])
+    for user_id, room_id, start_time, end_time in sessions:
+        _accumulate(totals, user_id, room_id, start_time, end_time)
+
+    rollup = StudyDailyRollup.__table__
+    for (user_id, room_id, day), (minutes, session_count) in totals.items():
+        updated = db.session.execute(
+            update(rollup)
+            .where(rollup.c.user_id == user_id, rollup.c.room_id == room_id, rollup.c.day == day)
+            .values(minutes=rollup.c.minutes + minutes,
+                    session_count=rollup.c.session_count + session_count)
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(rollup).values(
+                user_id=user_id,
+                room_id=room_id,
+                day=day,
+                minutes=minutes,
+                session_count=session_count
+            ))
+
+def record_session(session):
+    """Add an ended session to the daily rollups; the caller commits"""
+    record_sessions([(session.user_id, session.room_id, session.start_time, session.end_time)])
+
+def rebuild_rollups(batch_size=BACKFILL_BATCH_SIZE):
+    """Recompute every rollup from ended sessions; returns the number of rows written"""
+    totals = defaultdict(lambda: [0, 0])
+    sessions = db.session.execute(
+        select(StudySession.user_id, StudySession.room_id, StudySession.start_time, StudySession.end_time)
+        .where(StudySession.end_time.isnot(None), StudySession.start_time.isnot(None))
+        .execution_options(yield_per=batch_size)
+    )
+    for user_id, room_id, start_time, end_time in sessions:
+        _accumulate(totals, user_id, room_id, start_time, end_time)
+
+    db.session.execute(delete(StudyDailyRollup))
+    rows = [
+        {'user_id': user_id, 'room_id': room_id, 'day': day, 'minutes': minutes, 'session_count': count}
+        for (user_id, room_id, day), (minutes, count) in totals.items()
+    ]
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(insert(StudyDailyRollup), rows[offset:offset + batch_size])
+    db.session.commit()
+    return len(rows)
+
+def daily_minutes(user_id, start_day, end_day):
+    """{day: (minutes, sessions)} for a user between two days, inclusive"""
+    rows = db.session.execute(
+        select(StudyDailyRollup.day, func.sum(StudyDailyRollup.minutes), func.sum(StudyDailyRollup.session_count))
+        .where(StudyDailyRollup.user_id == user_id,
+               StudyDailyRollup.day >= start_day, StudyDailyRollup.day <= end_day)
+        .group_by(StudyDailyRollup.day)
+    ).all()
+    return {day: (minutes, sessions) for day, minutes, sessions in rows}
+
+def room_minutes(user_id, start_day, end_day):
+    """[(room_id, minutes, sessions)] for a user between two days, most studied first"""
+    return db.session.execute(
+        select(StudyDailyRollup.room_id, func.sum(StudyDailyRollup.minutes),
+               func.sum(StudyDailyRollup.session_count))
+        .where(StudyDailyRollup.user_id == user_id,
+               StudyDailyRollup.day >= start_day, StudyDailyRollup.day <= end_day)
+        .group_by(StudyDailyRollup.room_id)
+        .order_by(func.sum(StudyDailyRollup.minutes).desc())
+    ).all()
+
+def study_streak(user_id, today):
+    """Consecutive days up to today (or yesterday, if today has no study yet) with study time"""
+    studied = set(db.session.execute(
+        select(StudyDailyRollup.day)
+        .where(StudyDailyRollup.user_id == user_id, StudyDailyRollup.minutes > 0,
+               StudyDailyRollup.day > today - timedelta(days=MAX_STREAK_DAYS))
+        .distinct()
+    ).scalars())
+
+    day = today if today in studied else today - timedelta(days=1)
+    streak = 0
+    while day in studied:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
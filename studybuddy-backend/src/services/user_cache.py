@@ -0,0 +1,101 @@
+import os
+import time
+import jwt
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from src.extensions import db
+from src.models.user import User
+from src.services.cache import TTLCache
+from src.services.events import event_bus, USERS_CHANGED
+
+# Decoded tokens kept until they expire
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 4096))
+# Users kept per process, and the longest a copy is trusted without hearing of a change
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 2048))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+token_cache = TTLCache(ttl=3600, max_entries=TOKEN_CACHE_SIZE)
+user_cache = TTLCache(ttl=USER_CACHE_TTL, max_entries=USER_CACHE_SIZE)
+
+_columns = [prop.key for prop in User.__mapper__.column_attrs]
+
+def decode_token(token):
+    """Claims of a signed, unexpired JWT; raises jwt.InvalidTokenError like jwt.decode"""
+    claims = token_cache.get(token)
+    if claims is not None:
+        if claims.get('exp', float('inf')) > time.time():
+            return claims
+        token_cache.delete(token)
+        raise jwt.ExpiredSignatureError('Signature has expired')
+
+    claims = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    ttl = claims['exp'] - time.time() if 'exp' in claims else None
+    token_cache.set(token, claims, ttl=ttl)
+    return claims
+
+def _detached_copy(user):
+    copy = User()
+    for key in _columns:
+        setattr(copy, key, getattr(user, key))
+    # Looks like a row loaded from the database, so merging it emits no SQL
+    make_transient_to_detached(copy)
+    return copy
+
+def load_user(user_id):
+    """User by id, attached to the current session; a cache hit does not query.
+
+    A cached copy may lag the row by up to USER_CACHE_TTL, so counters are
+    changed with UPDATE ... SET col = col + n rather than through it.
+    """
+    loaded = []
+
+    def load():
+        user = db.session.get(User, user_id)
+        loaded.append(user)
+        return _detached_copy(user) if user is not None else None
+
+    cached = user_cache.get_or_set(user_id, load)
+    if loaded:
+        return loaded[0]
+    if cached is None:
+        return None
+    db.session.info.setdefault('cached_users', set()).add(user_id)
+    return db.session.merge(cached, load=False)
+
+def invalidate_users(user_ids, session=None):
+    """Drop users changed outside the ORM (e.g. by a bulk UPDATE); other workers hear after commit"""
+    session = session or db.session
+    changed = session.info.setdefault('changed_users', set())
+    for user_id in user_ids:
+        user_cache.delete(user_id)
+        changed.add(user_id)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    invalidate_users([target.id], object_session(target))
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changed_users(session):
+    session.info.pop('cached_users', None)
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        # Again, in case a reader cached the old row before this commit
+        for user_id in changed:
+            user_cache.delete(user_id)
+        event_bus.publish(USERS_CHANGED, None, user_ids=sorted(changed))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_after_rollback(session, previous_transaction):
+    # A cached copy may be why the transaction failed
+    for user_id in session.info.pop('cached_users', ()):
+        user_cache.delete(user_id)
+    session.info.pop('changed_users', None)
+
+def _handle_event(event):
+    if event['type'] == USERS_CHANGED:
+        for user_id in event['data']['user_ids']:
+            user_cache.delete(user_id)
+
+event_bus.subscribe(_handle_event)
@@ -0,0 +1,382 @@
+import json
+import threading
+import uuid
+from src.services.whiteboard_codec import dumps
+
+OP_TYPES = ('add', 'update', 'delete', 'clear')
+
+# Largest batch of operations accepted in one message
+MAX_OPS_PER_MESSAGE = 200
+# Largest clock accepted: the largest integer JavaScript clients hold exactly
+MAX_CLOCK = 2 ** 53 - 1
+# Furthest a client's clock may run ahead of the board's, e.g. after editing offline
+MAX_CLOCK_LEAD = 100000
+
+def _valid_element_id(value):
+    return isinstance(value, str) and value != '' or isinstance(value, int) and not isinstance(value, bool)
+
+def validate_document(document):
+    """Raise ValueError unless document is a board: an object whose elements all have distinct ids"""
+    if not isinstance(document, dict):
+        raise ValueError('Whiteboard data must be an object')
+    elements = document.get('elements', [])
+    if not isinstance(elements, list):
+        raise ValueError('Whiteboard elements must be a list')
+    seen = set()
+    for element in elements:
+        if not isinstance(element, dict) or not _valid_element_id(element.get('id')):
+            raise ValueError('Every whiteboard element needs an id')
+        if str(element['id']) in seen:
+            raise ValueError(f"Duplicate whiteboard element id: {element['id']}")
+        seen.add(str(element['id']))
+
+def migrate_legacy_document(document):
+    """Turn a board saved before elements needed ids into a valid document, keeping its content.
+
+    Elements without a usable or unique id get a synthetic 'legacy-<n>' id,
+    elements that are not objects are wrapped as {'value': ...}, and a
+    document that is not an object is kept under 'elements' (a list) or
+    'data' (anything else).
+    """
+    if isinstance(document, list):
+        document = {'elements': document}
+    elif not isinstance(document, dict):
+        document = {'data': document} if document is not None else {}
+    else:
+        document = dict(document)
+
+    elements = document.pop('elements', [])
+    if not isinstance(elements, list):
+        document['legacy_elements'] = elements
+        elements = []
+
+    taken = {str(element['id']) for element in elements
+             if isinstance(element, dict) and _valid_element_id(element.get('id'))}
+    seen = set()
+    migrated = []
+    for index, element in enumerate(elements):
+        element = dict(element) if isinstance(element, dict) else {'value': element}
+        if not _valid_element_id(element.get('id')) or str(element['id']) in seen:
+            synthetic = f'legacy-{index}'
+            while synthetic in taken:
+                synthetic += '-'
+            taken.add(synthetic)
+            element['id'] = synthetic
+        seen.add(str(element['id']))
+        migrated.append(element)
+
+    document['elements'] = migrated
+    return document
+
+class WhiteboardState:
+    """Whiteboard elements as a per-field last-writer-wins map (a CRDT).
+
+    Every element (stroke, shape, text, ...) has an id. Each operation
+    carries a Lamport clock and the id of the client that made it, and that
+    (clock, client) pair is the version of every field it writes. A field
+    only changes when a newer version arrives, and deletes leave a tombstone
+    version that hides older writes, so replicas that receive the same
+    operations in any order end up identical.
+    """
+
+    def __init__(self, document=None, clock=0):
+        """Start from a board document; raises ValueError if it is not valid (see validate_document)"""
+        document = {} if document is None else document
+        validate_document(document)
+        elements = document.get('elements', [])
+
+        # Anything that is not an element (background, viewport, legacy data) is kept as-is
+        self.extra = {key: value for key, value in document.items() if key != 'elements'}
+        self.fields = {}       # element id -> {field: (value, version)}
+        self.tombstones = {}   # element id -> version of the latest delete
+        self.created = {}      # element id -> sort key for drawing order
+        self.cleared = (0, '')
+        self.clock = clock
+
+        for index, element in enumerate(elements):
+            element_id = str(element['id'])
+            self.fields[element_id] = {
+                key: (value, (0, '')) for key, value in element.items() if key != 'id'
+            }
+            self.created[element_id] = (0, '', index)
+
+    @staticmethod
+    def validate(op):
+        """Raise ValueError unless op is a well-formed whiteboard operation"""
+        if not isinstance(op, dict) or op.get('op') not in OP_TYPES:
+            raise ValueError('Unknown operation')
+        if op['op'] != 'clear' and not op.get('id'):
+            raise ValueError('Operation requires an element id')
+        if op['op'] in ('add', 'update') and not isinstance(op.get('data'), dict):
+            raise ValueError('Operation requires element data')
+        clock = op.get('clock', 0)
+        if not isinstance(clock, int) or isinstance(clock, bool) or not 0 <= clock <= MAX_CLOCK:
+            raise ValueError(f'Clock must be an integer from 0 to {MAX_CLOCK}')
+
+    def check_clock(self, op):
+        """Raise ValueError if op's clock is so far ahead that it would win every later conflict"""
+        if op.get('clock', 0) > self.clock + MAX_CLOCK_LEAD:
+            raise ValueError('Clock is too far ahead of the board')
+
+    def stamp(self, op, client_id):
+        """Attach the sender's identity and a clock to an incoming operation"""
+        op = dict(op)
+        op['client'] = client_id
+        if not op.get('clock'):
+            op['clock'] = self.clock + 1
+        return op
+
+    def apply(self, op):
+        """Merge one stamped operation; return True if it changed the board"""
+        version = (op['clock'], op['client'])
+        self.clock = max(self.clock, op['clock'])
+
+        if op['op'] == 'clear':
+            if version <= self.cleared:
+                return False
+            self.cleared = version
+            return any([self._delete(element_id, version) for element_id in list(self.fields)])
+
+        element_id = str(op['id'])
+        if op['op'] == 'delete':
+            return self._delete(element_id, version)
+
+        # Drawing order follows the oldest write seen, whether or not it survives
+        created = (*version, 0)
+        if element_id not in self.created or created < self.created[element_id]:
+            self.created[element_id] = created
+
+        if version <= max(self.tombstones.get(element_id, (0, '')), self.cleared):
+            return False
+
+        fields = self.fields.setdefault(element_id, {})
+        changed = False
+        for key, value in op['data'].items():
+            if key == 'id':
+                continue
+            current = fields.get(key)
+            if current is None or current[1] < version:
+                fields[key] = (value, version)
+                changed = True
+        return changed
+
+    def _delete(self, element_id, version):
+        if version > self.tombstones.get(element_id, (0, '')):
+            self.tombstones[element_id] = version
+
+        fields = self.fields.get(element_id)
+        if not fields:
+            return False
+        stale = [key for key, (_, field_version) in fields.items() if field_version < version]
+        for key in stale:
+            del fields[key]
+        if not fields:
+            del self.fields[element_id]
+        return bool(stale)
+
+    def document(self):
+        """The board as clients see it"""
+        ordered = sorted(self.fields, key=lambda element_id: self.created.get(element_id, (0, '', 0)))
+        return {
+            **self.extra,
+            'elements': [
+                {'id': element_id, **{key: value for key, (value, _) in self.fields[element_id].items()}}
+                for element_id in ordered
+            ]
+        }
+
+    def to_dict(self):
+        """Full state, including versions, for persistence"""
+        return {
+            'extra': self.extra,
+            'fields': {
+                element_id: {key: [value, list(version)] for key, (value, version) in fields.items()}
+                for element_id, fields in self.fields.items()
+            },
+            'tombstones': {key: list(version) for key, version in self.tombstones.items()},
+            'created': {key: list(order) for key, order in self.created.items()},
+            'cleared': list(self.cleared),
+            'clock': self.clock
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data.get('extra'), data.get('clock', 0))
+        state.fields = {
+            element_id: {key: (value, tuple(version)) for key, (value, version) in fields.items()}
+            for element_id, fields in data.get('fields', {}).items()
+        }
+        state.tombstones = {key: tuple(version) for key, version in data.get('tombstones', {}).items()}
+        state.created = {key: tuple(order) for key, order in data.get('created', {}).items()}
+        state.cleared = tuple(data.get('cleared', (0, '')))
+        return state
+
+    @classmethod
+    def from_json(cls, value):
+        return cls.from_dict(json.loads(value))
+
+def _encode(message, binary):
+    if binary:
+        try:
+            return dumps(message, True)
+        except OverflowError:
+            pass  # integers beyond 64 bits only fit in JSON
+    return dumps(message, False)
+
+class _Connection:
+    """A WebSocket plus the lock that serializes sends to it.
+
+    Binary connections get MessagePack frames instead of JSON text.
+    """
+
+    def __init__(self, ws, user_id, binary=False):
+        self.ws = ws
+        self.user_id = user_id
+        self.binary = binary
+        self.client_id = f'{user_id}:{uuid.uuid4().hex[:8]}'
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        """Send a message dict in this connection's format"""
+        self.send_raw(_encode(message, self.binary))
+
+    def send_raw(self, payload):
+        with self._send_lock:
+            self.ws.send(payload)
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+class _Room:
+    def __init__(self, state):
+        self.state = state
+        self.connections = set()
+        self.lock = threading.Lock()
+
+class WhiteboardHub:
+    """Live whiteboard state and WebSocket connections per room in this process"""
+
+    def __init__(self):
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def connect(self, room_id, ws, user_id, load_state, binary=False):
+        """Register a socket; load_state() builds the board if the room is not live yet"""
+        connection = _Connection(ws, user_id, binary)
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = self._rooms[room_id] = _Room(load_state())
+            with room.lock:
+                room.connections.add(connection)
+                snapshot = {
+                    'type': 'snapshot',
+                    'document': room.state.document(),
+                    'clock': room.state.clock,
+                    'client_id': connection.client_id
+                }
+        connection.send(snapshot)
+        return connection
+
+    def disconnect(self, room_id, connection):
+        """Unregister a socket, dropping the room's live state after the last one"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return
+            with room.lock:
+                room.connections.discard(connection)
+                if not room.connections:
+                    del self._rooms[room_id]
+
+    def disconnect_user(self, room_id, user_id):
+        """Close every socket a user has open on a room (e.g. after leaving it)"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        with room.lock:
+            connections = [c for c in room.connections if c.user_id == user_id]
+        for connection in connections:
+            connection.close()
+
+    def apply(self, room_id, connection, ops):
+        """Merge a client's operations and broadcast the ones that changed the board.
+
+        Returns the stamped operations that were applied, for the caller to
+        persist. Raises ValueError, applying none of them, if a clock is too
+        far ahead of the board.
+        """
+        room = self._rooms.get(room_id)
+        if room is None:
+            return []
+
+        with room.lock:
+            for op in ops:
+                room.state.check_clock(op)
+            applied = []
+            for op in ops:
+                stamped = room.state.stamp(op, connection.client_id)
+                if room.state.apply(stamped):
+                    applied.append(stamped)
+            if applied:
+                self._broadcast(room, {'type': 'ops', 'ops': applied, 'user_id': connection.user_id},
+                                exclude=connection)
+            return applied
+
+    def apply_remote(self, room_id, ops, user_id=None):
+        """Merge operations already stamped by another worker and push them to local sockets"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        with room.lock:
+            applied = [op for op in ops if room.state.apply(op)]
+            if applied:
+                self._broadcast(room, {'type': 'ops', 'ops': applied, 'user_id': user_id})
+
+    def notify(self, room_id, message):
+        """Send a message to every local socket in a room"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        with room.lock:
+            self._broadcast(room, message)
+
+    def replace(self, room_id, state):
+        """Swap in a whole board saved over REST and push it to live sockets"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        with room.lock:
+            state.clock = max(state.clock, room.state.clock + 1)
+            room.state = state
+            self._broadcast(room, {'type': 'snapshot', 'document': room.state.document(),
+                                   'clock': room.state.clock})
+
+    def document(self, room_id):
+        """Live board for a room, or None if nobody is connected in this process"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        with room.lock:
+            return room.state.document()
+
+    def _broadcast(self, room, message, exclude=None):
+        payloads = {}  # encoded once per format
+        for connection in list(room.connections):
+            if connection is exclude:
+                continue
+            if connection.binary not in payloads:
+                payloads[connection.binary] = _encode(message, connection.binary)
+            try:
+                connection.send_raw(payloads[connection.binary])
+            except Exception:
+                # The socket is gone
+                room.connections.discard(connection)
+
+whiteboard_hub = WhiteboardHub()
@@ -0,0 +1,207 @@
+import json
+import os
+import zlib
+from functools import partial
+from itertools import chain
+import numpy as np
+from flask import request, jsonify, Response
+
+try:
+    import msgpack
+except ImportError:  # The binary format is unavailable; everything stays JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # Fall back to zlib for compression
+    zstandard = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/vnd.studybuddy.whiteboard+msgpack'
+
+# Largest payload accepted after decompression
+MAX_DECODED_BYTES = int(os.environ.get('WHITEBOARD_MAX_DECODED_BYTES', 32 * 1024 * 1024))
+# Most numbers one packed coordinate array may expand to
+MAX_ARRAY_ITEMS = int(os.environ.get('WHITEBOARD_MAX_ARRAY_ITEMS', 200000))
+# Most numbers all packed coordinate arrays in one payload may expand to
+MAX_DECODED_ITEMS = int(os.environ.get('WHITEBOARD_MAX_DECODED_ITEMS', 4000000))
+# Shortest coordinate list worth packing as an array
+MIN_ARRAY_LENGTH = 8
+# Payloads smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 256
+
+_ZSTD, _ZLIB, _RAW = b'Z', b'D', b'R'
+_DELTA_EXT, _FLOAT_EXT = 1, 2
+_INT_DTYPES = ('<i1', '<i2', '<i4', '<i8')
+_INT_RANGES = [(dtype, int(np.iinfo(dtype).min), int(np.iinfo(dtype).max)) for dtype in _INT_DTYPES]
+
+def available():
+    return msgpack is not None
+
+def _flatten(value):
+    """(items, width, item type) for a list of numbers or of equal-length rows of them, else None"""
+    if len(value) < MIN_ARRAY_LENGTH:
+        return None
+    types = set(map(type, value))
+    width = 1
+    if types == {list}:
+        widths = set(map(len, value))
+        width = widths.pop()
+        if widths or not 0 < width < 256:
+            return None
+        value = list(chain.from_iterable(value))
+        types = set(map(type, value))
+    if types == {int} or types == {float}:
+        return value, width, types.pop()
+    return None
+
+def _pack_array(value):
+    """Coordinate arrays as packed numpy buffers: integers delta-encoded, floats as float64"""
+    flattened = _flatten(value)
+    if flattened is None:
+        return None
+    items, width, item_type = flattened
+
+    if item_type is float:
+        return msgpack.ExtType(_FLOAT_EXT, bytes([width]) + np.array(items, dtype='<f8').tobytes())
+
+    try:
+        array = np.array(items, dtype=np.int64)
+    except OverflowError:
+        return None
+    # Each item minus the same coordinate of the previous point; items are row-major
+    deltas = array.copy()
+    deltas[width:] -= array[:-width]
+    # Consecutive points are close, so most deltas fit in one or two bytes
+    low, high = int(deltas.min()), int(deltas.max())
+    for code, (dtype, smallest, largest) in enumerate(_INT_RANGES):
+        if smallest <= low and high <= largest:
+            break
+    return msgpack.ExtType(_DELTA_EXT, bytes([width, code]) + deltas.astype(dtype).tobytes())
+
+def _unpack_array(code, data, budget=None):
+    """Decode a packed array, first charging its length to budget ([numbers left]) if given"""
+    if code == _DELTA_EXT:
+        if len(data) < 2 or not data[0] or data[1] >= len(_INT_DTYPES):
+            raise ValueError('Invalid coordinate array')
+        width, dtype, offset = data[0], _INT_DTYPES[data[1]], 2
+    else:
+        if not data or not data[0]:
+            raise ValueError('Invalid coordinate array')
+        width, dtype, offset = data[0], '<f8', 1
+    itemsize = np.dtype(dtype).itemsize
+    if (len(data) - offset) % (itemsize * width):
+        raise ValueError('Invalid coordinate array')
+    count = (len(data) - offset) // itemsize
+    # Runs of zero deltas compress to almost nothing, so check before building the list
+    if budget is not None:
+        if count > MAX_ARRAY_ITEMS or count > budget[0]:
+            raise ValueError('Coordinate array too large')
+        budget[0] -= count
+
+    array = np.frombuffer(data, dtype=dtype, offset=offset)
+    if code == _DELTA_EXT:
+        array = np.cumsum(array.astype(np.int64).reshape(-1, width), axis=0)
+    else:
+        array = array.reshape(-1, width)
+    return array.ravel().tolist() if width == 1 else array.tolist()
+
+_CONTAINERS = (dict, list, tuple)
+
+def _pack_coordinates(value):
+    # Only containers are visited; scalars, the bulk of a board, are passed through without a call
+    if type(value) is dict:
+        return {key: _pack_coordinates(item) if isinstance(item, _CONTAINERS) else item
+                for key, item in value.items()}
+    if type(value) is list and len(value) >= MIN_ARRAY_LENGTH:
+        packed = _pack_array(value)
+        if packed is not None:
+            return packed
+    if isinstance(value, _CONTAINERS):
+        if isinstance(value, dict):
+            return {key: _pack_coordinates(item) for key, item in value.items()}
+        return [_pack_coordinates(item) if isinstance(item, _CONTAINERS) else item for item in value]
+    return value
+
+def _ext_hook(code, data, budget=None):
+    if code in (_DELTA_EXT, _FLOAT_EXT):
+        return _unpack_array(code, data, budget)
+    raise ValueError(f'Unknown extension type {code}')
+
+def encode(value):
+    """MessagePack with packed coordinate arrays, compressed when large enough"""
+    packed = msgpack.packb(_pack_coordinates(value))
+    if len(packed) < MIN_COMPRESS_BYTES:
+        return _RAW + packed
+    if zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=3).compress(packed)
+    return _ZLIB + zlib.compress(packed, 6)
+
+def decode(data, trusted=False, **unpack_options):
+    """Inverse of encode(); raises ValueError on malformed or oversized input.
+
+    Coordinate arrays are limited to MAX_ARRAY_ITEMS numbers each and
+    MAX_DECODED_ITEMS in all, unless trusted is set for data the server
+    wrote itself.
+    """
+    if msgpack is None:
+        raise ValueError('Binary whiteboard format is not available')
+    header, body = bytes(data[:1]), data[1:]
+    if header == _ZSTD:
+        if zstandard is None:
+            raise ValueError('zstd payloads are not supported by this server')
+        try:
+            if zstandard.frame_content_size(body) > MAX_DECODED_BYTES:
+                raise ValueError('Payload too large')
+            packed = zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_DECODED_BYTES)
+        except zstandard.ZstdError as e:
+            raise ValueError('Invalid zstd payload') from e
+    elif header == _ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            packed = decompressor.decompress(body, MAX_DECODED_BYTES)
+        except zlib.error as e:
+            raise ValueError('Invalid zlib payload') from e
+        if decompressor.unconsumed_tail:
+            raise ValueError('Payload too large')
+    elif header == _RAW:
+        packed = body
+    else:
+        raise ValueError('Unknown whiteboard encoding')
+
+    try:
+        ext_hook = _ext_hook if trusted else partial(_ext_hook, budget=[MAX_DECODED_ITEMS])
+        return msgpack.unpackb(packed, ext_hook=ext_hook, **unpack_options)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError('Invalid MessagePack payload') from e
+
+def loads(data):
+    """Decode a client payload, rejecting MessagePack binary values, which JSON cannot hold"""
+    return decode(data, max_bin_len=0)
+
+def wants_binary():
+    """True if the current request prefers the binary format and the server can produce it"""
+    return available() and request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, MSGPACK_MIMETYPE]
+    ) == MSGPACK_MIMETYPE
+
+def get_payload():
+    """Request body as JSON or, for the binary content type, decoded MessagePack"""
+    if request.mimetype == MSGPACK_MIMETYPE:
+        return loads(request.get_data())
+    return request.get_json()
+
+def make_response(body, status=200):
+    """Respond in the format negotiated from the Accept header"""
+    if wants_binary():
+        try:
+            return Response(encode(body), status=status, mimetype=MSGPACK_MIMETYPE)
+        except OverflowError:
+            pass  # integers beyond 64 bits only fit in JSON
+    return jsonify(body), status
+
+def dumps(value, binary=False):
+    """Serialize a WebSocket message as a binary frame or JSON text"""
+    return encode(value) if binary else json.dumps(value)
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, insert, delete, literal
+from src.extensions import db
+from src.models.study_room import StudyRoom, WhiteboardOperation, WhiteboardSnapshot
+from src.services.whiteboard import WhiteboardState, migrate_legacy_document
+from src.services import whiteboard_codec
+
+# Compact a room once this many operations follow its latest snapshot
+COMPACT_AFTER_OPS = int(os.environ.get('WHITEBOARD_COMPACT_AFTER_OPS', 500))
+
+# 'msgpack' stores snapshots compressed and binary; 'json' keeps them as text
+STORAGE_FORMAT = os.environ.get(
+    'WHITEBOARD_STORAGE_FORMAT', 'msgpack' if whiteboard_codec.available() else 'json'
+).lower()
+
+_lock = threading.Lock()
+_tail_lengths = {}  # room id -> operations after the latest snapshot, as seen by this process
+_compacting = set()
+
+def _latest_snapshot(room_id):
+    return db.session.execute(
+        select(WhiteboardSnapshot)
+        .where(WhiteboardSnapshot.room_id == room_id)
+        .order_by(WhiteboardSnapshot.id.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+def _replay(room_id):
+    """Rebuild a room's board; returns (state, snapshot id, last operation id, tail length)"""
+    snapshot = _latest_snapshot(room_id)
+    if snapshot and snapshot.state_data is not None:
+        state = WhiteboardState.from_dict(whiteboard_codec.decode(snapshot.state_data, trusted=True))
+        last_operation_id = snapshot.last_operation_id
+    elif snapshot:
+        state = WhiteboardState.from_json(snapshot.state)
+        last_operation_id = snapshot.last_operation_id
+    else:
+        # Boards saved before the operation log existed start from the room column
+        legacy = db.session.execute(
+            select(StudyRoom.whiteboard_data).where(StudyRoom.id == room_id)
+        ).scalar()
+        state = WhiteboardState(migrate_legacy_document(json.loads(legacy) if legacy else {}))
+        last_operation_id = 0
+
+    tail = db.session.execute(
+        select(WhiteboardOperation.id, WhiteboardOperation.payload)
+        .where(WhiteboardOperation.room_id == room_id, WhiteboardOperation.id > last_operation_id)
+        .order_by(WhiteboardOperation.id)
+    ).all()
+    for operation_id, payload in tail:
+        state.apply(json.loads(payload))
+        last_operation_id = operation_id
+
+    return state, snapshot.id if snapshot else 0, last_operation_id, len(tail)
+
+def load_state(room_id):
+    """Latest snapshot of a room's board with the operations after it replayed"""
+    state, _, _, tail_length = _replay(room_id)
+    with _lock:
+        _tail_lengths[room_id] = tail_length
+    return state
+
+def append_operations(room_id, ops):
+    """Log stamped operations and start a compaction if the tail is long enough"""
+    db.session.execute(
+        insert(WhiteboardOperation),
+        [{'room_id': room_id, 'payload': json.dumps(op)} for op in ops]
+    )
+    db.session.commit()
+
+    with _lock:
+        tail_length = _tail_lengths[room_id] = _tail_lengths.get(room_id, 0) + len(ops)
+        if tail_length < COMPACT_AFTER_OPS or room_id in _compacting:
+            return
+        _compacting.add(room_id)
+
+    app = current_app._get_current_object()
+    threading.Thread(target=_compact_in_background, args=(app, room_id), daemon=True).start()
+
+def replace_document(room_id, document):
+    """Store a whole board (e.g. saved over REST) as a new snapshot; raises ValueError if it is invalid"""
+    state, _, last_operation_id, _ = _replay(room_id)
+    replacement = WhiteboardState(document, clock=state.clock + 1)
+    _write_snapshot(room_id, replacement, last_operation_id)
+    with _lock:
+        _tail_lengths[room_id] = 0
+    return replacement
+
+def compact(room_id):
+    """Fold a room's operation tail into a new snapshot"""
+    state, snapshot_id, last_operation_id, tail_length = _replay(room_id)
+    if not tail_length:
+        return False
+
+    # A board replaced while we were replaying is newer than our state; the
+    # next append starts another compaction on top of it
+    if not _write_snapshot(room_id, state, last_operation_id, based_on=snapshot_id):
+        return False
+    with _lock:
+        _tail_lengths[room_id] = max(0, _tail_lengths.get(room_id, 0) - tail_length)
+    return True
+
+def _write_snapshot(room_id, state, last_operation_id, based_on=None):
+    """Add a snapshot; with based_on, only if that snapshot id is still the latest. Returns whether it was added"""
+    previous = _latest_snapshot(room_id)
+    values = {'room_id': room_id, 'last_operation_id': last_operation_id, 'created_at': datetime.utcnow()}
+    if STORAGE_FORMAT == 'msgpack' and whiteboard_codec.available():
+        try:
+            values['state_data'] = whiteboard_codec.encode(state.to_dict())
+        except (OverflowError, TypeError):
+            # e.g. integers beyond 64 bits, which only JSON can hold
+            values['state'] = state.to_json()
+    else:
+        values['state'] = state.to_json()
+
+    if based_on is None:
+        db.session.execute(insert(WhiteboardSnapshot).values(**values))
+    else:
+        # Compare and set in one statement, so a snapshot committed by another
+        # worker since we read based_on is never overwritten
+        columns = WhiteboardSnapshot.__table__.c
+        newer = select(WhiteboardSnapshot.id).where(
+            WhiteboardSnapshot.room_id == room_id, WhiteboardSnapshot.id > based_on
+        )
+        source = select(*[literal(value, columns[name].type) for name, value in values.items()]).where(~newer.exists())
+        result = db.session.execute(insert(WhiteboardSnapshot).from_select(list(values), source))
+        if result.rowcount != 1:
+            db.session.rollback()
+            return False
+
+    # Keep the previous snapshot and its tail so a reader that has just
+    # picked it up can still replay; anything older is no longer reachable
+    if previous:
+        db.session.execute(
+            delete(WhiteboardOperation)
+            .where(WhiteboardOperation.room_id == room_id,
+                   WhiteboardOperation.id <= previous.last_operation_id)
+        )
+        db.session.execute(
+            delete(WhiteboardSnapshot)
+            .where(WhiteboardSnapshot.room_id == room_id, WhiteboardSnapshot.id < previous.id)
+        )
+    db.session.commit()
+    return True
+
+def _compact_in_background(app, room_id):
+    with app.app_context():
+        try:
+            compact(room_id)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Whiteboard compaction failed for room %s', room_id)
+        finally:
+            db.session.remove()
+            with _lock:
+                _compacting.discard(room_id)
@@ -0,0 +1,6 @@
+import os
+import sys
+# Make `src` importable when running `pytest` from studybuddy-backend, and the
+# benchmarks' throwaway app builder (benchmarks/common.py) with it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from src.services.admission import AdmissionController, AdmissionRejected, InMemoryAdmissionStore
+
+
+class FakeUser:
+    def __init__(self, id, premium=False):
+        self.id = id
+        self.premium = premium
+
+    def has_active_premium(self):
+        return self.premium
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    store = InMemoryAdmissionStore()
+
+    assert [store.take_tokens('k', 1, 2.0, 3, 100.0) for _ in range(3)] == [0, 0, 0]
+    assert store.take_tokens('k', 1, 2.0, 3, 100.0) == pytest.approx(0.5)
+    assert store.take_tokens('k', 1, 2.0, 3, 100.25) == pytest.approx(0.25)
+    assert store.take_tokens('k', 1, 2.0, 3, 100.5) == 0
+
+
+def test_bucket_never_refills_past_burst():
+    store = InMemoryAdmissionStore()
+    store.take_tokens('k', 2, 1.0, 2, 0.0)
+
+    assert store.take_tokens('k', 2, 1.0, 2, 1000.0) == 0
+    assert store.take_tokens('k', 1, 1.0, 2, 1000.0) == pytest.approx(1.0)
+
+
+def test_rejected_take_does_not_spend_tokens():
+    store = InMemoryAdmissionStore()
+    store.take_tokens('k', 2, 1.0, 3, 0.0)
+
+    assert store.take_tokens('k', 2, 1.0, 3, 0.0) == pytest.approx(1.0)
+    assert store.take_tokens('k', 1, 1.0, 3, 0.0) == 0
+
+
+def test_slots_are_capped_and_released():
+    store = InMemoryAdmissionStore()
+
+    assert store.acquire_slot('k', 2) and store.acquire_slot('k', 2)
+    assert not store.acquire_slot('k', 2)
+    store.release_slot('k')
+    assert store.acquire_slot('k', 2)
+
+
+def test_quota_exhaustion_reports_retry_after_and_frees_slots():
+    controller = AdmissionController(per_minute=1, burst=2, premium_per_minute=60, premium_burst=2)
+    user = FakeUser(1)
+
+    for _ in range(2):
+        controller.acquire(user)
+        controller.release(user)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire(user)
+
+    assert rejected.value.reason == 'AI request quota exceeded'
+    assert 1 < rejected.value.retry_after <= 60
+    # The rejected request gave its concurrency slots back
+    assert controller.store.acquire_slot('global', 1)
+
+
+def test_premium_users_get_their_own_concurrency_limit():
+    controller = AdmissionController(user_concurrent=1, premium_concurrent=2)
+    regular, premium = FakeUser(1), FakeUser(2, premium=True)
+
+    controller.acquire(regular)
+    with pytest.raises(AdmissionRejected, match='concurrent'):
+        controller.acquire(regular)
+    controller.acquire(premium)
+    controller.acquire(premium)
+    with pytest.raises(AdmissionRejected, match='concurrent'):
+        controller.acquire(premium)
+
+
+def test_global_limit_is_shared_across_users():
+    controller = AdmissionController(max_concurrent=2)
+    controller.acquire(FakeUser(1))
+    controller.acquire(FakeUser(2))
+
+    with pytest.raises(AdmissionRejected, match='busy'):
+        controller.acquire(FakeUser(3))
+
+
+def test_concurrent_requests_never_overspend_the_bucket():
+    controller = AdmissionController(max_concurrent=100, user_concurrent=100, per_minute=1, burst=5)
+    user = FakeUser(1)
+    admitted = []
+    barrier = threading.Barrier(20)
+
+    def request():
+        barrier.wait()
+        try:
+            controller.acquire(user)
+        except AdmissionRejected:
+            return
+        admitted.append(True)
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(admitted) == 5
+
+
+def test_costs_above_the_burst_are_refused_up_front():
+    controller = AdmissionController(burst=5, premium_burst=10)
+
+    with pytest.raises(ValueError):
+        controller.guard(cost=6)
+    with pytest.raises(ValueError):
+        AdmissionController(burst=0)
+
+
+def test_guard_turns_rejections_into_429():
+    controller = AdmissionController(per_minute=1, burst=1)
+    user = FakeUser(1)
+    app = Flask(__name__)
+
+    @controller.guard()
+    def view(current_user):
+        return 'ok'
+
+    with app.test_request_context():
+        assert view(user) == 'ok'
+        response, status = view(user)
+
+    assert status == 429
+    assert response.get_json()['error'] == 'AI request quota exceeded'
+    assert response.headers['Retry-After'] == str(response.get_json()['retry_after'])
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+import numpy as np
+
+from src.services.flashcard_scheduler import compute_next_reviews, next_review_date, MAX_INTERVAL_DAYS
+
+
+def test_vectorized_schedule_matches_single_card():
+    reviewed_at = datetime(2024, 3, 1, 12, 30)
+    cases = [(count, correct) for count in range(MAX_INTERVAL_DAYS + 5) for correct in (True, False)]
+    counts = np.array([count for count, _ in cases], dtype=np.int64)
+    outcomes = np.array([correct for _, correct in cases], dtype=bool)
+    reviewed = np.full(len(cases), np.datetime64(reviewed_at, 'us'))
+
+    vectorized = compute_next_reviews(counts, outcomes, reviewed).tolist()
+
+    assert vectorized == [next_review_date(count, correct, reviewed_at) for count, correct in cases]
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from common import make_app
+from src.extensions import db
+from src.models.ai_tutor import PracticeTest, PracticeQuestion, PracticeAnswer
+from src.models.user import User
+from src.services.practice_tests import (
+    PracticeTestFormatError, parse_practice_questions, grade_answer, submit_attempt
+)
+
+
+def question(question_type, correct_answer, options=None):
+    return PracticeQuestion(question_type=question_type, prompt='?', correct_answer=correct_answer,
+                            options=json.dumps(options) if options else None)
+
+
+def test_parses_fenced_json_with_prose_around_it():
+    response = 'Here is your test:\n```json\n[{"type": "mcq", "question": "2+2?", "options": ["3", "4"], "answer": 1}]\n```\nGood luck!'
+
+    [parsed] = parse_practice_questions(response)
+
+    assert parsed['question_type'] == 'multiple_choice'
+    assert parsed['prompt'] == '2+2?'
+    assert json.loads(parsed['options']) == ['3', '4']
+    assert parsed['correct_answer'] == '1'
+
+
+@pytest.mark.parametrize('answer', [1, '1', 'B', '(b)', 'B.', 'four'])
+def test_multiple_choice_answer_forms_resolve_to_an_index(answer):
+    item = {'question': 'Which?', 'options': ['three', 'four', 'five'], 'answer': answer}
+
+    [parsed] = parse_practice_questions(json.dumps([item]))
+
+    assert parsed['correct_answer'] == '1'
+
+
+def test_option_text_wins_over_an_index_like_answer():
+    item = {'question': 'Which?', 'options': ['2', '4', '6'], 'answer': '4'}
+
+    [parsed] = parse_practice_questions(json.dumps([item]))
+
+    assert parsed['correct_answer'] == '1'
+
+
+def test_types_are_inferred_when_missing():
+    items = [
+        {'question': 'Sky is blue?', 'answer': 'Yes'},
+        {'question': 'Capital of France?', 'answer': ' Paris '},
+        {'question': 'Pick', 'choices': {'b': 'two', 'a': 'one'}, 'answer': 'a'}
+    ]
+
+    parsed = parse_practice_questions(json.dumps({'questions': items}))
+
+    assert [(q['question_type'], q['correct_answer']) for q in parsed] == [
+        ('true_false', 'true'), ('short_answer', 'Paris'), ('multiple_choice', '0')
+    ]
+    assert json.loads(parsed[2]['options']) == ['one', 'two']
+
+
+def test_invalid_items_are_dropped_and_limit_applies():
+    items = [
+        'not a question',
+        {'question': '', 'answer': 'x'},
+        {'type': 'multiple_choice', 'question': 'One option', 'options': ['a'], 'answer': 0},
+        {'type': 'multiple_choice', 'question': 'Out of range', 'options': ['a', 'b'], 'answer': 5},
+        {'type': 'true_false', 'question': 'Maybe', 'answer': 'perhaps'},
+        {'question': 'Kept 1', 'answer': 'one'},
+        {'question': 'Kept 2', 'answer': 'two'}
+    ]
+
+    parsed = parse_practice_questions(json.dumps(items), limit=1)
+
+    assert [q['prompt'] for q in parsed] == ['Kept 1']
+
+
+@pytest.mark.parametrize('response', [None, '', 'no json here', '"just a string"', '[{"question": "no answer"}]'])
+def test_unusable_responses_raise(response):
+    with pytest.raises(PracticeTestFormatError):
+        parse_practice_questions(response)
+
+
+def test_grades_each_question_type():
+    multiple_choice = question('multiple_choice', '2', ['red', 'green', 'blue'])
+    true_false = question('true_false', 'false')
+    short_answer = question('short_answer', 'Mitochondria')
+
+    assert grade_answer(multiple_choice, 2)
+    assert grade_answer(multiple_choice, 'C')
+    assert grade_answer(multiple_choice, ' Blue ')
+    assert not grade_answer(multiple_choice, 1)
+    assert not grade_answer(multiple_choice, True)
+    assert grade_answer(true_false, 'no')
+    assert grade_answer(true_false, False)
+    assert not grade_answer(true_false, 'unsure')
+    assert grade_answer(short_answer, '  mitochondria. ')
+    assert not grade_answer(short_answer, 'nucleus')
+    assert not grade_answer(short_answer, None)
+
+
+@pytest.fixture
+def app():
+    return make_app()
+
+
+def test_submit_attempt_grades_and_records_every_question(app):
+    with app.app_context():
+        user = User(username='student', email='student@example.com', password_hash='unused',
+                    first_name='Test', last_name='User')
+        db.session.add(user)
+        db.session.flush()
+        test = PracticeTest(user_id=user.id, title='Quiz', questions='[]', total_questions=3)
+        test.test_questions = [
+            PracticeQuestion(position=0, question_type='multiple_choice', prompt='a', options='["x", "y"]',
+                             correct_answer='1', times_answered=0, times_correct=0),
+            PracticeQuestion(position=1, question_type='true_false', prompt='b', correct_answer='true',
+                             times_answered=0, times_correct=0),
+            PracticeQuestion(position=2, question_type='short_answer', prompt='c', correct_answer='z',
+                             times_answered=0, times_correct=0)
+        ]
+        db.session.add(test)
+        db.session.commit()
+
+        results = submit_attempt(test, user.id, ['y', 'no'], time_taken=42)
+        db.session.commit()
+        submit_attempt(test, user.id, {str(q.id): 'z' for q in test.test_questions})
+        db.session.commit()
+
+        assert [r['is_correct'] for r in results] == [True, False, False]
+        assert results[2]['answer'] is None
+        assert test.attempt_count == 2
+        assert test.score == pytest.approx(33.33)
+        db.session.expire_all()
+        assert [(q.times_answered, q.times_correct) for q in test.test_questions] == [(2, 1), (2, 0), (2, 1)]
+        assert PracticeAnswer.query.filter_by(test_id=test.id, attempt=1).count() == 3
@@ -0,0 +1,141 @@
+import pytest
+from flask import Flask, Blueprint
+
+from src.services.rate_limit import (
+    InMemoryRateLimitStore, SQLiteRateLimitStore, RateLimit, RateLimiter, _sliding_wait
+)
+
+# The start of a 60 second window
+START = 6000.0
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryRateLimitStore()
+    return SQLiteRateLimitStore(str(tmp_path / 'limits.db'))
+
+
+def hits(store, entries, now, count):
+    return [store.hit(entries, now) for _ in range(count)]
+
+
+def test_sliding_wait_weights_the_previous_window_by_its_overlap():
+    # Half of the previous window still overlaps: 10 * 0.5 + 4 + 1 fits in 10
+    assert _sliding_wait(10, 4, 10, 60, START + 30) == 0
+    # One more does not, until the previous window has slid out to 0.4
+    assert _sliding_wait(10, 5, 10, 60, START + 30) == pytest.approx(6)
+    assert _sliding_wait(10, 5, 10, 60, START + 36) == 0
+    # A full current window has to wait for the next one and then for this one to slide out
+    assert _sliding_wait(3, 10, 10, 60, START + 50) == pytest.approx(16)
+    assert _sliding_wait(10, 0, 10, 60, START + 66) == 0
+
+
+def test_limit_is_enforced_and_retry_after_is_exact(store):
+    entries = [('login:ip', 5, 60)]
+
+    assert hits(store, entries, START + 10, 5) == [0] * 5
+    wait = store.hit(entries, START + 10)
+    assert wait == pytest.approx(START + 60 * (2 - 4 / 5) - (START + 10))
+
+    assert store.hit(entries, START + 10 + wait - 0.01) > 0
+    assert store.hit(entries, START + 10 + wait + 0.01) == 0
+
+
+def test_previous_window_keeps_counting_as_it_slides_out(store):
+    entries = [('k', 4, 60)]
+    hits(store, entries, START + 59, 4)
+
+    # A quarter of the way into the next window, 4 * 0.75 = 3 still count
+    assert store.hit(entries, START + 75) == 0
+    assert store.hit(entries, START + 75) > 0
+    # Two windows later nothing counts
+    assert hits(store, entries, START + 180, 4) == [0] * 4
+
+
+def test_rejected_requests_are_not_counted(store):
+    entries = [('k', 4, 60)]
+    hits(store, entries, START, 4)
+
+    hits(store, entries, START + 1, 10)
+
+    # Half of the four admitted requests still count; the rejected ten never did
+    assert store.hit(entries, START + 90) == 0
+    assert store.hit(entries, START + 90) == 0
+    assert store.hit(entries, START + 90) > 0
+
+
+def test_every_limit_must_admit_before_any_counts(store):
+    strict, loose = ('ip', 1, 60), ('user', 3, 60)
+    assert store.hit([strict, loose], START) == 0
+
+    assert store.hit([strict, loose], START + 1) > 0
+
+    # The rejected request above did not spend from the looser limit
+    assert hits(store, [loose], START + 2, 2) == [0, 0]
+    assert store.hit([loose], START + 2) > 0
+
+
+def test_keys_are_counted_separately(store):
+    hits(store, [('a', 1, 60)], START, 1)
+
+    assert store.hit([('b', 1, 60)], START) == 0
+    assert store.hit([('a', 1, 60)], START) > 0
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'limits.db')
+    first, second = SQLiteRateLimitStore(path), SQLiteRateLimitStore(path)
+
+    first.hit([('k', 2, 60)], START)
+    second.hit([('k', 2, 60)], START)
+
+    assert first.hit([('k', 2, 60)], START) > 0
+
+
+@pytest.mark.parametrize('rate, limit, window', [('5/minute', 5, 60), ('100/hours', 100, 3600), ('1/Second', 1, 1)])
+def test_parse(rate, limit, window):
+    rule = RateLimit.parse(rate, lambda: 'x', 'test')
+
+    assert (rule.limit, rule.window) == (limit, window)
+
+
+@pytest.mark.parametrize('rate', ['0/minute', '-1/hour', '5/fortnight', 'five/minute'])
+def test_parse_rejects_rates_that_admit_nothing_or_make_no_sense(rate):
+    with pytest.raises(ValueError):
+        RateLimit.parse(rate, lambda: 'x', 'test')
+
+
+def make_limited_app(store):
+    app = Flask(__name__)
+    blueprint = Blueprint('auth', __name__)
+
+    @blueprint.route('/login', methods=['POST'])
+    def login():
+        return 'ok'
+
+    limiter = RateLimiter(store)
+    limiter.limit(blueprint, {'login': [RateLimit(2, 60, lambda: 'client', 'ip')]})
+    app.register_blueprint(blueprint)
+    return app
+
+
+def test_limiter_answers_429_with_retry_after():
+    client = make_limited_app(InMemoryRateLimitStore()).test_client()
+
+    statuses = [client.post('/login').status_code for _ in range(3)]
+    response = client.post('/login')
+
+    assert statuses == [200, 200, 429]
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+
+def test_limiter_lets_requests_through_when_the_store_fails():
+    class BrokenStore:
+        def hit(self, entries, now):
+            raise OSError('disk full')
+
+    client = make_limited_app(BrokenStore()).test_client()
+
+    assert [client.post('/login').status_code for _ in range(3)] == [200, 200, 200]
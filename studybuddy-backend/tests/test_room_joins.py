@@ -0,0 +1,114 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from common import make_app
+from src.commands import register_commands
+from src.extensions import db
+from src.models.study_room import StudyRoom, RoomMembership
+from src.models.user import User
+from src.routes.auth import auth_bp
+from src.routes.study_room import room_bp
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A file database, so concurrent requests get their own connections
+    app = make_app(f"sqlite:///{tmp_path / 'rooms.db'}", blueprints=[(auth_bp, '/api/auth'), (room_bp, '/api')])
+    register_commands(app)
+    return app
+
+
+def make_users(app, count):
+    with app.app_context():
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='unused',
+                      first_name='Test', last_name='User') for i in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [{'Authorization': f'Bearer {user.generate_token()}'} for user in users]
+
+
+def join_at_once(app, room_id, headers_list):
+    statuses = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(headers_list))
+
+    def join(headers):
+        client = app.test_client()
+        barrier.wait()
+        status = client.post(f'/api/rooms/{room_id}/join', headers=headers).status_code
+        with lock:
+            statuses[status] += 1
+
+    threads = [threading.Thread(target=join, args=(headers,)) for headers in headers_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def room_counts(app, room_id):
+    with app.app_context():
+        members = RoomMembership.query.filter_by(room_id=room_id, is_active=True).count()
+        return members, db.session.get(StudyRoom, room_id).active_member_count
+
+
+def create_room(app, owner, capacity):
+    response = app.test_client().post('/api/rooms', json={'name': 'Room', 'max_participants': capacity},
+                                      headers=owner)
+    return response.get_json()['room']['id']
+
+
+def test_concurrent_joins_never_exceed_capacity(app):
+    owner, *joiners = make_users(app, 41)
+    room_id = create_room(app, owner, 10)
+
+    statuses = join_at_once(app, room_id, joiners)
+
+    assert statuses == {200: 9, 400: 31}
+    assert room_counts(app, room_id) == (10, 10)
+
+
+def test_same_user_joining_twice_at_once_takes_one_seat(app):
+    owner, joiner = make_users(app, 2)
+    room_id = create_room(app, owner, 10)
+
+    statuses = join_at_once(app, room_id, [joiner] * 8)
+
+    assert statuses == {200: 1, 400: 7}
+    assert room_counts(app, room_id) == (2, 2)
+    with app.app_context():
+        assert RoomMembership.query.filter_by(room_id=room_id).count() == 2
+
+
+def test_upgrade_removes_duplicate_memberships(app):
+    with app.app_context():
+        connection = db.engine.connect()
+        # room_membership as create_all() made it before the unique constraint
+        connection.exec_driver_sql('DROP TABLE room_membership')
+        connection.exec_driver_sql(
+            'CREATE TABLE room_membership (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+            'room_id INTEGER NOT NULL, role VARCHAR(20), is_active BOOLEAN, joined_at DATETIME, last_seen DATETIME)'
+        )
+        connection.commit()
+        connection.close()
+    owner, joiner = make_users(app, 2)
+    with app.app_context():
+        db.session.add(StudyRoom(room_code='ABC123', name='Room', owner_id=1, active_member_count=5))
+        db.session.add_all([RoomMembership(user_id=1, room_id=1, role='owner', is_active=True)] + [
+            RoomMembership(user_id=2, room_id=1, role='member', is_active=active) for active in (False, True, True)
+        ])
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['upgrade-schema'])
+
+    assert 'removed 2 duplicate room memberships' in result.output
+    with app.app_context():
+        kept = RoomMembership.query.order_by(RoomMembership.id).all()
+        assert [(membership.user_id, membership.is_active) for membership in kept] == [(1, True), (2, True)]
+    assert room_counts(app, 1) == (2, 2)
+    # A second join through the API is now refused by the index
+    statuses = join_at_once(app, 1, [joiner] * 4)
+    assert statuses == {400: 4}
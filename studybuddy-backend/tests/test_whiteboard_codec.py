@@ -0,0 +1,118 @@
+import zlib
+
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+
+from src.services import whiteboard_codec
+from src.services.whiteboard_codec import encode, decode, loads
+
+
+def stroke(points):
+    return {'elements': [{'id': 's1', 'type': 'path', 'color': '#000', 'points': points}]}
+
+
+@pytest.mark.parametrize('points', [
+    [[i, i + 1] for i in range(500)],  # deltas fit in one byte
+    [[i * 1000, -i * 700] for i in range(50)],  # two bytes
+    [[i * 10 ** 6, 0] for i in range(50)],  # four bytes
+    [[i * 10 ** 12, 5] for i in range(50)],  # eight bytes
+    [i * 3 for i in range(20)],  # a flat list
+    [[i / 3, i * 0.5, -1.25] for i in range(40)],  # float rows of width 3
+])
+def test_coordinate_arrays_round_trip(points):
+    document = stroke(points)
+
+    assert decode(encode(document)) == document
+
+
+def test_integer_arrays_are_delta_packed():
+    points = [[10 + i, 20 - i] for i in range(1000)]
+    packed = whiteboard_codec._pack_coordinates(points)
+
+    assert packed.code == whiteboard_codec._DELTA_EXT
+    # Width and dtype code, then one byte per delta; the first point counts from zero
+    assert len(packed.data) == 2 + 2000
+
+
+@pytest.mark.parametrize('value', [
+    [1, 2, 3],  # too short to pack
+    [1, 2.5, 3, 4, 5, 6, 7, 8],  # mixed number types
+    [True, False] * 8,  # bools are not coordinates
+    [[1, 2], [3]] * 8,  # ragged rows
+    [2 ** 70] * 8,  # beyond int64
+    ['a'] * 8
+])
+def test_other_lists_pass_through_unpacked(value):
+    assert not isinstance(whiteboard_codec._pack_coordinates(value), msgpack.ExtType)
+    if value[0] != 2 ** 70:
+        assert decode(encode(value)) == value
+
+
+def test_small_payloads_stay_raw_and_large_ones_are_compressed():
+    assert encode({'a': 1})[:1] == whiteboard_codec._RAW
+
+    data = encode(stroke([[i, i] for i in range(5000)]))
+
+    expected = whiteboard_codec._ZSTD if whiteboard_codec.zstandard else whiteboard_codec._ZLIB
+    assert data[:1] == expected
+
+
+def test_zlib_payloads_decode_without_zstandard(monkeypatch):
+    monkeypatch.setattr(whiteboard_codec, 'zstandard', None)
+    document = stroke([[i, -i] for i in range(5000)])
+
+    data = encode(document)
+
+    assert data[:1] == whiteboard_codec._ZLIB
+    assert decode(data) == document
+
+
+def test_array_size_caps(monkeypatch):
+    monkeypatch.setattr(whiteboard_codec, 'MAX_ARRAY_ITEMS', 100)
+    monkeypatch.setattr(whiteboard_codec, 'MAX_DECODED_ITEMS', 150)
+
+    assert decode(encode([[0, 0]] * 50))
+    with pytest.raises(ValueError, match='too large'):
+        decode(encode([[0, 0]] * 51))
+    # Each array is under the per-array cap but together they exceed the total
+    with pytest.raises(ValueError, match='too large'):
+        decode(encode([[[0, 0]] * 40] * 2))
+    # Snapshots the server wrote itself are not limited
+    assert len(decode(encode([[0, 0]] * 51), trusted=True)) == 51
+
+
+def test_decompression_bombs_are_rejected(monkeypatch):
+    monkeypatch.setattr(whiteboard_codec, 'MAX_DECODED_BYTES', 1024)
+    packed = msgpack.packb('x' * 4096)
+
+    with pytest.raises(ValueError, match='too large'):
+        decode(whiteboard_codec._ZLIB + zlib.compress(packed))
+    if whiteboard_codec.zstandard:
+        with pytest.raises(ValueError, match='too large'):
+            decode(whiteboard_codec._ZSTD + whiteboard_codec.zstandard.ZstdCompressor().compress(packed))
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'Xjunk',
+    b'Zjunk',
+    b'Djunk',
+    b'R\xc1',  # a byte MessagePack never uses
+    b'R' + msgpack.packb(msgpack.ExtType(1, b'\x02\x00\x01')),  # odd number of items for width 2
+    b'R' + msgpack.packb(msgpack.ExtType(1, b'\x00\x00')),  # zero width
+    b'R' + msgpack.packb(msgpack.ExtType(1, b'\x01\x09')),  # unknown dtype code
+    b'R' + msgpack.packb(msgpack.ExtType(2, b'\x01\x00\x00')),  # truncated float64
+    b'R' + msgpack.packb(msgpack.ExtType(7, b'')),  # unknown extension
+])
+def test_malformed_payloads_raise_value_error(data):
+    with pytest.raises(ValueError):
+        decode(data)
+
+
+def test_loads_rejects_binary_values():
+    data = whiteboard_codec._RAW + msgpack.packb({'blob': b'\x00\x01'})
+
+    assert decode(data) == {'blob': b'\x00\x01'}
+    with pytest.raises(ValueError):
+        loads(data)
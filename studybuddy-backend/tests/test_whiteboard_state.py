@@ -0,0 +1,123 @@
+import json
+import random
+from itertools import permutations
+
+import pytest
+
+from src.services.whiteboard import WhiteboardState, WhiteboardHub, MAX_CLOCK, MAX_CLOCK_LEAD
+
+OPS = [
+    {'op': 'add', 'id': 'a', 'data': {'x': 1, 'color': 'red'}, 'clock': 1, 'client': 'c1'},
+    {'op': 'update', 'id': 'a', 'data': {'x': 2}, 'clock': 2, 'client': 'c2'},
+    {'op': 'update', 'id': 'a', 'data': {'x': 3}, 'clock': 2, 'client': 'c1'},  # same clock, lower client
+    {'op': 'add', 'id': 'b', 'data': {'y': 1}, 'clock': 1, 'client': 'c2'},
+    {'op': 'delete', 'id': 'b', 'clock': 3, 'client': 'c1'},
+    {'op': 'update', 'id': 'b', 'data': {'y': 2}, 'clock': 2, 'client': 'c2'},  # older than the delete
+    {'op': 'add', 'id': 'c', 'data': {'z': 1}, 'clock': 4, 'client': 'c2'},
+]
+
+
+def replay(ops, state=None):
+    state = state or WhiteboardState()
+    for op in ops:
+        state.apply(op)
+    return state
+
+
+def test_replicas_converge_whatever_the_delivery_order():
+    expected = replay(OPS).to_dict()
+
+    for order in permutations(OPS):
+        assert replay(order).to_dict() == expected
+    assert replay(OPS).document() == {'elements': [
+        {'id': 'a', 'x': 2, 'color': 'red'},
+        {'id': 'c', 'z': 1}
+    ]}
+
+
+def test_operations_are_idempotent():
+    assert replay(OPS + OPS).to_dict() == replay(OPS).to_dict()
+
+
+def test_tombstones_hide_older_writes_but_not_newer_ones():
+    state = replay([
+        {'op': 'delete', 'id': 'a', 'clock': 5, 'client': 'c1'},
+        {'op': 'add', 'id': 'a', 'data': {'x': 1}, 'clock': 4, 'client': 'c2'},
+    ])
+    assert state.document() == {'elements': []}
+
+    assert state.apply({'op': 'update', 'id': 'a', 'data': {'x': 9}, 'clock': 6, 'client': 'c2'})
+    assert state.document() == {'elements': [{'id': 'a', 'x': 9}]}
+
+
+def test_clear_removes_only_what_it_has_seen():
+    ops = [
+        {'op': 'add', 'id': 'a', 'data': {'x': 1}, 'clock': 1, 'client': 'c1'},
+        {'op': 'clear', 'clock': 2, 'client': 'c2'},
+        {'op': 'add', 'id': 'b', 'data': {'x': 2}, 'clock': 3, 'client': 'c1'},
+        {'op': 'add', 'id': 'c', 'data': {'x': 3}, 'clock': 1, 'client': 'c3'},
+    ]
+    shuffled = list(ops)
+    random.Random(0).shuffle(shuffled)
+
+    for state in (replay(ops), replay(shuffled)):
+        assert state.document() == {'elements': [{'id': 'b', 'x': 2}]}
+
+
+def test_clock_follows_the_newest_operation_and_stamps_after_it():
+    state = replay(OPS)
+
+    stamped = state.stamp({'op': 'add', 'id': 'd', 'data': {}}, 'c9')
+
+    assert state.clock == 4
+    assert stamped['clock'] == 5 and stamped['client'] == 'c9'
+
+
+def test_state_survives_persistence():
+    state = replay(OPS, WhiteboardState({'background': 'grid', 'elements': [{'id': 'old', 'w': 1}]}))
+
+    restored = WhiteboardState.from_json(state.to_json())
+
+    assert restored.to_dict() == state.to_dict()
+    assert restored.document()['background'] == 'grid'
+    assert [element['id'] for element in restored.document()['elements']] == ['old', 'a', 'c']
+
+
+@pytest.mark.parametrize('clock', [-1, MAX_CLOCK + 1, 10 ** 20, True, 1.5, '3'])
+def test_out_of_range_clocks_are_invalid(clock):
+    with pytest.raises(ValueError):
+        WhiteboardState.validate({'op': 'add', 'id': 'a', 'data': {}, 'clock': clock})
+
+
+def test_clocks_may_not_run_far_ahead_of_the_board():
+    state = WhiteboardState(clock=10)
+
+    state.check_clock({'op': 'add', 'clock': 10 + MAX_CLOCK_LEAD})
+    with pytest.raises(ValueError):
+        state.check_clock({'op': 'add', 'clock': 11 + MAX_CLOCK_LEAD})
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload):
+        self.sent.append(payload)
+
+
+def test_hub_rejects_a_batch_with_a_runaway_clock_as_a_whole():
+    hub = WhiteboardHub()
+    sender, watcher = FakeSocket(), FakeSocket()
+    connection = hub.connect(1, sender, 1, WhiteboardState)
+    hub.connect(1, watcher, 2, WhiteboardState)
+
+    with pytest.raises(ValueError):
+        hub.apply(1, connection, [
+            {'op': 'add', 'id': 'a', 'data': {'x': 1}},
+            {'op': 'add', 'id': 'b', 'data': {'x': 2}, 'clock': MAX_CLOCK_LEAD + 1},
+        ])
+    applied = hub.apply(1, connection, [{'op': 'add', 'id': 'a', 'data': {'x': 1}}])
+
+    assert hub.document(1) == {'elements': [{'id': 'a', 'x': 1}]}
+    assert applied[0]['clock'] == 1
+    assert json.loads(watcher.sent[-1])['ops'] == applied